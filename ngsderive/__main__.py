@@ -1,22 +1,19 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import io
 import logging
 import sys
 
-from ngsderive.commands import (
-    encoding,
-    endedness,
-    instrument,
-    junction_annotation,
-    readlen,
-    strandedness,
-)
+from ngsderive.cache import ModelRegistry, ResultCache
+from ngsderive.partials import read_regions
+from ngsderive.utils import FASTQ_EXTENSIONS, STDIN_FILENAMES, Tee
 
 logger = logging.getLogger()
 
 
-def get_args():
+def get_args(argv=None):
     class SaneFormatter(
         argparse.RawTextHelpFormatter, argparse.ArgumentDefaultsHelpFormatter
     ):
@@ -33,7 +30,8 @@ def get_args():
         "ngsfiles",
         type=str,
         nargs="+",
-        help="Next-generation sequencing files to process (BAM or FASTQ).",
+        help="Next-generation sequencing files to process (BAM or FASTQ). "
+        + "Use `-` to read a stream from standard input.",
     )
     common.add_argument(
         "-o",
@@ -52,9 +50,111 @@ def get_args():
         action="store_true",
         help="Enable INFO log level.",
     )
+    common.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Cache results per file in this directory. A file whose path, size, "
+        + "and modification time match an earlier run with the same parameters "
+        + "is not read again.",
+    )
+    common.add_argument(
+        "--cache-max-size",
+        type=int,
+        default=None,
+        help="Most space (in MB) the cache may use before the least recently "
+        + "used results are evicted.",
+    )
+    common.add_argument(
+        "--cache-content-hash",
+        default=False,
+        action="store_true",
+        help="Also key cached results on a hash of the first and last 64KiB of each file.",
+    )
+    common.add_argument(
+        "--connect",
+        type=str,
+        default=None,
+        metavar="SOCKET",
+        help="Run this job on the `ngsderive serve` process listening on SOCKET.",
+    )
+
+    convergence = argparse.ArgumentParser(add_help=False, formatter_class=SaneFormatter)
+    convergence.add_argument(
+        "--early-stop",
+        default=False,
+        action="store_true",
+        help="Stop reading a file as soon as more reads can no longer change the result. "
+        + "The number of reads consumed is reported in a `ReadsConsumed` column.",
+    )
+    convergence.add_argument(
+        "--convergence-interval",
+        type=int,
+        default=10000,
+        help="With `--early-stop`, test whether the result has converged every this many reads.",
+    )
+    convergence.add_argument(
+        "--convergence-checks",
+        type=int,
+        default=3,
+        help="With `--early-stop`, the result must be settled for this many consecutive tests.",
+    )
+
+    subsample = argparse.ArgumentParser(add_help=False, formatter_class=SaneFormatter)
+    subsample.add_argument(
+        "--subsample-fraction",
+        type=float,
+        default=None,
+        help="Only analyze reads whose template name hashes below this fraction (0 < f <= 1). "
+        + "Selection is deterministic and both mates of a pair (including R1/R2 FASTQs) "
+        + "are selected together. `--n-reads` then counts selected reads.",
+    )
+    subsample.add_argument(
+        "--subsample-seed",
+        type=int,
+        default=0,
+        help="Seed for `--subsample-fraction`. Different seeds select different reads.",
+    )
+
+    streaming = argparse.ArgumentParser(add_help=False, formatter_class=SaneFormatter)
+    streaming.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="Read and decompress up to this many chunks of reads ahead on a background "
+        + "thread, overlapping I/O with analysis. 0 disables read-ahead.",
+    )
+    streaming.add_argument(
+        "--tee",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Copy the input through to PATH (`-` for standard out) unchanged while "
+        + "it is analyzed. The whole input is copied, even if analysis stops early.",
+    )
+
+    sharding = argparse.ArgumentParser(add_help=False, formatter_class=SaneFormatter)
+    sharding.add_argument(
+        "--regions",
+        type=str,
+        default=None,
+        help="Only count reads starting in these regions of an indexed BAM. Either a "
+        + "comma-separated list (`chr1`, `chr1:1-5000000`, or `*` for unplaced "
+        + "unmapped reads) or a file of regions or BED lines.",
+    )
+    sharding.add_argument(
+        "--partial-out",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Write the counts behind the result to PATH instead of reporting it. "
+        + "Combine partials from disjoint regions with `ngsderive merge`.",
+    )
 
     readlen_parser = subparsers.add_parser(
-        "readlen", parents=[common], formatter_class=SaneFormatter
+        "readlen",
+        parents=[common, streaming, convergence, subsample, sharding],
+        formatter_class=SaneFormatter,
     )
     readlen_parser.add_argument(
         "-c",
@@ -70,9 +170,18 @@ def get_args():
         help="How many reads to analyze from the start of the file. Any n < 1 to parse whole file.",
         default=-1,
     )
+    readlen_parser.add_argument(
+        "--convergence-tolerance",
+        type=float,
+        default=5.0,
+        help="With `--early-stop`, the max read length's share of reads must be at least "
+        + "this many percentage points away from `--majority-vote-cutoff`.",
+    )
 
     instrument_parser = subparsers.add_parser(
-        "instrument", parents=[common], formatter_class=SaneFormatter
+        "instrument",
+        parents=[common, streaming, subsample],
+        formatter_class=SaneFormatter,
     )
     instrument_parser.add_argument(
         "-n",
@@ -81,12 +190,22 @@ def get_args():
         help="How many reads to analyze from the start of the file. Any n < 1 to parse whole file.",
         default=10000,
     )
+    instrument_parser.add_argument(
+        "--header-first",
+        default=False,
+        action="store_true",
+        help="Try to resolve the instrument from the `PU` and `PM` fields of the `@RG` "
+        + "header lines first. Reads are only examined if that evidence is inconclusive.",
+    )
 
     strandedness_parser = subparsers.add_parser(
         "strandedness", parents=[common], formatter_class=SaneFormatter
     )
     strandedness_parser.add_argument(
-        "-g", "--gene-model", help="Gene model as a GFF/GTF file.", required=True
+        "-g",
+        "--gene-model",
+        help="Gene model as a GFF/GTF file, or an index from `index-gene-model`.",
+        required=True,
     )
     strandedness_parser.add_argument(
         "--max-tries",
@@ -147,7 +266,9 @@ def get_args():
     strandedness_parser.set_defaults(only_protein_coding_genes=True, split_by_rg=True)
 
     encoding_parser = subparsers.add_parser(
-        "encoding", parents=[common], formatter_class=SaneFormatter
+        "encoding",
+        parents=[common, streaming, convergence, subsample, sharding],
+        formatter_class=SaneFormatter,
     )
     encoding_parser.add_argument(
         "-n",
@@ -158,10 +279,15 @@ def get_args():
     )
 
     junction_annotation_parser = subparsers.add_parser(
-        "junction-annotation", parents=[common], formatter_class=SaneFormatter
+        "junction-annotation",
+        parents=[common, sharding],
+        formatter_class=SaneFormatter,
     )
     junction_annotation_parser.add_argument(
-        "-g", "--gene-model", help="Gene model as a GFF/GTF file.", required=True
+        "-g",
+        "--gene-model",
+        help="Gene model as a GFF/GTF file, or an index from `index-gene-model`. "
+        + "Required unless writing a partial.",
     )
     junction_annotation_parser.add_argument(
         "-j",
@@ -169,6 +295,35 @@ def get_args():
         help="Directory to write annotated junction files to.",
         default="./",
     )
+    junction_annotation_parser.add_argument(
+        "-z",
+        "--compress-junction-files",
+        action="store_true",
+        help="Write junction files sorted, bgzipped, and tabix-indexed, as "
+        + "`<basename>.junctions.tsv.gz`.",
+    )
+    junction_annotation_parser.add_argument(
+        "--matrix-dir",
+        type=str,
+        default=None,
+        help="Also write a junction x sample matrix of read counts for all input "
+        + "files to DIR, as `matrix.mtx` (Matrix Market) with `junctions.tsv` and "
+        + "`samples.tsv` naming its rows and columns.",
+    )
+    junction_annotation_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="With --matrix-dir, how many files to annotate at once.",
+    )
+    junction_annotation_parser.add_argument(
+        "--raw-junctions-dir",
+        type=str,
+        default=None,
+        help="Also save each file's junction counts, before any filtering or "
+        + "annotation, to `DIR/<basename>.rawjunctions`. Pass those files in place "
+        + "of BAMs to re-annotate them without reading the BAMs again.",
+    )
     junction_annotation_parser.add_argument(
         "-d",
         "--disable-junction-files",
@@ -214,7 +369,9 @@ def get_args():
     )
 
     endedness_parser = subparsers.add_parser(
-        "endedness", parents=[common], formatter_class=SaneFormatter
+        "endedness",
+        parents=[common, streaming, convergence, sharding],
+        formatter_class=SaneFormatter,
     )
     endedness_parser.add_argument(
         "-n",
@@ -229,9 +386,16 @@ def get_args():
         type=float,
         help="Distance from 0.5 split between number of f+l- reads and f-l+ reads "
         + "allowed to be called 'Paired-End'. Default of `0.0` only appropriate "
-        + "if the whole file is being processed.",
+        + "if the whole file is being processed, and can't be used with `--early-stop`.",
         default=0.0,
     )
+    endedness_parser.add_argument(
+        "--convergence-tolerance",
+        type=float,
+        default=0.01,
+        help="With `--early-stop`, the read1 fraction must sit at least this far "
+        + "inside of `--paired-deviance` for a Paired-End call to be settled.",
+    )
     endedness_parser.add_argument(
         "-r",
         "--calc-rpt",
@@ -239,7 +403,32 @@ def get_args():
         default=False,
         help="Calculate and output Reads-Per-Template. This will produce a more "
         + "sophisticated estimate for endedness, but uses substantially more memory "
-        + "(can reach up to 60-70%% of BAM size in memory consumption).",
+        + "(can reach up to 60-70%% of BAM size in memory consumption). "
+        + "Files with `SO:queryname` or `GO:query` in the header are processed "
+        + "in a single pass with constant memory.",
+    )
+    endedness_parser.add_argument(
+        "--rpt-store",
+        choices=["trie", "hash"],
+        default="trie",
+        help="How to hold query names for `--calc-rpt` when the file is not grouped by QNAME. "
+        + "`trie` keeps every full query name. `hash` keeps a 64-bit hash of each "
+        + "query name in a compact table, using a fraction of the memory.",
+    )
+    endedness_parser.add_argument(
+        "--rpt-verify-collisions",
+        action="store_true",
+        default=False,
+        help="With `--rpt-store hash`, keep a second 64-bit hash per template "
+        + "so that hash collisions are detected instead of merging templates.",
+    )
+    endedness_parser.add_argument(
+        "--rpt-max-memory",
+        type=int,
+        default=None,
+        help="With `--rpt-store hash`, the most memory (in MB) the hash table may use. "
+        + "Past this limit, hashes are spilled to partitions in a temporary directory "
+        + "and counted one partition at a time.",
     )
     endedness_parser.add_argument(
         "--round-rpt",
@@ -260,10 +449,293 @@ def get_args():
     )
     endedness_parser.set_defaults(split_by_rg=True)
 
-    args = parser.parse_args()
+    merge_parser = subparsers.add_parser(
+        "merge",
+        description="Combine partial results written with `--partial-out`.",
+        formatter_class=SaneFormatter,
+    )
+    merge_parser.add_argument(
+        "partials", type=str, nargs="+", help="Partial result files to combine."
+    )
+    merge_parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        help="Write to filename rather than standard out.",
+        default="stdout",
+    )
+    merge_parser.add_argument(
+        "-g",
+        "--gene-model",
+        help="Gene model as a GFF/GTF file. Required for `junction-annotation` partials.",
+    )
+    merge_parser.add_argument(
+        "-j",
+        "--junction-files-dir",
+        help="Directory to write annotated junction files to.",
+        default="./",
+    )
+    merge_parser.add_argument(
+        "-d",
+        "--disable-junction-files",
+        help="Disable generating junction files.",
+        action="store_true",
+    )
+    merge_parser.add_argument(
+        "-z",
+        "--compress-junction-files",
+        action="store_true",
+        help="Write junction files sorted, bgzipped, and tabix-indexed, as "
+        + "`<basename>.junctions.tsv.gz`.",
+    )
+    merge_parser.add_argument(
+        "--debug", default=False, action="store_true", help="Enable DEBUG log level."
+    )
+    merge_parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Enable INFO log level.",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        description="Keep gene models loaded and run jobs sent with `--connect`.",
+        formatter_class=SaneFormatter,
+    )
+    serve_parser.add_argument(
+        "--socket",
+        type=str,
+        required=True,
+        help="Path of the Unix socket to listen on.",
+    )
+    serve_parser.add_argument(
+        "--debug", default=False, action="store_true", help="Enable DEBUG log level."
+    )
+    serve_parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Enable INFO log level.",
+    )
+
+    index_gene_model_parser = subparsers.add_parser(
+        "index-gene-model",
+        description="Parse a gene model once into an index that `strandedness` and "
+        + "`junction-annotation` accept in place of the GFF/GTF.",
+        formatter_class=SaneFormatter,
+    )
+    index_gene_model_parser.add_argument(
+        "gene_model", type=str, help="Gene model as a GFF/GTF file."
+    )
+    index_gene_model_parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        default=None,
+        help="Where to write the index. Defaults to the gene model's path with "
+        + "`.ngsderive.idx` appended.",
+    )
+    index_gene_model_parser.add_argument(
+        "--debug", default=False, action="store_true", help="Enable DEBUG log level."
+    )
+    index_gene_model_parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Enable INFO log level.",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch",
+        description="Run subcommands over every file in a manifest in parallel.",
+        formatter_class=SaneFormatter,
+    )
+    batch_parser.add_argument(
+        "manifest",
+        type=str,
+        help="TSV with a `File` column and an optional `Subcommands` column "
+        + "(comma-separated) choosing what to run on each file.",
+    )
+    batch_parser.add_argument(
+        "-o",
+        "--outdir",
+        type=str,
+        default="./",
+        help="Directory for one combined TSV per subcommand, `errors.tsv`, and "
+        + "junction files.",
+    )
+    batch_parser.add_argument(
+        "-g",
+        "--gene-model",
+        help="Gene model as a GFF/GTF file, for `strandedness` and `junction-annotation`.",
+    )
+    batch_parser.add_argument(
+        "-s",
+        "--subcommands",
+        type=str,
+        default=None,
+        help="Comma-separated subcommands to run on rows without a `Subcommands` value. "
+        + "Defaults to all of them (only those without a gene model if `-g` is not given).",
+    )
+    batch_parser.add_argument(
+        "--args",
+        nargs=2,
+        action="append",
+        default=[],
+        metavar=("SUBCOMMAND", "ARGS"),
+        help="Extra arguments for one subcommand, e.g. `--args readlen '-n -1'`. "
+        + "Can be repeated.",
+    )
+    batch_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Most files to process at once.",
+    )
+    batch_parser.add_argument(
+        "--max-memory",
+        type=int,
+        default=None,
+        help="Memory budget in MB. Fewer than `--jobs` files are processed at once "
+        + "if the largest worker seen so far would not fit.",
+    )
+    batch_parser.add_argument(
+        "--debug", default=False, action="store_true", help="Enable DEBUG log level."
+    )
+    batch_parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Enable INFO log level.",
+    )
+
+    worker_parser = subparsers.add_parser(
+        "worker",
+        description="Run jobs from a queue directory shared with other workers, "
+        + "keeping gene models loaded between them.",
+        formatter_class=SaneFormatter,
+    )
+    worker_parser.add_argument(
+        "--queue",
+        type=str,
+        required=True,
+        metavar="DIR",
+        help="Queue directory. Results are written to `DIR/results`, "
+        + "failures to `DIR/failed`.",
+    )
+    worker_parser.add_argument(
+        "--enqueue",
+        nargs=argparse.REMAINDER,
+        default=None,
+        metavar="ARGS",
+        help="Add the ngsderive command in the remaining arguments to the queue "
+        + "and exit, instead of running tasks.",
+    )
+    worker_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds to wait before checking an empty queue again.",
+    )
+    worker_parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        default=30.0,
+        help="Seconds between updates to the claim of a running task.",
+    )
+    worker_parser.add_argument(
+        "--stale-timeout",
+        type=float,
+        default=600.0,
+        help="Return a claimed task to the queue if its worker has not updated the "
+        + "claim for this many seconds. Must exceed `--heartbeat-interval` plus any "
+        + "clock skew between hosts.",
+    )
+    worker_parser.add_argument(
+        "--exit-when-idle",
+        default=False,
+        action="store_true",
+        help="Exit once no tasks are pending or running instead of waiting for more.",
+    )
+    worker_parser.add_argument(
+        "--debug", default=False, action="store_true", help="Enable DEBUG log level."
+    )
+    worker_parser.add_argument(
+        "-v",
+        "--verbose",
+        default=False,
+        action="store_true",
+        help="Enable INFO log level.",
+    )
+
+    args = parser.parse_args(argv)
     if not args.subcommand:
         parser.print_help()
         sys.exit(1)
+    if args.subcommand == "batch" and args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    if args.subcommand == "worker":
+        if args.enqueue is not None and not args.enqueue:
+            parser.error("--enqueue needs an ngsderive command to queue.")
+        if args.stale_timeout <= args.heartbeat_interval:
+            parser.error("--stale-timeout must be longer than --heartbeat-interval.")
+    if getattr(args, "subsample_fraction", None) is not None and not (
+        0 < args.subsample_fraction <= 1
+    ):
+        parser.error("--subsample-fraction must be in (0, 1].")
+    n_stdin = sum(f in STDIN_FILENAMES for f in getattr(args, "ngsfiles", []))
+    if n_stdin > 1:
+        parser.error("Standard input can only be read once.")
+    if n_stdin and args.connect:
+        parser.error("Standard input can't be forwarded with --connect.")
+    if getattr(args, "regions", None) or getattr(args, "partial_out", None):
+        for ngsfile in args.ngsfiles:
+            if ngsfile.endswith(FASTQ_EXTENSIONS):
+                # FASTQ has no contigs, and byte-range sharding isn't supported
+                parser.error(
+                    "--regions and --partial-out need SAM/BAM input, "
+                    + f"but {ngsfile} is FASTQ."
+                )
+    if getattr(args, "regions", None):
+        try:
+            args.regions = read_regions(args.regions)
+        except ValueError as err:
+            parser.error(str(err))
+    if getattr(args, "partial_out", None):
+        if getattr(args, "n_reads", 0) >= 1 or getattr(args, "early_stop", False):
+            parser.error(
+                "Partials must count every read in their regions. "
+                + "Use `-n -1` and don't use --early-stop."
+            )
+        if getattr(args, "calc_rpt", False):
+            parser.error("--calc-rpt can't be computed from partials.")
+        if getattr(args, "tee", None) or args.connect:
+            parser.error("--partial-out can't be combined with --tee or --connect.")
+    if args.subcommand == "junction-annotation" and not (
+        args.gene_model or args.partial_out
+    ):
+        parser.error("the following arguments are required: -g/--gene-model")
+    if args.subcommand == "endedness" and args.early_stop and args.paired_deviance <= 0:
+        # an exact 50/50 split can only be judged once the whole file is read
+        parser.error("--early-stop needs a non-zero --paired-deviance for endedness.")
+    if getattr(args, "matrix_dir", None):
+        if args.partial_out:
+            parser.error("--matrix-dir can't be combined with --partial-out.")
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1.")
+    if getattr(args, "tee", None):
+        if len(args.ngsfiles) > 1:
+            parser.error("--tee takes a single input.")
+        if args.tee == "-" and args.outfile == "stdout":
+            parser.error("--tee - needs results written elsewhere with -o.")
+        if args.cache_dir or args.connect:
+            parser.error("--tee can't be combined with --cache-dir or --connect.")
 
     return args
 
@@ -313,31 +785,129 @@ def process_args(args):
 
     setup_logging(log_level)
 
+    if args.subcommand in ("serve", "worker", "batch", "index-gene-model"):
+        return
+
     # set output file
     if args.outfile == "stdout":
         args.outfile = sys.stdout
     else:
         args.outfile = open(args.outfile, "w", encoding="utf-8")
 
+    args.result_cache = make_result_cache(args)
+
+    # set pass-through output
+    if getattr(args, "tee", None):
+        if args.tee == "-":
+            args.tee = Tee(sys.stdout.buffer)
+        else:
+            args.tee = Tee(open(args.tee, "wb"))
+
+
+def make_result_cache(args):
+    if not getattr(args, "cache_dir", None):
+        return None
+    return ResultCache(
+        args.cache_dir,
+        max_size=(args.cache_max_size * 1024 * 1024 if args.cache_max_size else None),
+        content_hash=args.cache_content_hash,
+    )
+
+
+def run_job(argv, models):
+    args = get_args(argv)
+    args.outfile = io.StringIO()
+    args.result_cache = make_result_cache(args)
+    dispatch(args, models)
+    return args.outfile.getvalue()
+
 
 def run():
     args = get_args()
     process_args(args)
 
+    if args.subcommand == "serve":
+        from ngsderive.commands import serve
+
+        serve.main(args.socket, functools.partial(run_job, models=ModelRegistry()))
+    elif args.subcommand == "index-gene-model":
+        from ngsderive.commands import index_gene_model
+
+        index_gene_model.main(args.gene_model, args.outfile)
+    elif args.subcommand == "batch":
+        from ngsderive.commands import batch
+
+        batch.main(
+            args.manifest,
+            args.outdir,
+            gene_model_file=args.gene_model,
+            subcommands=args.subcommands.split(",") if args.subcommands else None,
+            extra_args=args.args,
+            jobs=args.jobs,
+            max_memory=args.max_memory * 1024 * 1024 if args.max_memory else None,
+        )
+    elif args.subcommand == "worker":
+        from ngsderive.commands import worker
+
+        if args.enqueue is not None:
+            print(worker.enqueue(args.queue, args.enqueue))
+        else:
+            worker.main(
+                args.queue,
+                functools.partial(run_job, models=ModelRegistry()),
+                poll_interval=args.poll_interval,
+                heartbeat_interval=args.heartbeat_interval,
+                stale_timeout=args.stale_timeout,
+                exit_when_idle=args.exit_when_idle,
+            )
+    elif getattr(args, "connect", None):
+        from ngsderive.commands import serve
+
+        serve.forward(args.connect, sys.argv[1:], args.outfile)
+    else:
+        dispatch(args)
+        if getattr(args, "tee", None):
+            args.tee.close()
+
+
+def dispatch(args, models=None):
     if args.subcommand == "readlen":
+        from ngsderive.commands import readlen
+
         readlen.main(
             args.ngsfiles,
             outfile=args.outfile,
             n_reads=args.n_reads,
             majority_vote_cutoff=args.majority_vote_cutoff,
+            early_stop=args.early_stop,
+            convergence_interval=args.convergence_interval,
+            convergence_checks=args.convergence_checks,
+            convergence_tolerance=args.convergence_tolerance,
+            subsample_fraction=args.subsample_fraction,
+            subsample_seed=args.subsample_seed,
+            prefetch=args.prefetch,
+            tee=args.tee,
+            result_cache=args.result_cache,
+            regions=args.regions,
+            partial_out=args.partial_out,
         )
     if args.subcommand == "instrument":
+        from ngsderive.commands import instrument
+
         instrument.main(
             args.ngsfiles,
             outfile=args.outfile,
             n_reads=args.n_reads,
+            header_first=args.header_first,
+            subsample_fraction=args.subsample_fraction,
+            subsample_seed=args.subsample_seed,
+            prefetch=args.prefetch,
+            tee=args.tee,
+            result_cache=args.result_cache,
         )
     if args.subcommand == "strandedness":
+        from ngsderive.commands import strandedness
+
         max_iters = args.max_iterations_per_try
         if not max_iters:
             max_iters = 10 * args.n_genes
@@ -352,14 +922,38 @@ def run():
             split_by_rg=args.split_by_rg,
             max_tries=args.max_tries,
             max_iterations_per_try=max_iters,
+            result_cache=args.result_cache,
+            gff=(
+                models.get(
+                    strandedness.load_gene_model,
+                    args.gene_model,
+                    args.only_protein_coding_genes,
+                )
+                if models
+                else None
+            ),
         )
     if args.subcommand == "encoding":
+        from ngsderive.commands import encoding
+
         encoding.main(
             args.ngsfiles,
             outfile=args.outfile,
             n_reads=args.n_reads,
+            early_stop=args.early_stop,
+            convergence_interval=args.convergence_interval,
+            convergence_checks=args.convergence_checks,
+            subsample_fraction=args.subsample_fraction,
+            subsample_seed=args.subsample_seed,
+            prefetch=args.prefetch,
+            tee=args.tee,
+            result_cache=args.result_cache,
+            regions=args.regions,
+            partial_out=args.partial_out,
         )
     if args.subcommand == "junction-annotation":
+        from ngsderive.commands import junction_annotation
+
         junction_annotation.main(
             args.ngsfiles,
             args.gene_model,
@@ -371,8 +965,38 @@ def run():
             consider_unannotated_references_novel=args.consider_unannotated_references_novel,
             junction_dir=args.junction_files_dir,
             disable_junction_files=args.disable_junction_files,
+            result_cache=args.result_cache,
+            raw_junctions_dir=args.raw_junctions_dir,
+            compress_junction_files=args.compress_junction_files,
+            matrix_dir=args.matrix_dir,
+            jobs=args.jobs,
+            regions=args.regions,
+            partial_out=args.partial_out,
+            cache=(
+                models.get(junction_annotation.load_junction_cache, args.gene_model)
+                if models
+                else None
+            ),
+        )
+    if args.subcommand == "merge":
+        from ngsderive.commands import junction_annotation, merge
+
+        merge.main(
+            args.partials,
+            outfile=args.outfile,
+            gene_model_file=args.gene_model,
+            junction_dir=args.junction_files_dir,
+            disable_junction_files=args.disable_junction_files,
+            compress_junction_files=args.compress_junction_files,
+            cache=(
+                models.get(junction_annotation.load_junction_cache, args.gene_model)
+                if models and args.gene_model
+                else None
+            ),
         )
     if args.subcommand == "endedness":
+        from ngsderive.commands import endedness
+
         endedness.main(
             args.ngsfiles,
             outfile=args.outfile,
@@ -381,4 +1005,18 @@ def run():
             calc_rpt=args.calc_rpt,
             round_rpt=args.round_rpt,
             split_by_rg=args.split_by_rg,
+            rpt_store=args.rpt_store,
+            rpt_verify_collisions=args.rpt_verify_collisions,
+            rpt_max_memory=(
+                args.rpt_max_memory * 1024 * 1024 if args.rpt_max_memory else None
+            ),
+            early_stop=args.early_stop,
+            convergence_interval=args.convergence_interval,
+            convergence_checks=args.convergence_checks,
+            convergence_tolerance=args.convergence_tolerance,
+            prefetch=args.prefetch,
+            tee=args.tee,
+            result_cache=args.result_cache,
+            regions=args.regions,
+            partial_out=args.partial_out,
         )
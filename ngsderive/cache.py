@@ -0,0 +1,178 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from .utils import STDIN_FILENAMES
+
+logger = logging.getLogger("cache")
+
+# parameters that change how a result is computed, but not the result itself
+NON_RESULT_PARAMS = {"prefetch", "rpt_max_memory", "tee"}
+CONTENT_HASH_BYTES = 65536  # max size of a BGZF block
+
+
+def ngsderive_version():
+    from importlib import metadata
+
+    try:
+        return metadata.version("ngsderive")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def file_identity(path, content_hash=False):
+    stat = os.stat(path)
+    identity = {
+        "path": os.path.realpath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    if content_hash:
+        # The header and first records, plus the final records and EOF marker.
+        digest = hashlib.sha256()
+        with open(path, "rb") as handle:
+            digest.update(handle.read(CONTENT_HASH_BYTES))
+            handle.seek(max(0, stat.st_size - CONTENT_HASH_BYTES))
+            digest.update(handle.read(CONTENT_HASH_BYTES))
+        identity["content"] = digest.hexdigest()
+    return identity
+
+
+class ResultCache:
+    """On-disk cache of result rows, keyed by file identity and parameters.
+
+    Each entry is a small JSON file written to a temporary name and
+    atomically renamed into place, so concurrent writers never expose a
+    partial entry. Hits refresh the entry's mtime, and once the cache
+    grows past `max_size` bytes the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, directory, max_size=None, content_hash=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.content_hash = content_hash
+        self.version = ngsderive_version()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, ngsfilepath, subcommand, params):
+        # streams can't be identified, so are never cached
+        if ngsfilepath in STDIN_FILENAMES or not os.path.isfile(ngsfilepath):
+            return None
+        try:
+            identity = file_identity(ngsfilepath, self.content_hash)
+        except OSError:
+            return None
+        material = json.dumps(
+            {
+                "file": identity,
+                "subcommand": subcommand,
+                "params": {
+                    k: v for k, v in params.items() if k not in NON_RESULT_PARAMS
+                },
+                "version": self.version,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as handle:
+                rows = json.load(handle)["rows"]
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        logger.info(f"Using cached result {key}.")
+        return rows
+
+    def put(self, key, rows):
+        if key is None:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix=".tmp.", suffix=".json"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump({"rows": rows}, handle)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if self.max_size is not None:
+            self.evict()
+
+    def evict(self):
+        lock_path = os.path.join(self.directory, ".lock")
+        with open(lock_path, "a", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # another process is already evicting
+
+            entries = []
+            total_size = 0
+            for root, _dirs, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".json") or name.startswith(".tmp."):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, path))
+                    total_size += stat.st_size
+
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+
+
+class ModelRegistry:
+    """Gene models kept loaded between jobs by long-running processes.
+
+    Models are keyed on the loader, the file, and the loader's arguments,
+    and are reloaded if the file changes on disk.
+    """
+
+    def __init__(self):
+        self._models = {}
+
+    def get(self, loader, gene_model_file, *args):
+        try:
+            identity = file_identity(gene_model_file)
+        except OSError:
+            # let the loader report the missing file
+            return loader(gene_model_file, *args)
+
+        key = (loader.__module__, loader.__name__, identity["path"], args)
+        if key in self._models:
+            loaded_identity, model = self._models[key]
+            if loaded_identity == identity:
+                return model
+            logger.info(f"{gene_model_file} changed on disk. Reloading.")
+        model = loader(gene_model_file, *args)
+        self._models[key] = (identity, model)
+        return model
@@ -0,0 +1,251 @@
+import csv
+import logging
+import os
+import resource
+import shlex
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from .serve import run_captured
+
+logger = logging.getLogger("batch")
+
+BATCH_SUBCOMMANDS = (
+    "readlen",
+    "instrument",
+    "encoding",
+    "endedness",
+    "strandedness",
+    "junction-annotation",
+)
+GENE_MODEL_SUBCOMMANDS = ("strandedness", "junction-annotation")
+
+# gene models and the worker's run_job, loaded once per worker process
+_worker_run_job = None
+
+
+def init_worker(log_level):
+    global _worker_run_job  # pylint: disable=global-statement
+    import functools
+
+    from ngsderive.__main__ import run_job
+    from ngsderive.cache import ModelRegistry
+
+    logging.getLogger().setLevel(log_level)
+    _worker_run_job = functools.partial(run_job, models=ModelRegistry())
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_batch_task(argv, cwd):
+    response = run_captured(_worker_run_job, argv, cwd)
+    return response, peak_rss()
+
+
+class BatchTask:
+    def __init__(self, row, ngsfilepath, subcommand, argv):
+        self.row = row
+        self.ngsfilepath = ngsfilepath
+        self.subcommand = subcommand
+        self.argv = argv
+
+
+def read_manifest(manifest, default_subcommands):
+    """Rows of `(row number, file, subcommands)` from a manifest TSV.
+
+    The manifest needs a `File` column. An optional `Subcommands` column
+    holds a comma-separated list of subcommands to run on that file.
+    """
+    with open(manifest, "r", encoding="utf-8", newline="") as handle:
+        reader = csv.DictReader(
+            (line for line in handle if not line.startswith("#")), delimiter="\t"
+        )
+        if not reader.fieldnames or "File" not in reader.fieldnames:
+            raise ValueError(f"{manifest} has no `File` column.")
+        for row_number, row in enumerate(reader, start=1):
+            subcommands = (row.get("Subcommands") or "").strip()
+            if subcommands:
+                subcommands = [s.strip() for s in subcommands.split(",") if s.strip()]
+            else:
+                subcommands = default_subcommands
+            yield row_number, row["File"].strip(), subcommands
+
+
+class MemoryLimiter:
+    """Limits how many tasks run at once to fit a memory budget.
+
+    The memory a task needs is not known up front, so it is estimated as
+    the largest peak resident size any worker process has reported so far.
+    Until the first task finishes, tasks run one at a time.
+    """
+
+    def __init__(self, max_jobs, max_memory):
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.estimate = None
+
+    def update(self, worker_peak):
+        self.estimate = max(self.estimate or 0, worker_peak)
+
+    def limit(self):
+        if not self.max_memory:
+            return self.max_jobs
+        if self.estimate is None:
+            return 1
+        return max(1, min(self.max_jobs, self.max_memory // self.estimate))
+
+
+class BatchOutput:
+    """One combined TSV per subcommand, appended to as results come in."""
+
+    def __init__(self, outdir):
+        self.outdir = outdir
+        self.outfiles = {}
+        os.makedirs(outdir, exist_ok=True)
+        self.errorfile = open(
+            os.path.join(outdir, "errors.tsv"), "w", encoding="utf-8", newline=""
+        )
+        self.errors = csv.DictWriter(
+            self.errorfile,
+            fieldnames=["Row", "File", "Subcommand", "Error"],
+            delimiter="\t",
+        )
+        self.errors.writeheader()
+        self.errorfile.flush()
+        self.n_errors = 0
+
+    def write_result(self, subcommand, output):
+        header, _, rows = output.partition("\n")
+        if subcommand not in self.outfiles:
+            outfile = open(
+                os.path.join(self.outdir, f"{subcommand}.tsv"), "w", encoding="utf-8"
+            )
+            outfile.write(header + "\n")
+            self.outfiles[subcommand] = outfile
+        self.outfiles[subcommand].write(rows)
+        self.outfiles[subcommand].flush()
+
+    def write_error(self, row, ngsfilepath, subcommand, message):
+        logger.error(f"Row {row} ({subcommand} on {ngsfilepath}): {message}")
+        self.errors.writerow(
+            {
+                "Row": row,
+                "File": ngsfilepath,
+                "Subcommand": subcommand,
+                "Error": " ".join(message.split()),
+            }
+        )
+        self.errorfile.flush()
+        self.n_errors += 1
+
+    def close(self):
+        for outfile in self.outfiles.values():
+            outfile.close()
+        self.errorfile.close()
+
+
+def make_tasks(manifest, output, gene_model_file, default_subcommands, extra_args):
+    tasks = []
+    for row, ngsfilepath, subcommands in read_manifest(manifest, default_subcommands):
+        for subcommand in subcommands:
+            if subcommand not in BATCH_SUBCOMMANDS:
+                output.write_error(
+                    row, ngsfilepath, subcommand, "Not a batchable subcommand."
+                )
+                continue
+            argv = [subcommand, ngsfilepath]
+            if subcommand in GENE_MODEL_SUBCOMMANDS:
+                if not gene_model_file:
+                    output.write_error(
+                        row, ngsfilepath, subcommand, "No gene model (`-g`) given."
+                    )
+                    continue
+                argv += ["-g", gene_model_file]
+            if subcommand == "junction-annotation":
+                argv += ["-j", os.path.join(output.outdir, "junctions")]
+            argv += extra_args.get(subcommand, [])
+            tasks.append(BatchTask(row, ngsfilepath, subcommand, argv))
+    return tasks
+
+
+def main(
+    manifest,
+    outdir,
+    gene_model_file=None,
+    subcommands=None,
+    extra_args=None,
+    jobs=1,
+    max_memory=None,
+):
+    if not subcommands:
+        subcommands = [s for s in BATCH_SUBCOMMANDS if s not in GENE_MODEL_SUBCOMMANDS]
+        if gene_model_file:
+            subcommands += GENE_MODEL_SUBCOMMANDS
+    extra_args = {
+        subcommand: shlex.split(args) for subcommand, args in (extra_args or [])
+    }
+
+    output = BatchOutput(outdir)
+    try:
+        pending = deque(
+            make_tasks(manifest, output, gene_model_file, subcommands, extra_args)
+        )
+    except (OSError, ValueError) as err:
+        output.close()
+        logger.error(err)
+        raise SystemExit(1)
+    logger.info(f"Running {len(pending)} task(s) with up to {jobs} worker(s).")
+
+    limiter = MemoryLimiter(jobs, max_memory)
+    cwd = os.getcwd()
+    log_level = logging.getLogger().level
+    executor = ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(log_level,))
+    in_flight = {}
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < limiter.limit():
+                task = pending.popleft()
+                in_flight[executor.submit(run_batch_task, task.argv, cwd)] = task
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                task = in_flight.pop(future)
+                try:
+                    response, worker_peak = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    response = {
+                        "status": "error",
+                        "message": "A worker process died (e.g. it ran out of memory).",
+                    }
+                else:
+                    limiter.update(worker_peak)
+
+                if response["status"] == "ok":
+                    output.write_result(task.subcommand, response["output"])
+                else:
+                    output.write_error(
+                        task.row, task.ngsfilepath, task.subcommand, response["message"]
+                    )
+            if broken:
+                # every task still running on the old pool has failed too
+                executor.shutdown(wait=False)
+                executor = ProcessPoolExecutor(
+                    jobs, initializer=init_worker, initargs=(log_level,)
+                )
+    finally:
+        executor.shutdown()
+        output.close()
+
+    if output.n_errors:
+        logger.error(
+            f"{output.n_errors} task(s) failed. See {os.path.join(outdir, 'errors.tsv')}."
+        )
+        raise SystemExit(1)
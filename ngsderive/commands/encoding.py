@@ -2,7 +2,8 @@ import csv
 import itertools
 import logging
 
-from ..utils import NGSFile
+from ..partials import make_partial, write_partials
+from ..utils import ConvergenceMonitor, NGSFile, NGSFileType
 
 logger = logging.getLogger("encoding")
 
@@ -12,53 +13,216 @@ ILLUMINA_1_0_SET = set(i for i in range(26, 93))
 ILLUMINA_1_3_SET = set(i for i in range(31, 93))
 
 
-def main(ngsfiles, outfile, n_reads):
+def resolve_encoding(score_set):
+    if score_set <= ILLUMINA_1_3_SET:
+        return "Illumina 1.3"
+    if score_set <= ILLUMINA_1_0_SET:
+        return "Solexa/Illumina 1.0"
+    if score_set <= SANGER_SET:
+        return "Sanger/Illumina 1.8"
+    return "Unknown"
+
+
+def encoding_is_pinned(score_set, probable_encoding):
+    # Seeing more reads can only widen the observed range. Once the lowest
+    # score is below every narrower encoding, only scores past the top of
+    # the range (i.e. an "Unknown" call) could change the result.
+    lowest = min(score_set)
+    if probable_encoding == "Sanger/Illumina 1.8":
+        return lowest < min(ILLUMINA_1_0_SET)
+    if probable_encoding == "Solexa/Illumina 1.0":
+        return lowest < min(ILLUMINA_1_3_SET)
+    return False
+
+
+def encoding_result(ngsfilepath, score_set):
+    highest_ascii = str(max(score_set) + 33)
+    lowest_ascii = str(min(score_set) + 33)
+    result = {
+        "File": ngsfilepath,
+        "Evidence": f"ASCII range: {lowest_ascii}-{highest_ascii}",
+        "ProbableEncoding": resolve_encoding(score_set),
+    }
+    if result["ProbableEncoding"] == "Unknown":
+        # overwrite result["Evidence"] with more info
+        result[
+            "Evidence"
+        ] = f"ASCII values outside known PHRED encoding ranges: {lowest_ascii}-{highest_ascii}"
+    return result
+
+
+def determine_encoding(
+    ngsfilepath,
+    n_reads,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+    regions=None,
+):
+    try:
+        ngsfile = NGSFile(
+            ngsfilepath,
+            store_qualities=True,
+            subsample_fraction=subsample_fraction,
+            subsample_seed=subsample_seed,
+            prefetch=prefetch,
+            tee=tee,
+            regions=regions,
+        )
+    except FileNotFoundError:
+        result = {
+            "File": ngsfilepath,
+            "Evidence": "File not found.",
+            "ProbableEncoding": "N/A",
+        }
+        if early_stop:
+            result["ReadsConsumed"] = "N/A"
+        return [result]
+
+    monitor = None
+    if early_stop:
+        monitor = ConvergenceMonitor(convergence_interval, convergence_checks)
+
+    score_set = set()
+    reads_consumed = 0
+    for read in itertools.islice(ngsfile, n_reads):
+        score_set.update(read["quality"])
+        reads_consumed += 1
+
+        if monitor and monitor.due(reads_consumed):
+            probable_encoding = resolve_encoding(score_set)
+            if monitor.update(
+                probable_encoding,
+                encoding_is_pinned(score_set, probable_encoding),
+            ):
+                logger.info(f"Encoding converged after {reads_consumed} reads.")
+                break
+
+    result = encoding_result(ngsfilepath, score_set)
+    if early_stop:
+        result["ReadsConsumed"] = reads_consumed
+
+    return [result]
+
+
+def partial_encoding(
+    ngsfilepath,
+    regions,
+    params,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+):
+    ngsfile = NGSFile(
+        ngsfilepath,
+        store_qualities=True,
+        subsample_fraction=subsample_fraction,
+        subsample_seed=subsample_seed,
+        prefetch=prefetch,
+        regions=regions,
+    )
+    if ngsfile.filetype not in (NGSFileType.BAM, NGSFileType.SAM):
+        # FASTQ has no contigs to split on, so it can't be sharded into partials
+        raise RuntimeError(f"Invalid file: {ngsfilepath}. Partials need SAM/BAM input.")
+    score_set = set()
+    for read in ngsfile:
+        score_set.update(read["quality"])
+
+    state = {"scores": sorted(score_set)}
+    return make_partial("encoding", ngsfilepath, params, regions, ngsfile.handle, state)
+
+
+def merge_partials(outfile, grouped_partials):
     writer = csv.DictWriter(
         outfile,
         fieldnames=["File", "Evidence", "ProbableEncoding"],
         delimiter="\t",
     )
     writer.writeheader()
+    for ngsfilepath, _params, _contigs, states in grouped_partials:
+        score_set = set()
+        for state in states:
+            score_set.update(state["scores"])
+
+        writer.writerow(encoding_result(ngsfilepath, score_set))
+        outfile.flush()
+
+
+def main(
+    ngsfiles,
+    outfile,
+    n_reads,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+    result_cache=None,
+    regions=None,
+    partial_out=None,
+):
+    if partial_out:
+        write_partials(
+            partial_out,
+            [
+                partial_encoding(
+                    ngsfilepath,
+                    regions,
+                    {
+                        "subsample_fraction": subsample_fraction,
+                        "subsample_seed": subsample_seed,
+                    },
+                    subsample_fraction=subsample_fraction,
+                    subsample_seed=subsample_seed,
+                    prefetch=prefetch,
+                )
+                for ngsfilepath in ngsfiles
+            ],
+        )
+        return
+
+    fieldnames = ["File", "Evidence", "ProbableEncoding"]
+    if early_stop:
+        fieldnames.append("ReadsConsumed")
+    writer = csv.DictWriter(
+        outfile,
+        fieldnames=fieldnames,
+        delimiter="\t",
+    )
+    writer.writeheader()
     outfile.flush()
 
     if n_reads < 1:
         n_reads = None
 
+    params = {
+        "n_reads": n_reads,
+        "early_stop": early_stop,
+        "convergence_interval": convergence_interval,
+        "convergence_checks": convergence_checks,
+        "subsample_fraction": subsample_fraction,
+        "subsample_seed": subsample_seed,
+        "prefetch": prefetch,
+        "tee": tee,
+        "regions": regions,
+    }
     for ngsfilepath in ngsfiles:
-        try:
-            ngsfile = NGSFile(ngsfilepath, store_qualities=True)
-        except FileNotFoundError:
-            result = {
-                "File": ngsfilepath,
-                "Evidence": "File not found.",
-                "ProbableEncoding": "N/A",
-            }
-            writer.writerow(result)
-            outfile.flush()
-            continue
+        cache_key = None
+        rows = None
+        if result_cache:
+            cache_key = result_cache.key(ngsfilepath, "encoding", params)
+            rows = result_cache.get(cache_key)
+        if rows is None:
+            rows = determine_encoding(ngsfilepath, **params)
+            if result_cache:
+                result_cache.put(cache_key, rows)
 
-        score_set = set()
-        for read in itertools.islice(ngsfile, n_reads):
-            score_set.update(read["quality"])
-
-        highest_ascii = str(max(score_set) + 33)
-        lowest_ascii = str(min(score_set) + 33)
-        result = {
-            "File": ngsfilepath,
-            "Evidence": f"ASCII range: {lowest_ascii}-{highest_ascii}",
-        }
-        if score_set <= ILLUMINA_1_3_SET:
-            result["ProbableEncoding"] = "Illumina 1.3"
-        elif score_set <= ILLUMINA_1_0_SET:
-            result["ProbableEncoding"] = "Solexa/Illumina 1.0"
-        elif score_set <= SANGER_SET:
-            result["ProbableEncoding"] = "Sanger/Illumina 1.8"
-        else:
-            # overwrite result["Evidence"] with more info
-            result[
-                "Evidence"
-            ] = f"ASCII values outside known PHRED encoding ranges: {lowest_ascii}-{highest_ascii}"
-            result["ProbableEncoding"] = "Unknown"
-
-        writer.writerow(result)
+        for row in rows:
+            writer.writerow(row)
         outfile.flush()
@@ -1,13 +1,23 @@
 import csv
 import itertools
 import logging
+import os
+import struct
+import tempfile
+from array import array
 from collections import defaultdict
+from hashlib import blake2b
 from math import isclose
 from sys import intern
 
-import pygtrie
-
-from ..utils import NGSFile, NGSFileType, get_reads_rg, validate_read_group_info
+from ..partials import make_partial, write_partials
+from ..utils import (
+    ConvergenceMonitor,
+    NGSFile,
+    NGSFileType,
+    get_reads_rg,
+    validate_read_group_info,
+)
 
 logger = logging.getLogger("endedness")
 
@@ -75,35 +85,693 @@ def resolve_endedness(
     return result
 
 
-def find_reads_per_template(read_names):
-    tot_reads = 0
-    tot_templates = 0
-    read_group_reads = defaultdict(lambda: 0)
-    read_group_templates = defaultdict(lambda: 0)
-    for read_name, rg_list in read_names.iteritems():
+class ReadsPerTemplateCounter:
+    """Tallies reads and templates per read group, one template at a time."""
+
+    def __init__(self):
+        self.tot_reads = 0
+        self.tot_templates = 0
+        self.read_group_reads = defaultdict(lambda: 0)
+        self.read_group_templates = defaultdict(lambda: 0)
+
+    def add_template(self, read_name, rg_list):
         num_reads = len(rg_list)
-        tot_reads += num_reads
-        tot_templates += 1
+        self.tot_reads += num_reads
+        self.tot_templates += 1
         rg_set = set(rg_list)
         if len(rg_set) == 1:
             rg = rg_list[0]
-            read_group_reads[rg] += num_reads
-            read_group_templates[rg] += 1
+            self.read_group_reads[rg] += num_reads
+            self.read_group_templates[rg] += 1
         else:
             logger.warning(
                 f"QNAME {read_name} in multiple read groups: {', '.join(rg_set)}"
             )
             for rg in rg_list:
-                read_group_reads[rg] += 1
+                self.read_group_reads[rg] += 1
             for rg in rg_set:
-                read_group_templates[rg] += 1
+                self.read_group_templates[rg] += 1
+
+    def merge(self, other):
+        self.tot_reads += other.tot_reads
+        self.tot_templates += other.tot_templates
+        for rg, n in other.read_group_reads.items():
+            self.read_group_reads[rg] += n
+        for rg, n in other.read_group_templates.items():
+            self.read_group_templates[rg] += n
+
+    def reads_per_template(self):
+        read_group_rpt = {}
+        read_group_rpt["overall"] = self.tot_reads / self.tot_templates
+        for rg in self.read_group_reads:
+            read_group_rpt[rg] = (
+                self.read_group_reads[rg] / self.read_group_templates[rg]
+            )
+
+        return read_group_rpt
+
+
+class TrieTemplateStore:
+    """Holds every QNAME seen so that templates can be counted in any sort order."""
+
+    def __init__(self):
+        import pygtrie
+
+        self.read_names = pygtrie.CharTrie()
+
+    def add_read(self, read_name, rg):
+        # setdefault() inits val of key to a list if not already
+        # defined. Otherwise is a no-op.
+        self.read_names.setdefault(read_name, [])
+        self.read_names[read_name].append(rg)
+
+    def reads_per_template(self):
+        return find_reads_per_template(self.read_names)
+
+
+class GroupedTemplateStore:
+    """Counts templates in a single pass over a QNAME grouped file.
+
+    Only the template currently being read is held in memory, so this
+    is only correct when all records of a template are adjacent.
+    """
+
+    def __init__(self):
+        self.counter = ReadsPerTemplateCounter()
+        self.current_name = None
+        self.current_rgs = []
+
+    def add_read(self, read_name, rg):
+        if read_name != self.current_name:
+            self._flush()
+            self.current_name = read_name
+        self.current_rgs.append(rg)
+
+    def _flush(self):
+        if self.current_name is not None:
+            self.counter.add_template(self.current_name, self.current_rgs)
+        self.current_name = None
+        self.current_rgs = []
+
+    def reads_per_template(self):
+        self._flush()
+        return self.counter.reads_per_template()
+
+
+MAX_LOAD_FACTOR = 0.7
+COUNT_CAP = 255  # counts are stored in a single byte
+MAX_READ_GROUPS = 1 << 16  # read group indexes are stored in two bytes
+SPILL_PARTITION_BITS = 6
+INITIAL_CAPACITY = 1 << 12
+
+
+def hash_query_name(read_name):
+    digest = blake2b(read_name.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class QueryNameHashTable:
+    """Open-addressing table of templates keyed by a 64-bit QNAME hash.
+
+    Each slot holds the hash, a one-byte read count and a read group index.
+    Templates seen in more than one read group (or with more than
+    `COUNT_CAP` reads) are moved to a small overflow dict. Reads and
+    templates per read group are tallied as reads arrive, so no scan of
+    the table is needed at the end.
+
+    With `verify_collisions`, a second independent 64-bit hash is kept per
+    slot and templates are only merged when both hashes agree.
+    """
+
+    def __init__(self, rg_names, verify_collisions=False, capacity=INITIAL_CAPACITY):
+        self.rg_names = rg_names
+        self.verify_collisions = verify_collisions
+        self.counter = ReadsPerTemplateCounter()
+        self.overflow = {}
+        self.n_used = 0
+        self.n_collisions = 0
+        self._allocate(capacity)
+
+    @staticmethod
+    def slot_bytes(verify_collisions):
+        # key + count + read group index (+ verification hash)
+        return 8 + 1 + 2 + (8 if verify_collisions else 0)
+
+    def nbytes(self, capacity=None):
+        if capacity is None:
+            capacity = self.capacity
+        return capacity * self.slot_bytes(self.verify_collisions)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = array("Q", bytes(8 * capacity))
+        self.checks = (
+            array("Q", bytes(8 * capacity)) if self.verify_collisions else None
+        )
+        self.counts = bytearray(capacity)
+        self.rgs = array("H", bytes(2 * capacity))
+
+    def _find_slot(self, key, check):
+        """The slot holding `key` and `check`, or the empty slot for them.
+
+        Also returns whether the probe passed a slot with the same key but a
+        different check, i.e. a hash collision.
+        """
+        keys, counts, checks, mask = self.keys, self.counts, self.checks, self.mask
+        idx = key & mask
+        collided = False
+        while counts[idx]:
+            if keys[idx] == key:
+                if checks is None or checks[idx] == check:
+                    return idx, collided
+                collided = True
+            idx = (idx + 1) & mask
+        return idx, collided
+
+    def needs_resize(self):
+        return self.n_used + 1 > self.capacity * MAX_LOAD_FACTOR
+
+    def resize(self):
+        keys, checks, counts, rgs = self.keys, self.checks, self.counts, self.rgs
+        self._allocate(self.capacity * 2)
+        for old_idx in range(len(counts)):
+            if not counts[old_idx]:
+                continue
+            check = checks[old_idx] if checks is not None else 0
+            idx, _ = self._find_slot(keys[old_idx], check)
+            self.keys[idx] = keys[old_idx]
+            if self.checks is not None:
+                self.checks[idx] = check
+            self.counts[idx] = counts[old_idx]
+            self.rgs[idx] = rgs[old_idx]
+
+    def add(self, key, check, rg_idx):
+        if self.needs_resize():
+            self.resize()
+        if not self.verify_collisions:
+            check = 0
+
+        counter = self.counter
+        rg = self.rg_names[rg_idx]
+        idx, collided = self._find_slot(key, check)
+        if not self.counts[idx]:
+            # counted once, when the colliding template is first seen
+            self.n_collisions += collided
+            self.keys[idx] = key
+            if self.checks is not None:
+                self.checks[idx] = check
+            self.counts[idx] = 1
+            self.rgs[idx] = rg_idx
+            self.n_used += 1
+            counter.tot_reads += 1
+            counter.tot_templates += 1
+            counter.read_group_reads[rg] += 1
+            counter.read_group_templates[rg] += 1
+            return
+
+        overflow_key = (key, check)
+        if overflow_key in self.overflow:
+            self.overflow[overflow_key].append(rg_idx)
+            return
+
+        count = self.counts[idx]
+        old_rg_idx = self.rgs[idx]
+        if old_rg_idx == rg_idx and count < COUNT_CAP:
+            self.counts[idx] = count + 1
+            counter.tot_reads += 1
+            counter.read_group_reads[rg] += 1
+            return
+
+        # Move this template to the overflow dict. Its reads and template
+        # are tallied when the final counts are requested.
+        old_rg = self.rg_names[old_rg_idx]
+        counter.tot_reads -= count
+        counter.tot_templates -= 1
+        counter.read_group_reads[old_rg] -= count
+        counter.read_group_templates[old_rg] -= 1
+        self.overflow[overflow_key] = [old_rg_idx] * count + [rg_idx]
+
+    def entries(self):
+        """Yield `(key, check, rg_idx)` once per read held in the table."""
+        for idx in range(self.capacity):
+            count = self.counts[idx]
+            if not count:
+                continue
+            key = self.keys[idx]
+            check = self.checks[idx] if self.checks is not None else 0
+            rg_idxs = self.overflow.get((key, check), [self.rgs[idx]] * count)
+            for rg_idx in rg_idxs:
+                yield key, check, rg_idx
+
+    def final_counter(self):
+        counter = ReadsPerTemplateCounter()
+        counter.merge(self.counter)
+        for (key, _check), rg_idxs in self.overflow.items():
+            counter.add_template(
+                f"<hash {key:016x}>", [self.rg_names[i] for i in rg_idxs]
+            )
+        if self.n_collisions:
+            logger.info(f"Resolved {self.n_collisions} QNAME hash collisions.")
+        return counter
+
+
+class HashedTemplateStore:
+    """Counts templates by QNAME hash instead of by full QNAME.
+
+    If `max_memory` (in bytes) is set and the in-memory table would grow
+    past it, every read is instead written as a fixed-size record to one
+    of several partition files on disk, keyed on the top bits of the hash.
+    Templates never span partitions, so each partition is counted on its
+    own (re-partitioning on further bits if still too large) and the
+    results are summed.
+    """
+
+    def __init__(self, verify_collisions=False, max_memory=None):
+        self.verify_collisions = verify_collisions
+        self.max_memory = max_memory
+        self.rg_names = []
+        self.rg_ids = {}
+        self.table = QueryNameHashTable(self.rg_names, verify_collisions)
+        self.record = struct.Struct("<QQH" if verify_collisions else "<QH")
+        self.spill_dir = None
+        self.partitions = None
+
+    def _rg_index(self, rg):
+        rg_idx = self.rg_ids.get(rg)
+        if rg_idx is None:
+            rg_idx = len(self.rg_names)
+            if rg_idx >= MAX_READ_GROUPS:
+                raise RuntimeError(
+                    f"More than {MAX_READ_GROUPS} read groups, which "
+                    + "`--rpt-store hash` can't track. Use `--rpt-store trie`."
+                )
+            self.rg_ids[rg] = rg_idx
+            self.rg_names.append(rg)
+        return rg_idx
+
+    def add_read(self, read_name, rg):
+        key, check = hash_query_name(read_name)
+        rg_idx = self._rg_index(rg)
+        if self.partitions is not None:
+            self._write_record(self.partitions, 0, key, check, rg_idx)
+            return
+
+        table = self.table
+        if (
+            self.max_memory is not None
+            and table.needs_resize()
+            and table.nbytes(table.capacity * 2) > self.max_memory
+        ):
+            self._start_spilling()
+            self._write_record(self.partitions, 0, key, check, rg_idx)
+            return
+        table.add(key, check, rg_idx)
+
+    def _pack(self, key, check, rg_idx):
+        if self.verify_collisions:
+            return self.record.pack(key, check, rg_idx)
+        return self.record.pack(key, rg_idx)
+
+    def _unpack(self, buf):
+        for fields in self.record.iter_unpack(buf):
+            if self.verify_collisions:
+                yield fields
+            else:
+                yield fields[0], 0, fields[1]
+
+    def _open_partitions(self, level):
+        partitions = []
+        for i in range(1 << SPILL_PARTITION_BITS):
+            fd, path = tempfile.mkstemp(
+                prefix=f"rpt.{level}.{i}.", suffix=".bin", dir=self.spill_dir.name
+            )
+            partitions.append((path, os.fdopen(fd, "wb")))
+        return partitions
+
+    def _write_record(self, partitions, level, key, check, rg_idx):
+        shift = 64 - SPILL_PARTITION_BITS * (level + 1)
+        part = (key >> shift) & ((1 << SPILL_PARTITION_BITS) - 1)
+        partitions[part][1].write(self._pack(key, check, rg_idx))
+
+    def _start_spilling(self):
+        logger.info(
+            "QNAME hash table reached the memory limit. Spilling partitions to disk."
+        )
+        self.spill_dir = tempfile.TemporaryDirectory(prefix="ngsderive.")
+        self.partitions = self._open_partitions(0)
+        for key, check, rg_idx in self.table.entries():
+            self._write_record(self.partitions, 0, key, check, rg_idx)
+        self.table = None
+
+    def _count_partition(self, path, level, counter):
+        n_records = os.path.getsize(path) // self.record.size
+        capacity = INITIAL_CAPACITY
+        while n_records > capacity * MAX_LOAD_FACTOR:
+            capacity *= 2
+        too_big = (
+            capacity > INITIAL_CAPACITY
+            and capacity * QueryNameHashTable.slot_bytes(self.verify_collisions)
+            > self.max_memory
+        )
+        if too_big and SPILL_PARTITION_BITS * (level + 2) <= 64:
+            partitions = self._open_partitions(level + 1)
+            with open(path, "rb") as handle:
+                while True:
+                    buf = handle.read(self.record.size * 65536)
+                    if not buf:
+                        break
+                    for key, check, rg_idx in self._unpack(buf):
+                        self._write_record(partitions, level + 1, key, check, rg_idx)
+            os.remove(path)
+            for sub_path, handle in partitions:
+                handle.close()
+                self._count_partition(sub_path, level + 1, counter)
+            return
+
+        table = QueryNameHashTable(self.rg_names, self.verify_collisions, capacity)
+        with open(path, "rb") as handle:
+            while True:
+                buf = handle.read(self.record.size * 65536)
+                if not buf:
+                    break
+                for key, check, rg_idx in self._unpack(buf):
+                    table.add(key, check, rg_idx)
+        os.remove(path)
+        counter.merge(table.final_counter())
+
+    def reads_per_template(self):
+        if self.partitions is None:
+            return self.table.final_counter().reads_per_template()
+
+        counter = ReadsPerTemplateCounter()
+        for path, handle in self.partitions:
+            handle.close()
+            self._count_partition(path, 0, counter)
+        self.spill_dir.cleanup()
+        return counter.reads_per_template()
+
+
+def is_name_grouped(header):
+    hd = header.to_dict().get("HD", {})
+    return hd.get("SO") == "queryname" or hd.get("GO") == "query"
+
+
+def endedness_is_settled(ordering_flags, paired_deviance, tolerance):
+    # RPT is left out of checkpoints; it is only resolved at the end
+    if not ordering_flags:
+        return (), False
+    calls = []
+    for rg, flags in sorted(ordering_flags.items()):
+        result = resolve_endedness(
+            flags["firsts"],
+            flags["lasts"],
+            flags["neither"],
+            flags["both"],
+            paired_deviance,
+            round_rpt=False,
+        )
+        calls.append((rg, result["Endedness"]))
+        if result["Endedness"] == "Paired-End":
+            read1_frac = flags["firsts"] / (flags["firsts"] + flags["lasts"])
+            if abs(read1_frac - 0.5) + tolerance >= paired_deviance:
+                return tuple(calls), False
+        elif result["Endedness"] != "Single-End":
+            return tuple(calls), False
+    return tuple(calls), True
+
 
-    read_group_rpt = {}
-    read_group_rpt["overall"] = tot_reads / tot_templates
-    for rg in read_group_reads:
-        read_group_rpt[rg] = read_group_reads[rg] / read_group_templates[rg]
+def find_reads_per_template(read_names):
+    counter = ReadsPerTemplateCounter()
+    for read_name, rg_list in read_names.iteritems():
+        counter.add_template(read_name, rg_list)
 
-    return read_group_rpt
+    return counter.reads_per_template()
+
+
+def tally_ordering_flags(
+    reads,
+    template_store=None,
+    monitor=None,
+    paired_deviance=None,
+    convergence_tolerance=None,
+):
+    ordering_flags = defaultdict(
+        lambda: {"firsts": 0, "lasts": 0, "neither": 0, "both": 0}
+    )
+    reads_consumed = 0
+    for read in reads:
+        if monitor and reads_consumed and monitor.due(reads_consumed):
+            calls, settled = endedness_is_settled(
+                ordering_flags, paired_deviance, convergence_tolerance
+            )
+            if monitor.update(calls, settled):
+                logger.info(f"Endedness converged after {reads_consumed} reads.")
+                break
+        reads_consumed += 1
+
+        # only count primary alignments and unmapped reads
+        if (read.is_secondary or read.is_supplementary) and not read.is_unmapped:
+            continue
+
+        rg = intern(get_reads_rg(read))
+        if template_store is not None:
+            template_store.add_read(read.query_name, rg)
+
+        if read.is_read1 and not read.is_read2:
+            ordering_flags["overall"]["firsts"] += 1
+            ordering_flags[rg]["firsts"] += 1
+        elif not read.is_read1 and read.is_read2:
+            ordering_flags["overall"]["lasts"] += 1
+            ordering_flags[rg]["lasts"] += 1
+        elif not read.is_read1 and not read.is_read2:
+            ordering_flags["overall"]["neither"] += 1
+            ordering_flags[rg]["neither"] += 1
+        elif read.is_read1 and read.is_read2:
+            ordering_flags["overall"]["both"] += 1
+            ordering_flags[rg]["both"] += 1
+        else:
+            raise RuntimeError(
+                "This shouldn't be possible. Please contact the developers."
+            )
+
+    return ordering_flags, reads_consumed
+
+
+def endedness_rows(
+    ngsfilepath,
+    ordering_flags,
+    header,
+    rg_rpt,
+    paired_deviance,
+    round_rpt,
+    split_by_rg,
+):
+    rgs_in_header_not_in_seq = validate_read_group_info(
+        set(ordering_flags.keys()),
+        header,
+    )
+    for rg in rgs_in_header_not_in_seq:
+        ordering_flags[rg] = defaultdict(int)  # init rg to all zeroes
+        if rg_rpt is not None:
+            rg_rpt[rg] = 0
+
+    if not split_by_rg:
+        if rg_rpt is not None:
+            reads_per_template = rg_rpt["overall"]
+        else:
+            reads_per_template = None
+        result = resolve_endedness(
+            ordering_flags["overall"]["firsts"],
+            ordering_flags["overall"]["lasts"],
+            ordering_flags["overall"]["neither"],
+            ordering_flags["overall"]["both"],
+            paired_deviance,
+            round_rpt,
+            reads_per_template,
+        )
+
+        if result["Endedness"] == "Unknown":
+            logger.warning("Could not determine endedness!")
+
+        result["File"] = ngsfilepath
+        return [result]
+
+    rows = []
+    for rg in ordering_flags:
+        if (
+            rg == "unknown_read_group"
+            and (
+                ordering_flags[rg]["firsts"]
+                + ordering_flags[rg]["lasts"]
+                + ordering_flags[rg]["neither"]
+                + ordering_flags[rg]["both"]
+            )
+            == 0
+        ):
+            continue
+
+        if rg_rpt is not None:
+            reads_per_template = rg_rpt[rg]
+        else:
+            reads_per_template = None
+        result = resolve_endedness(
+            ordering_flags[rg]["firsts"],
+            ordering_flags[rg]["lasts"],
+            ordering_flags[rg]["neither"],
+            ordering_flags[rg]["both"],
+            paired_deviance,
+            round_rpt,
+            reads_per_template,
+        )
+
+        if result["Endedness"] == "Unknown":
+            logger.warning("Could not determine endedness!")
+
+        result["File"] = ngsfilepath
+        result["ReadGroup"] = rg
+        rows.append(result)
+
+    return rows
+
+
+def open_alignments(ngsfilepath, prefetch=0, tee=None, regions=None):
+    ngsfile = NGSFile(ngsfilepath, prefetch=prefetch, tee=tee, regions=regions)
+    if ngsfile.filetype not in (NGSFileType.BAM, NGSFileType.SAM):
+        raise RuntimeError(
+            f"Invalid file: {ngsfilepath}. `endedness` only supports SAM/BAM files!"
+        )
+    return ngsfile
+
+
+def determine_endedness(
+    ngsfilepath,
+    n_reads,
+    paired_deviance,
+    calc_rpt,
+    round_rpt,
+    split_by_rg,
+    rpt_store="trie",
+    rpt_verify_collisions=False,
+    rpt_max_memory=None,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    convergence_tolerance=0.01,
+    prefetch=0,
+    tee=None,
+    regions=None,
+):
+    try:
+        ngsfile = open_alignments(ngsfilepath, prefetch, tee, regions)
+    except FileNotFoundError:
+        result = {
+            "File": ngsfilepath,
+            "f+l-": "N/A",
+            "f-l+": "N/A",
+            "f-l-": "N/A",
+            "f+l+": "N/A",
+            "Endedness": "Error opening file.",
+        }
+        if split_by_rg:
+            result["ReadGroup"] = "N/A"
+        if calc_rpt:
+            result["ReadsPerTemplate"] = "N/A"
+        if early_stop:
+            result["ReadsConsumed"] = "N/A"
+        return [result]
+    samfile = ngsfile.handle
+
+    template_store = None
+    if calc_rpt:
+        if is_name_grouped(samfile.header):
+            logger.info(
+                "File is grouped by QNAME. Counting templates in a single pass."
+            )
+            template_store = GroupedTemplateStore()
+        elif rpt_store == "hash":
+            template_store = HashedTemplateStore(
+                verify_collisions=rpt_verify_collisions,
+                max_memory=rpt_max_memory,
+            )
+        else:
+            template_store = TrieTemplateStore()
+
+    monitor = None
+    if early_stop:
+        monitor = ConvergenceMonitor(convergence_interval, convergence_checks)
+
+    ordering_flags, reads_consumed = tally_ordering_flags(
+        itertools.islice(ngsfile.alignments(), n_reads),
+        template_store,
+        monitor,
+        paired_deviance,
+        convergence_tolerance,
+    )
+
+    rg_rpt = None
+    if template_store is not None:
+        rg_rpt = template_store.reads_per_template()
+
+    rows = endedness_rows(
+        ngsfilepath,
+        ordering_flags,
+        samfile.header,
+        rg_rpt,
+        paired_deviance,
+        round_rpt,
+        split_by_rg,
+    )
+    if early_stop:
+        for row in rows:
+            row["ReadsConsumed"] = reads_consumed
+    return rows
+
+
+def partial_endedness(ngsfilepath, regions, params, prefetch=0):
+    ngsfile = open_alignments(ngsfilepath, prefetch=prefetch, regions=regions)
+    ordering_flags, _ = tally_ordering_flags(ngsfile.alignments())
+
+    header = ngsfile.handle.header.to_dict()
+    state = {
+        "ordering_flags": ordering_flags,
+        "read_groups": [rg["ID"] for rg in header.get("RG", [])],
+    }
+    return make_partial(
+        "endedness", ngsfilepath, params, regions, ngsfile.handle, state
+    )
+
+
+def merge_partials(outfile, grouped_partials):
+    writer = None
+    for ngsfilepath, params, _contigs, states in grouped_partials:
+        ordering_flags = defaultdict(
+            lambda: {"firsts": 0, "lasts": 0, "neither": 0, "both": 0}
+        )
+        for state in states:
+            for rg, flags in state["ordering_flags"].items():
+                for flag, n in flags.items():
+                    ordering_flags[intern(rg)][flag] += n
+        header = {"RG": [{"ID": rg} for rg in states[0]["read_groups"]]}
+
+        if not writer:
+            fieldnames = ["File", "f+l-", "f-l+", "f-l-", "f+l+", "Endedness"]
+            if params["split_by_rg"]:
+                fieldnames.insert(1, "ReadGroup")
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter="\t")
+            writer.writeheader()
+
+        for row in endedness_rows(
+            ngsfilepath,
+            ordering_flags,
+            header,
+            None,
+            params["paired_deviance"],
+            params["round_rpt"],
+            params["split_by_rg"],
+        ):
+            writer.writerow(row)
+        outfile.flush()
 
 
 def main(
@@ -114,7 +782,38 @@ def main(
     calc_rpt,
     round_rpt,
     split_by_rg,
+    rpt_store="trie",
+    rpt_verify_collisions=False,
+    rpt_max_memory=None,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    convergence_tolerance=0.01,
+    prefetch=0,
+    tee=None,
+    result_cache=None,
+    regions=None,
+    partial_out=None,
 ):
+    if partial_out:
+        write_partials(
+            partial_out,
+            [
+                partial_endedness(
+                    ngsfilepath,
+                    regions,
+                    {
+                        "paired_deviance": paired_deviance,
+                        "round_rpt": round_rpt,
+                        "split_by_rg": split_by_rg,
+                    },
+                    prefetch=prefetch,
+                )
+                for ngsfilepath in ngsfiles
+            ],
+        )
+        return
+
     fieldnames = [
         "File",
         "f+l-",
@@ -127,6 +826,8 @@ def main(
         fieldnames.insert(1, "ReadGroup")
     if calc_rpt:
         fieldnames.insert(-1, "ReadsPerTemplate")
+    if early_stop:
+        fieldnames.append("ReadsConsumed")
 
     writer = csv.DictWriter(
         outfile,
@@ -139,135 +840,34 @@ def main(
     if n_reads < 1:
         n_reads = None
 
+    params = {
+        "n_reads": n_reads,
+        "paired_deviance": paired_deviance,
+        "calc_rpt": calc_rpt,
+        "round_rpt": round_rpt,
+        "split_by_rg": split_by_rg,
+        "rpt_store": rpt_store,
+        "rpt_verify_collisions": rpt_verify_collisions,
+        "rpt_max_memory": rpt_max_memory,
+        "early_stop": early_stop,
+        "convergence_interval": convergence_interval,
+        "convergence_checks": convergence_checks,
+        "convergence_tolerance": convergence_tolerance,
+        "prefetch": prefetch,
+        "tee": tee,
+        "regions": regions,
+    }
     for ngsfilepath in ngsfiles:
-        try:
-            ngsfile = NGSFile(ngsfilepath)
-        except FileNotFoundError:
-            result = {
-                "File": ngsfilepath,
-                "f+l-": "N/A",
-                "f-l+": "N/A",
-                "f-l-": "N/A",
-                "f+l+": "N/A",
-                "Endedness": "Error opening file.",
-            }
-            if split_by_rg:
-                result["ReadGroup"] = "N/A"
-            if calc_rpt:
-                result["ReadsPerTemplate"] = "N/A"
-            writer.writerow(result)
-            outfile.flush()
-            continue
-
-        if ngsfile.filetype not in (NGSFileType.BAM, NGSFileType.SAM):
-            raise RuntimeError(
-                f"Invalid file: {ngsfilepath}. `endedness` only supports SAM/BAM files!"
-            )
-        samfile = ngsfile.handle
-
-        ordering_flags = defaultdict(
-            lambda: {"firsts": 0, "lasts": 0, "neither": 0, "both": 0}
-        )
-        read_names = None
-        if calc_rpt:
-            read_names = pygtrie.CharTrie()
-
-        for read in itertools.islice(samfile, n_reads):
-            # only count primary alignments and unmapped reads
-            if (read.is_secondary or read.is_supplementary) and not read.is_unmapped:
-                continue
-
-            rg = intern(get_reads_rg(read))
-            if read_names is not None:
-                # setdefault() inits val of key to a list if not already
-                # defined. Otherwise is a no-op.
-                read_names.setdefault(read.query_name, [])
-                read_names[read.query_name].append(rg)
-
-            if read.is_read1 and not read.is_read2:
-                ordering_flags["overall"]["firsts"] += 1
-                ordering_flags[rg]["firsts"] += 1
-            elif not read.is_read1 and read.is_read2:
-                ordering_flags["overall"]["lasts"] += 1
-                ordering_flags[rg]["lasts"] += 1
-            elif not read.is_read1 and not read.is_read2:
-                ordering_flags["overall"]["neither"] += 1
-                ordering_flags[rg]["neither"] += 1
-            elif read.is_read1 and read.is_read2:
-                ordering_flags["overall"]["both"] += 1
-                ordering_flags[rg]["both"] += 1
-            else:
-                raise RuntimeError(
-                    "This shouldn't be possible. Please contact the developers."
-                )
-
-        rgs_in_header_not_in_seq = validate_read_group_info(
-            set(ordering_flags.keys()),
-            samfile.header,
-        )
-        for rg in rgs_in_header_not_in_seq:
-            ordering_flags[rg] = defaultdict(int)  # init rg to all zeroes
-
-        rg_rpt = None
-        if read_names is not None:
-            rg_rpt = find_reads_per_template(read_names)
-            for rg in rgs_in_header_not_in_seq:
-                rg_rpt[rg] = 0
-
-        if not split_by_rg:
-            if rg_rpt is not None:
-                reads_per_template = rg_rpt["overall"]
-            else:
-                reads_per_template = None
-            result = resolve_endedness(
-                ordering_flags["overall"]["firsts"],
-                ordering_flags["overall"]["lasts"],
-                ordering_flags["overall"]["neither"],
-                ordering_flags["overall"]["both"],
-                paired_deviance,
-                round_rpt,
-                reads_per_template,
-            )
-
-            if result["Endedness"] == "Unknown":
-                logger.warning("Could not determine endedness!")
-
-            result["File"] = ngsfilepath
-            writer.writerow(result)
-            outfile.flush()
-
-        else:
-            for rg in ordering_flags:
-                if (
-                    rg == "unknown_read_group"
-                    and (
-                        ordering_flags[rg]["firsts"]
-                        + ordering_flags[rg]["lasts"]
-                        + ordering_flags[rg]["neither"]
-                        + ordering_flags[rg]["both"]
-                    )
-                    == 0
-                ):
-                    continue
-
-                if rg_rpt is not None:
-                    reads_per_template = rg_rpt[rg]
-                else:
-                    reads_per_template = None
-                result = resolve_endedness(
-                    ordering_flags[rg]["firsts"],
-                    ordering_flags[rg]["lasts"],
-                    ordering_flags[rg]["neither"],
-                    ordering_flags[rg]["both"],
-                    paired_deviance,
-                    round_rpt,
-                    reads_per_template,
-                )
-
-                if result["Endedness"] == "Unknown":
-                    logger.warning("Could not determine endedness!")
-
-                result["File"] = ngsfilepath
-                result["ReadGroup"] = rg
-                writer.writerow(result)
-                outfile.flush()
+        cache_key = None
+        rows = None
+        if result_cache:
+            cache_key = result_cache.key(ngsfilepath, "endedness", params)
+            rows = result_cache.get(cache_key)
+        if rows is None:
+            rows = determine_endedness(ngsfilepath, **params)
+            if result_cache:
+                result_cache.put(cache_key, rows)
+
+        for row in rows:
+            writer.writerow(row)
+        outfile.flush()
@@ -0,0 +1,15 @@
+import logging
+
+from ..gene_index import INDEX_EXTENSION, build_index
+
+logger = logging.getLogger("index-gene-model")
+
+
+def main(gene_model_file, index_file=None):
+    if not index_file:
+        index_file = gene_model_file + INDEX_EXTENSION
+    logger.info(f"Indexing {gene_model_file}...")
+    n_genes, n_contigs = build_index(gene_model_file, index_file)
+    logger.info(
+        f"Wrote {index_file}: {n_genes} genes and exons on {n_contigs} contig(s)."
+    )
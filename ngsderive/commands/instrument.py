@@ -2,8 +2,10 @@ import csv
 import itertools
 import logging
 import re
+from collections import defaultdict
+from functools import lru_cache
 
-from ..utils import NGSFile
+from ..utils import NGSFile, NGSFileType
 
 logger = logging.getLogger("instrument")
 
@@ -77,14 +79,43 @@ flowcell_ids = {
 upgrade_sets = [(set(["HiSeq 2000", "HiSeq 2500"]), ["HiSeq 2000", "HiSeq 2500"])]
 
 
-def derive_instrument_from_iid(iid):
+def compile_patterns(patterns):
+    # Every pattern is anchored, so an ID can only match patterns that begin
+    # with the same literal character. Index the compiled patterns by that
+    # character; patterns that don't start with a literal are always tried.
+    compiled = defaultdict(list)
+    for pattern, instruments in patterns.items():
+        first = pattern[1:2] if pattern.startswith("^") else ""
+        key = first if first.isalnum() else None
+        compiled[key].append((re.compile(pattern), frozenset(instruments)))
+    return dict(compiled)
+
+
+def match_patterns(compiled, id_):
     matching_instruments = set()
+    for candidates in (compiled.get(id_[:1], ()), compiled.get(None, ())):
+        for regex, instruments in candidates:
+            if regex.search(id_):
+                matching_instruments |= instruments
+    return frozenset(matching_instruments)
+
+
+compiled_instrument_ids = compile_patterns(instrument_ids)
+compiled_flowcell_ids = compile_patterns(flowcell_ids)
 
-    for pattern, instruments in instrument_ids.items():
-        if re.search(pattern, iid):
-            matching_instruments |= set(instruments)
 
-    return matching_instruments
+@lru_cache(maxsize=4096)
+def _match_iid(iid):
+    return match_patterns(compiled_instrument_ids, iid)
+
+
+@lru_cache(maxsize=4096)
+def _match_fcid(fcid):
+    return match_patterns(compiled_flowcell_ids, fcid)
+
+
+def derive_instrument_from_iid(iid):
+    return set(_match_iid(iid))
 
 
 def predict_instrument_from_iids(iids):
@@ -102,13 +133,7 @@ def predict_instrument_from_iids(iids):
 
 
 def derive_instrument_from_fcid(fcid):
-    matching_instruments = set()
-
-    for pattern, instruments in flowcell_ids.items():
-        if re.search(pattern, fcid):
-            matching_instruments |= set(instruments)
-
-    return matching_instruments
+    return set(_match_fcid(fcid))
 
 
 def predict_instrument_from_fcids(fcids):
@@ -182,7 +207,244 @@ def resolve_instrument(
     )
 
 
-def main(ngsfiles, outfile, n_reads):
+def flowcell_from_platform_unit(platform_unit):
+    # PU is conventionally `{FLOWCELL}.{LANE}[.{SAMPLE_BARCODE}]`
+    return platform_unit.split(".", 1)[0]
+
+
+def index_read_groups(header):
+    rg_index = {}
+    for rg in header.to_dict().get("RG", []):
+        flowcell = None
+        if "PU" in rg:
+            flowcell = flowcell_from_platform_unit(rg["PU"])
+        rg_index[rg["ID"]] = (flowcell, rg.get("PM"))
+    return rg_index
+
+
+def known_instruments():
+    names = set()
+    for patterns in (instrument_ids, flowcell_ids):
+        for instruments in patterns.values():
+            names.update(instruments)
+    return names
+
+
+@lru_cache(maxsize=256)
+def derive_instrument_from_platform_model(platform_model):
+    """The known instrument an `@RG PM` value names, if any.
+
+    PM is free text (e.g. `HiSeq 2500` or `Illumina NovaSeq 6000`), so the
+    longest known instrument name it contains as whole words is used.
+    """
+    normalized = " ".join(platform_model.lower().replace("_", " ").split())
+    matches = [
+        name
+        for name in known_instruments()
+        if re.search(rf"\b{re.escape(name.lower())}\b", normalized)
+    ]
+    if not matches:
+        return None
+    return max(matches, key=len)
+
+
+def predict_instrument_from_platform_models(platform_models):
+    possible_instruments_by_pm = set()
+    detected_at_least_one_instrument = False
+
+    for platform_model in platform_models:
+        instrument = derive_instrument_from_platform_model(platform_model)
+        if instrument is None:
+            continue
+        if not detected_at_least_one_instrument:
+            possible_instruments_by_pm = {instrument}
+            detected_at_least_one_instrument = True
+        else:
+            possible_instruments_by_pm &= {instrument}
+
+    return possible_instruments_by_pm, detected_at_least_one_instrument
+
+
+def apply_platform_models(
+    instruments, confidence, based_on, possible_instruments_by_pm
+):
+    """Combine a call from IDs with the instruments `@RG PM` names."""
+    if not possible_instruments_by_pm:
+        return instruments, confidence, based_on
+    if instruments in ({"unknown"}, {"multiple instruments"}):
+        return possible_instruments_by_pm, "medium confidence", "platform model"
+    if instruments == {"conflicting evidence"}:
+        return instruments, confidence, based_on
+
+    overlapping_instruments = instruments & possible_instruments_by_pm
+    if not overlapping_instruments:
+        return (
+            set(["conflicting evidence"]),
+            "high confidence",
+            f"Case needs triaging: {' or '.join(instruments)} by {based_on}, "
+            + f"{' or '.join(possible_instruments_by_pm)} by platform model",
+        )
+    return overlapping_instruments, "high confidence", f"{based_on} and platform model"
+
+
+def call_instrument(instruments, flowcells, malformed_read_names, platform_models=()):
+    (
+        possible_instruments_by_iid,
+        detected_instrument_by_iid,
+    ) = predict_instrument_from_iids(instruments)
+    (
+        possible_instruments_by_fcid,
+        detected_instrument_by_fcid,
+    ) = predict_instrument_from_fcids(flowcells)
+    possible_instruments_by_pm, _ = predict_instrument_from_platform_models(
+        platform_models
+    )
+
+    instruments, confidence, based_on = resolve_instrument(
+        possible_instruments_by_iid,
+        possible_instruments_by_fcid,
+        detected_instrument_by_iid | detected_instrument_by_fcid,
+        malformed_read_names,
+    )
+    instruments, confidence, based_on = apply_platform_models(
+        instruments, confidence, based_on, possible_instruments_by_pm
+    )
+    for upgrade_set in upgrade_sets:
+        if instruments.issubset(upgrade_set[0]):
+            instruments = upgrade_set[1]
+            break
+
+    return instruments, confidence, based_on
+
+
+def call_instrument_from_header(rg_index):
+    flowcells = set()
+    platform_models = set()
+    for flowcell, platform_model in rg_index.values():
+        if flowcell:
+            flowcells.add(flowcell)
+        if platform_model:
+            platform_models.add(platform_model)
+    if not flowcells and not platform_models:
+        return None
+
+    instruments, confidence, based_on = call_instrument(
+        set(), flowcells, malformed_read_names=False, platform_models=platform_models
+    )
+    if confidence not in ("high confidence", "medium confidence"):
+        return None
+    if instruments in ({"conflicting evidence"}, {"multiple instruments"}):
+        return None
+    return instruments, confidence, based_on
+
+
+def determine_instrument(
+    ngsfilepath,
+    n_reads,
+    header_first=False,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+):
+    try:
+        ngsfile = NGSFile(
+            ngsfilepath,
+            subsample_fraction=subsample_fraction,
+            subsample_seed=subsample_seed,
+            prefetch=prefetch,
+            tee=tee,
+        )
+    except FileNotFoundError:
+        result = {
+            "File": ngsfilepath,
+            "Instrument": "Error opening file.",
+            "Confidence": "N/A",
+            "Basis": "N/A",
+        }
+        return [result]
+
+    rg_index = {}
+    if ngsfile.filetype in (NGSFileType.SAM, NGSFileType.BAM):
+        rg_index = index_read_groups(ngsfile.handle.header)
+
+    if header_first:
+        header_call = call_instrument_from_header(rg_index)
+        if header_call:
+            instruments, confidence, based_on = header_call
+            logger.info("Instrument resolved from the read group header.")
+            result = {
+                "File": ngsfilepath,
+                "Instrument": " or ".join(instruments),
+                "Confidence": confidence,
+                "Basis": f"{based_on} (read group header)",
+            }
+            return [result]
+
+    instruments = set()
+    flowcells = set()
+    platform_models = set()
+    malformed_read_names = False
+
+    # accumulate instrument and flowcell IDs
+    try:
+        for read in itertools.islice(ngsfile, n_reads):
+            query_name = read["query_name"]
+            if query_name.count(":") != 6:  # not Illumina format
+                malformed_read_names = True
+                # attempt to recover machine name
+                iid = query_name.split(":", 1)[0]
+                instruments.add(iid)
+                flowcell, platform_model = rg_index.get(
+                    read["read_group"], (None, None)
+                )
+                if flowcell:
+                    flowcells.add(flowcell)
+                if platform_model:
+                    platform_models.add(platform_model)
+                continue
+            # only the instrument (0) and flowcell (2) fields are needed
+            iid, _, fcid, _ = query_name.split(":", 3)
+            instruments.add(iid)
+            flowcells.add(fcid)
+    except KeyError:  # no RG tag is present
+        result = {
+            "File": ngsfilepath,
+            "Instrument": "unknown",
+            "Confidence": "no confidence",
+            "Basis": "no RG tag present",
+        }
+        return [result]
+
+    if malformed_read_names:
+        logger.warning(
+            "Encountered read names not in Illumina format. Recovery attempted."
+        )
+    instruments, confidence, based_on = call_instrument(
+        instruments, flowcells, malformed_read_names, platform_models
+    )
+
+    result = {
+        "File": ngsfilepath,
+        "Instrument": " or ".join(instruments),
+        "Confidence": confidence,
+        "Basis": based_on,
+    }
+
+    return [result]
+
+
+def main(
+    ngsfiles,
+    outfile,
+    n_reads,
+    header_first=False,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+    result_cache=None,
+):
     writer = csv.DictWriter(
         outfile,
         fieldnames=["File", "Instrument", "Confidence", "Basis"],
@@ -194,83 +456,25 @@ def main(ngsfiles, outfile, n_reads):
     if n_reads < 1:
         n_reads = None
 
+    params = {
+        "n_reads": n_reads,
+        "header_first": header_first,
+        "subsample_fraction": subsample_fraction,
+        "subsample_seed": subsample_seed,
+        "prefetch": prefetch,
+        "tee": tee,
+    }
     for ngsfilepath in ngsfiles:
-        try:
-            ngsfile = NGSFile(ngsfilepath)
-        except FileNotFoundError:
-            result = {
-                "File": ngsfilepath,
-                "Instrument": "Error opening file.",
-                "Confidence": "N/A",
-                "Basis": "N/A",
-            }
-            writer.writerow(result)
-            outfile.flush()
-            continue
-
-        instruments = set()
-        flowcells = set()
-        malformed_read_names = False
-
-        # accumulate instrument and flowcell IDs
-        try:
-            for read in itertools.islice(ngsfile, n_reads):
-                parts = read["query_name"].split(":")
-                if len(parts) != 7:  # not Illumina format
-                    malformed_read_names = True
-                    iid = parts[0]  # attempt to recover machine name
-                    instruments.add(iid)
-                    for rg in ngsfile.handle.header.to_dict()["RG"]:
-                        if rg["ID"] == read["read_group"]:
-                            if "PU" in rg:
-                                flowcells.add(rg["PU"])
-                            if "PM" in rg:
-                                instruments.add(rg["PM"])
-                    continue
-                iid, fcid = parts[0], parts[2]
-                instruments.add(iid)
-                flowcells.add(fcid)
-        except KeyError:  # no RG tag is present
-            result = {
-                "File": ngsfilepath,
-                "Instrument": "unknown",
-                "Confidence": "no confidence",
-                "Basis": "no RG tag present",
-            }
-            writer.writerow(result)
-            outfile.flush()
-            continue
-
-        if malformed_read_names:
-            logger.warning(
-                "Encountered read names not in Illumina format. Recovery attempted."
-            )
-        (
-            possible_instruments_by_iid,
-            detected_instrument_by_iid,
-        ) = predict_instrument_from_iids(instruments)
-        (
-            possible_instruments_by_fcid,
-            detected_instrument_by_fcid,
-        ) = predict_instrument_from_fcids(flowcells)
-
-        instruments, confidence, based_on = resolve_instrument(
-            possible_instruments_by_iid,
-            possible_instruments_by_fcid,
-            detected_instrument_by_iid | detected_instrument_by_fcid,
-            malformed_read_names,
-        )
-        for upgrade_set in upgrade_sets:
-            if instruments.issubset(upgrade_set[0]):
-                instruments = upgrade_set[1]
-                break
-
-        result = {
-            "File": ngsfilepath,
-            "Instrument": " or ".join(instruments),
-            "Confidence": confidence,
-            "Basis": based_on,
-        }
-
-        writer.writerow(result)
+        cache_key = None
+        rows = None
+        if result_cache:
+            cache_key = result_cache.key(ngsfilepath, "instrument", params)
+            rows = result_cache.get(cache_key)
+        if rows is None:
+            rows = determine_instrument(ngsfilepath, **params)
+            if result_cache:
+                result_cache.put(cache_key, rows)
+
+        for row in rows:
+            writer.writerow(row)
         outfile.flush()
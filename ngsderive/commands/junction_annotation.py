@@ -1,24 +1,156 @@
 import csv
+import itertools
 import logging
 import os
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
 
-from ..utils import GFF, JunctionCache, NGSFile, NGSFileType
+from ..cache import file_identity
+from ..gene_index import GeneModelIndex, is_gene_model_index
+from ..junction_counts import (
+    RAW_JUNCTIONS_EXTENSION,
+    is_raw_junction_file,
+    read_raw_junctions,
+    write_raw_junctions,
+)
+from ..junction_matrix import JunctionCollector, JunctionMatrix
+from ..partials import make_partial, write_partials
+from ..utils import (
+    GFF,
+    STDIN_FILENAMES,
+    JunctionCache,
+    NGSFile,
+    NGSFileType,
+    TabixJunctionCache,
+)
 
 logger = logging.getLogger("junction-annotation")
 
+SUMMARY_FIELDS = [
+    "File",
+    "TotalJunctions",
+    "TotalSpliceEvents",
+    "KnownJunctions",
+    "PartialNovelJunctions",
+    "CompleteNovelJunctions",
+    "KnownSplicedReads",
+    "PartialNovelSplicedReads",
+    "CompleteNovelSplicedReads",
+]
 
-def annotate_event(
-    found_pos,
-    reference_positions,
-    fuzzy_range,
-):
-    for pos in reference_positions.irange(
-        found_pos - fuzzy_range, found_pos + fuzzy_range
-    ):  # return first match even if multiple found
-        return False, pos
-    return True, None
+# the junction cache shared by cohort matrix workers
+_matrix_cache = None
+
+
+def annotate_events(positions, reference_positions, fuzzy_range):
+    """Snap positions to the first reference position within `fuzzy_range`.
+
+    `reference_positions` must be sorted and unique. Returns whether each
+    position is novel (no reference position in range) and the snapped
+    positions, which are unchanged for novel events.
+    """
+    import numpy as np
+
+    i = np.searchsorted(reference_positions, positions - fuzzy_range)
+    candidates = np.append(reference_positions, -1)[i]  # -1 when past the end
+    known = (i < len(reference_positions)) & (candidates <= positions + fuzzy_range)
+    return ~known, np.where(known, candidates, positions)
+
+
+def junction_table(found_introns):
+    """Parallel arrays of intron starts, intron ends, and read counts."""
+    import numpy as np
+
+    n_junctions = len(found_introns)
+    starts = np.fromiter(
+        (start for start, _ in found_introns), dtype=np.int64, count=n_junctions
+    )
+    ends = np.fromiter(
+        (end for _, end in found_introns), dtype=np.int64, count=n_junctions
+    )
+    counts = np.fromiter(found_introns.values(), dtype=np.int64, count=n_junctions)
+    return starts, ends, counts
+
+
+def collapse_junctions(starts, ends, counts):
+    """Sum the counts of identical junctions, sorted by start then end."""
+    import numpy as np
+
+    order = np.lexsort((ends, starts))
+    starts, ends, counts = starts[order], ends[order], counts[order]
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+    groups = np.flatnonzero(first)
+    return starts[groups], ends[groups], np.add.reduceat(counts, groups)
+
+
+class JunctionFile:
+    """Writes annotated junctions a contig at a time.
+
+    If `path` ends in `.gz`, junctions are sorted by position within each
+    contig, the file is BGZF-compressed, and a tabix index is built next
+    to it when it is closed, so junctions can be queried by region.
+    """
+
+    HEADER = ["Contig", "IntronStart", "IntronEnd", "ReadCount", "Annotation"]
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.compressed = self.path.endswith(".gz")
+        if self.compressed:
+            import pysam
+
+            self.handle = pysam.BGZFile(self.path, "wb")
+        else:
+            self.handle = open(self.path, "wb")
+        self.handle.write(("\t".join(self.HEADER) + "\n").encode("utf-8"))
+
+    def write(self, contig, starts, ends, counts, annotations):
+        if not len(starts):
+            return
+        if self.compressed:
+            import numpy as np
+
+            order = np.lexsort((ends, starts))
+            starts, ends = starts[order], ends[order]
+            counts, annotations = counts[order], annotations[order]
+        rows = zip(
+            starts.tolist(), ends.tolist(), counts.tolist(), annotations.tolist()
+        )
+        self.handle.write(
+            "".join(
+                f"{contig}\t{start}\t{end}\t{num_reads}\t{annotation}\n"
+                for start, end, num_reads, annotation in rows
+            ).encode("utf-8")
+        )
+
+    def close(self):
+        self.handle.close()
+        if self.compressed:
+            import pysam
+
+            # coordinates are 0-based, end exclusive, like a BED file
+            pysam.tabix_index(
+                self.path,
+                seq_col=0,
+                start_col=1,
+                end_col=2,
+                zerobased=True,
+                line_skip=1,
+                force=True,
+            )
+
+
+def output_basename(ngsfilepath):
+    """The name outputs for `ngsfilepath` are given, `stdin` for standard input."""
+    if ngsfilepath in STDIN_FILENAMES:
+        return "stdin"
+    return os.path.basename(ngsfilepath)
+
+
+def junctions_path(junction_dir, ngsfilepath, compress=False):
+    extension = ".junctions.tsv.gz" if compress else ".junctions.tsv"
+    return os.path.join(junction_dir, output_basename(ngsfilepath) + extension)
 
 
 def annotate_junctions(
@@ -31,41 +163,163 @@ def annotate_junctions(
     consider_unannotated_references_novel,
     junction_dir,
     disable_junction_files,
+    regions=None,
+    raw_junctions_dir=None,
+    compress_junction_files=False,
+    junction_sink=None,
 ):
+    if is_raw_junction_file(ngsfilepath):
+        # re-annotate counts saved by an earlier run, without the BAM
+        metadata, contig_junctions = read_raw_junctions(ngsfilepath)
+        if metadata["min_mapq"] != min_mapq:
+            logger.warning(
+                f"{ngsfilepath} was counted with a minimum MAPQ of "
+                + f"{metadata['min_mapq']}. Ignoring --min-mapq."
+            )
+        ngsfilepath = metadata["file"]
+    else:
+        try:
+            ngsfile = NGSFile(ngsfilepath)
+        except FileNotFoundError:
+            result = {
+                "File": ngsfilepath,
+                "TotalJunctions": "N/A",
+                "TotalSpliceEvents": "N/A",
+                "KnownJunctions": "N/A",
+                "PartialNovelJunctions": "N/A",
+                "CompleteNovelJunctions": "N/A",
+                "KnownSplicedReads": "N/A",
+                "PartialNovelSplicedReads": "N/A",
+                "CompleteNovelSplicedReads": "N/A",
+            }
+            return result
+
+        if ngsfile.filetype != NGSFileType.BAM:
+            raise RuntimeError(
+                f"Invalid file: {ngsfilepath}. `junction-annotation` only supports aligned BAM files!"
+            )
+        contig_junctions = find_contig_junctions(ngsfile.handle, min_mapq, regions)
+        if raw_junctions_dir:
+            contig_junctions = list(contig_junctions)
+            write_raw_junctions(
+                raw_junctions_path(raw_junctions_dir, ngsfilepath),
+                ngsfilepath,
+                min_mapq,
+                contig_junctions,
+            )
+
+    junction_file_path = None
+    if not disable_junction_files:
+        junction_file_path = junctions_path(
+            junction_dir, ngsfilepath, compress_junction_files
+        )
+
+    return annotate_junction_counts(
+        ngsfilepath,
+        contig_junctions,
+        cache,
+        min_intron=min_intron,
+        min_reads=min_reads,
+        fuzzy_range=fuzzy_range,
+        consider_unannotated_references_novel=consider_unannotated_references_novel,
+        junction_file_path=junction_file_path,
+        junction_sink=junction_sink,
+    )
+
+
+def raw_junctions_path(raw_junctions_dir, ngsfilepath):
+    return os.path.join(
+        raw_junctions_dir, output_basename(ngsfilepath) + RAW_JUNCTIONS_EXTENSION
+    )
+
+
+def find_contig_junctions(samfile, min_mapq, regions=None):
+    """Yield `(contig, found_introns)` for each contig, in header order."""
+    if not samfile.has_index():
+        if regions is not None:
+            raise RuntimeError("Regions can only be read from indexed BAM files!")
+        yield from stream_contig_junctions(samfile, min_mapq)
+        return
+
+    contig_regions = None
+    if regions is not None:
+        contig_regions = defaultdict(list)
+        for region in regions:
+            contig_regions[region.contig].append(region)
+
+    # contigs the index says have no mapped reads are skipped without a fetch
+    mapped_reads = None
     try:
-        ngsfile = NGSFile(ngsfilepath)
-    except FileNotFoundError:
-        result = {
-            "File": ngsfilepath,
-            "TotalJunctions": "N/A",
-            "TotalSpliceEvents": "N/A",
-            "KnownJunctions": "N/A",
-            "PartialNovelJunctions": "N/A",
-            "CompleteNovelJunctions": "N/A",
-            "KnownSplicedReads": "N/A",
-            "PartialNovelSplicedReads": "N/A",
-            "CompleteNovelSplicedReads": "N/A",
+        mapped_reads = {
+            stats.contig: stats.mapped for stats in samfile.get_index_statistics()
         }
-        return [result]
+    except (AttributeError, ValueError):
+        pass
 
-    if ngsfile.filetype != NGSFileType.BAM:
-        raise RuntimeError(
-            f"Invalid file: {ngsfilepath}. `junction-annotation` only supports aligned BAM files!"
-        )
-    samfile = ngsfile.handle
+    for contig in samfile.references:
+        if mapped_reads is not None and not mapped_reads.get(contig):
+            logger.debug(f"No mapped reads on {contig}. Skipping.")
+            continue
+        if contig_regions is None:
+            reads = samfile.fetch(contig)
+        elif contig in contig_regions:
+            reads = itertools.chain.from_iterable(
+                region.fetch(samfile) for region in contig_regions[contig]
+            )
+        else:
+            continue
 
-    junction_file = None
-    if not disable_junction_files:
-        junction_filename = os.path.join(junction_dir, ngsfile.basename)
-        junction_file = open(
-            f"{junction_filename}.junctions.tsv", "w", encoding="utf-8"
+        logger.info(f"Searching {contig} for splice junctions...")
+        found_introns = samfile.find_introns(
+            seg for seg in reads if seg.mapping_quality >= min_mapq
         )
-        print(
-            "\t".join(
-                ["Contig", "IntronStart", "IntronEnd", "ReadCount", "Annotation"]
-            ),
-            file=junction_file,
+        yield contig, found_introns
+
+
+def stream_contig_junctions(samfile, min_mapq):
+    """`find_contig_junctions` in one sequential pass, without an index.
+
+    The file must be sorted by coordinate, or at least grouped by contig.
+    Each contig's junctions are yielded as soon as its reads end, so only
+    one contig's junctions are held at a time.
+    """
+    seen = set()
+    for reference_id, reads in itertools.groupby(
+        samfile.fetch(until_eof=True), key=lambda seg: seg.reference_id
+    ):
+        if reference_id < 0:
+            break  # unmapped reads without a position sort last
+        contig = samfile.get_reference_name(reference_id)
+        if reference_id in seen:
+            raise RuntimeError(
+                f"Reads on {contig} are not contiguous. Unindexed BAM files must be "
+                + "sorted by coordinate."
+            )
+        seen.add(reference_id)
+
+        logger.info(f"Searching {contig} for splice junctions...")
+        found_introns = samfile.find_introns(
+            seg for seg in reads if seg.mapping_quality >= min_mapq
         )
+        yield contig, found_introns
+
+
+def annotate_junction_counts(
+    ngsfilepath,
+    contig_junctions,
+    cache,
+    min_intron,
+    min_reads,
+    fuzzy_range,
+    consider_unannotated_references_novel,
+    junction_file_path=None,
+    junction_sink=None,
+):
+    import numpy as np
+
+    junction_file = None
+    if junction_file_path:
+        junction_file = JunctionFile(junction_file_path)
 
     num_known = 0
     num_novel = 0
@@ -74,167 +328,77 @@ def annotate_junctions(
     num_novel_spliced_reads = 0
     num_partial_spliced_reads = 0
 
-    for contig in samfile.references:
-        num_too_few_reads = 0
-        logger.info(f"Searching {contig} for splice junctions...")
-        found_introns = samfile.find_introns(
-            [seg for seg in samfile.fetch(contig) if seg.mapping_quality >= min_mapq]
+    for contig, found_introns in contig_junctions:
+        starts, ends, counts = junction_table(found_introns)
+        long_enough = ends - starts >= min_intron
+        starts, ends, counts = (
+            starts[long_enough],
+            ends[long_enough],
+            counts[long_enough],
         )
-
-        events = [
-            (intron_start, intron_end, num_reads)
-            for (intron_start, intron_end), num_reads in found_introns.items()
-            if intron_end - intron_start >= min_intron
-        ]
-        if not events:
+        if not len(starts):
             logger.debug(
                 f"No valid splice junctions in {contig}. {len(found_introns)} potential junctions too short."
             )
             continue
         logger.debug(
-            f"Found {len(events)} potential splice junctions. {len(found_introns) - len(events)} potential junctions too short."
+            f"Found {len(starts)} potential splice junctions. {len(found_introns) - len(starts)} potential junctions too short."
         )
+        n_events = len(starts)
 
-        if contig not in cache.exon_starts:
+        boundaries = cache.contig(contig)
+        if boundaries is None:
             logger.info(
                 f"{contig} not found in GFF. All events marked `unannotated_reference`."
             )
-            annotation = "UnannotatedReference"
             if consider_unannotated_references_novel:
                 logger.info("Events being considered novel for summary report.")
 
-            for intron_start, intron_end, num_reads in events:
-                if num_reads < min_reads:
-                    num_too_few_reads += 1
-                    continue
-                if consider_unannotated_references_novel:
-                    num_novel += 1
-                    num_novel_spliced_reads += num_reads
-
-                if junction_file:
-                    print(
-                        "\t".join(
-                            [
-                                contig,
-                                str(intron_start),
-                                str(intron_end),
-                                str(num_reads),
-                                annotation,
-                            ]
-                        ),
-                        file=junction_file,
-                    )
-
-            logger.debug(
-                f"{num_too_few_reads} potential junctions didn't have enough read support."
-            )
-            logger.debug(f"{len(events) - num_too_few_reads} junctions annotated.")
-            continue
-
-        collapsed_junctions = defaultdict(int)
-
-        for intron_start, intron_end, num_reads in events:
-            start_novel, ref_start = annotate_event(
-                intron_start, cache.exon_ends[contig], fuzzy_range
-            )
-
-            end_novel, ref_end = annotate_event(
-                intron_end, cache.exon_starts[contig], fuzzy_range
+            supported = counts >= min_reads
+            starts, ends, counts = starts[supported], ends[supported], counts[supported]
+            if consider_unannotated_references_novel:
+                num_novel += len(counts)
+                num_novel_spliced_reads += int(counts.sum())
+            annotations = np.full(len(counts), "UnannotatedReference")
+        else:
+            exon_starts, exon_ends = boundaries
+            if fuzzy_range:
+                # collapse events onto nearby annotated splice sites, then
+                # annotate the collapsed junctions exactly
+                _, starts = annotate_events(starts, exon_ends, fuzzy_range)
+                _, ends = annotate_events(ends, exon_starts, fuzzy_range)
+                starts, ends, counts = collapse_junctions(starts, ends, counts)
+
+            supported = counts >= min_reads
+            starts, ends, counts = starts[supported], ends[supported], counts[supported]
+            start_novel, _ = annotate_events(starts, exon_ends, 0)
+            end_novel, _ = annotate_events(ends, exon_starts, 0)
+
+            complete_novel = start_novel & end_novel
+            partial_novel = start_novel ^ end_novel
+            known = ~(start_novel | end_novel)
+            num_novel += int(complete_novel.sum())
+            num_partial += int(partial_novel.sum())
+            num_known += int(known.sum())
+            num_novel_spliced_reads += int(counts[complete_novel].sum())
+            num_partial_spliced_reads += int(counts[partial_novel].sum())
+            num_known_spliced_reads += int(counts[known].sum())
+            annotations = np.where(
+                complete_novel,
+                "CompleteNovel",
+                np.where(partial_novel, "PartialNovel", "Annotated"),
             )
 
-            if ref_start:
-                start = ref_start
-            else:
-                start = intron_start
-            if ref_end:
-                end = ref_end
-            else:
-                end = intron_end
-
-            # if fuzzy searching, collapse these reads into nearby events
-            if fuzzy_range:
-                collapsed_junctions[(start, end)] += num_reads
-            # if not fuzzy searching, tally reads and write to outfile
-            else:
-                if num_reads < min_reads:
-                    num_too_few_reads += 1
-                    continue
-                if start_novel and end_novel:
-                    annotation = "CompleteNovel"
-                    num_novel += 1
-                    num_novel_spliced_reads += num_reads
-                elif start_novel or end_novel:
-                    annotation = "PartialNovel"
-                    num_partial += 1
-                    num_partial_spliced_reads += num_reads
-                else:
-                    annotation = "Annotated"
-                    num_known += 1
-                    num_known_spliced_reads += num_reads
-
-                if junction_file:
-                    print(
-                        "\t".join(
-                            [
-                                contig,
-                                str(start),
-                                str(end),
-                                str(num_reads),
-                                annotation,
-                            ]
-                        ),
-                        file=junction_file,
-                    )
-
-        # if not fuzzy searching, collapsed_junctions is empty and loop is skipped,
-        # reads will have been tallied and written to outfile already
-        for (intron_start, intron_end), num_reads in sorted(
-            collapsed_junctions.items()
-        ):
-            if num_reads < min_reads:
-                num_too_few_reads += 1
-                continue
-            start_novel, _ = annotate_event(intron_start, cache.exon_ends[contig], 0)
-
-            end_novel, _ = annotate_event(intron_end, cache.exon_starts[contig], 0)
-
-            if start_novel and end_novel:
-                annotation = "CompleteNovel"
-                num_novel += 1
-                num_novel_spliced_reads += num_reads
-            elif start_novel or end_novel:
-                annotation = "PartialNovel"
-                num_partial += 1
-                num_partial_spliced_reads += num_reads
-            else:
-                annotation = "Annotated"
-                num_known += 1
-                num_known_spliced_reads += num_reads
-
-            if not disable_junction_files:
-                print(
-                    "\t".join(
-                        [
-                            contig,
-                            str(intron_start),
-                            str(intron_end),
-                            str(num_reads),
-                            annotation,
-                        ]
-                    ),
-                    file=junction_file,
-                )
+        if junction_file:
+            junction_file.write(contig, starts, ends, counts, annotations)
+        if junction_sink is not None:
+            junction_sink.write(contig, starts, ends, counts, annotations)
 
         logger.debug(
-            f"{num_too_few_reads} potential junctions didn't have enough read support."
+            f"{n_events - len(counts)} potential junctions didn't have enough read support."
         )
-        if not fuzzy_range:
-            logger.debug(f"{len(events) - num_too_few_reads} junctions annotated.")
-        else:
-            logger.debug(
-                f"{len(collapsed_junctions) - num_too_few_reads} junctions annotated."
-            )
-    if not disable_junction_files:
+        logger.debug(f"{len(counts)} junctions annotated.")
+    if junction_file:
         junction_file.close()
 
     result = {
@@ -253,6 +417,160 @@ def annotate_junctions(
     return result
 
 
+def partial_junctions(ngsfilepath, regions, params, min_mapq):
+    ngsfile = NGSFile(ngsfilepath)
+    if ngsfile.filetype != NGSFileType.BAM:
+        raise RuntimeError(
+            f"Invalid file: {ngsfilepath}. `junction-annotation` only supports aligned BAM files!"
+        )
+    samfile = ngsfile.handle
+
+    # raw counts; filtering and annotation happen once all partials are merged
+    state = {
+        "junctions": {
+            contig: [
+                [intron_start, intron_end, num_reads]
+                for (intron_start, intron_end), num_reads in found_introns.items()
+            ]
+            for contig, found_introns in find_contig_junctions(
+                samfile, min_mapq, regions
+            )
+        }
+    }
+    return make_partial(
+        "junction-annotation", ngsfilepath, params, regions, samfile, state
+    )
+
+
+def merge_partials(
+    outfile,
+    grouped_partials,
+    gene_model_file,
+    junction_dir,
+    disable_junction_files,
+    cache=None,
+    compress_junction_files=False,
+):
+    junction_dir = Path(junction_dir)
+    if not disable_junction_files:
+        junction_dir.mkdir(parents=True, exist_ok=True)
+    if cache is None:
+        cache = load_junction_cache(gene_model_file)
+
+    writer = csv.DictWriter(
+        outfile,
+        fieldnames=SUMMARY_FIELDS,
+        delimiter="\t",
+    )
+    writer.writeheader()
+    for ngsfilepath, params, contigs, states in grouped_partials:
+        junctions = defaultdict(lambda: defaultdict(int))
+        for state in states:
+            for contig, events in state["junctions"].items():
+                for intron_start, intron_end, num_reads in events:
+                    junctions[contig][(intron_start, intron_end)] += num_reads
+
+        junction_file_path = None
+        if not disable_junction_files:
+            junction_file_path = junctions_path(
+                junction_dir, ngsfilepath, compress_junction_files
+            )
+
+        writer.writerow(
+            annotate_junction_counts(
+                ngsfilepath,
+                [
+                    (contig, junctions[contig])
+                    for contig in contigs
+                    if contig in junctions
+                ],
+                cache,
+                min_intron=params["min_intron"],
+                min_reads=params["min_reads"],
+                fuzzy_range=params["fuzzy_range"],
+                consider_unannotated_references_novel=params[
+                    "consider_unannotated_references_novel"
+                ],
+                junction_file_path=junction_file_path,
+            )
+        )
+        outfile.flush()
+
+
+def load_junction_cache(gene_model_file):
+    if is_gene_model_index(gene_model_file):
+        logger.info("Reading gene model index...")
+        return GeneModelIndex(gene_model_file).junction_cache()
+
+    if os.path.isfile(f"{gene_model_file}.tbi"):
+        logger.info("Reading exons from the gene model as contigs need them.")
+        return TabixJunctionCache(gene_model_file)
+
+    logger.info("Processing gene model...")
+    gff = GFF(
+        gene_model_file,
+        feature_type="exon",
+        dataframe_mode=False,
+    )
+    cache = JunctionCache(gff)
+    logger.info("Done")
+    return cache
+
+
+def init_matrix_worker(gene_model_file, log_level):
+    global _matrix_cache  # pylint: disable=global-statement
+
+    logging.getLogger().setLevel(log_level)
+    if _matrix_cache is None:  # not inherited from the parent by forking
+        _matrix_cache = load_junction_cache(gene_model_file)
+
+
+def annotate_for_matrix(ngsfilepath, annotate_kwargs):
+    collector = JunctionCollector()
+    entry = annotate_junctions(
+        ngsfilepath, _matrix_cache, junction_sink=collector, **annotate_kwargs
+    )
+    return entry, collector.junctions
+
+
+def annotate_cohort(ngsfiles, gene_model_file, cache, jobs, annotate_kwargs):
+    """Yields `(summary, junctions)` for each file, in order.
+
+    Files are annotated by `jobs` processes sharing one junction cache. At
+    most `2 * jobs` files are in flight, so finished files waiting on a
+    slow one ahead of them can't pile up in memory.
+    """
+    global _matrix_cache  # pylint: disable=global-statement
+
+    if cache is None:
+        cache = load_junction_cache(gene_model_file)
+    _matrix_cache = cache
+    try:
+        if jobs == 1:
+            for ngsfilepath in ngsfiles:
+                yield annotate_for_matrix(ngsfilepath, annotate_kwargs)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            jobs,
+            initializer=init_matrix_worker,
+            initargs=(gene_model_file, logging.getLogger().level),
+        ) as executor:
+            in_flight = deque()
+            for ngsfilepath in ngsfiles:
+                in_flight.append(
+                    executor.submit(annotate_for_matrix, ngsfilepath, annotate_kwargs)
+                )
+                if len(in_flight) >= 2 * jobs:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+    finally:
+        _matrix_cache = None
+
+
 def main(
     ngsfiles,
     gene_model_file,
@@ -264,7 +582,36 @@ def main(
     consider_unannotated_references_novel,
     junction_dir,
     disable_junction_files,
+    result_cache=None,
+    cache=None,
+    regions=None,
+    partial_out=None,
+    raw_junctions_dir=None,
+    compress_junction_files=False,
+    matrix_dir=None,
+    jobs=1,
 ):
+    if partial_out:
+        write_partials(
+            partial_out,
+            [
+                partial_junctions(
+                    ngsfilepath,
+                    regions,
+                    {
+                        "min_intron": min_intron,
+                        "min_mapq": min_mapq,
+                        "min_reads": min_reads,
+                        "fuzzy_range": fuzzy_range,
+                        "consider_unannotated_references_novel": consider_unannotated_references_novel,
+                    },
+                    min_mapq,
+                )
+                for ngsfilepath in ngsfiles
+            ],
+        )
+        return
+
     logger.info("Arguments:")
     logger.info(f"  - Gene model file: {gene_model_file}")
     logger.info(f"  - Minimum intron length: {min_intron}")
@@ -279,47 +626,96 @@ def main(
     else:
         logger.info("  - Junction file directory: <disabled>")
 
-    logger.info("Processing gene model...")
-    gff = GFF(
-        gene_model_file,
-        feature_type="exon",
-        dataframe_mode=False,
-    )
-    cache = JunctionCache(gff)
-    logger.info("Done")
-
     junction_dir = Path(junction_dir)
     if not disable_junction_files:
         junction_dir.mkdir(parents=True, exist_ok=True)
+    if raw_junctions_dir:
+        logger.info(f"  - Raw junction count directory: {raw_junctions_dir}")
+        os.makedirs(raw_junctions_dir, exist_ok=True)
+
+    params = {
+        "min_intron": min_intron,
+        "min_mapq": min_mapq,
+        "min_reads": min_reads,
+        "fuzzy_range": fuzzy_range,
+        "consider_unannotated_references_novel": consider_unannotated_references_novel,
+        "regions": regions,
+    }
+    if matrix_dir:
+        logger.info(f"  - Junction matrix directory: {matrix_dir}")
+        if result_cache:
+            logger.info("Not using cached results, which lack junction counts.")
+        writer = csv.DictWriter(outfile, fieldnames=SUMMARY_FIELDS, delimiter="\t")
+        writer.writeheader()
+        matrix = JunctionMatrix(matrix_dir)
+        try:
+            for entry, junctions in annotate_cohort(
+                ngsfiles,
+                gene_model_file,
+                cache,
+                jobs,
+                {
+                    "junction_dir": junction_dir,
+                    "disable_junction_files": disable_junction_files,
+                    "raw_junctions_dir": raw_junctions_dir,
+                    "compress_junction_files": compress_junction_files,
+                    **params,
+                },
+            ):
+                matrix.add_sample(entry["File"], junctions)
+                writer.writerow(entry)
+                outfile.flush()
+        finally:
+            matrix.close()
+        return
+
+    cache_params = None
+    if result_cache:
+        cache_params = {
+            **params,
+            "gene_model": file_identity(gene_model_file, result_cache.content_hash),
+        }
 
+    # unless preloaded, the gene model is only read once a file actually
+    # needs to be annotated
     writer = None
     for ngsfilepath in ngsfiles:
-        entry = annotate_junctions(
-            ngsfilepath,
-            cache,
-            min_intron=min_intron,
-            min_mapq=min_mapq,
-            min_reads=min_reads,
-            fuzzy_range=fuzzy_range,
-            consider_unannotated_references_novel=consider_unannotated_references_novel,
-            junction_dir=junction_dir,
-            disable_junction_files=disable_junction_files,
+        cache_key = None
+        entry = None
+        # a cached summary can only stand in for a run that would not have
+        # (re)written a junction file or raw junction counts
+        junction_file = junctions_path(
+            junction_dir, ngsfilepath, compress_junction_files
         )
+        if result_cache:
+            cache_key = result_cache.key(
+                ngsfilepath, "junction-annotation", cache_params
+            )
+            if (disable_junction_files or os.path.exists(junction_file)) and (
+                not raw_junctions_dir
+                or os.path.exists(raw_junctions_path(raw_junctions_dir, ngsfilepath))
+            ):
+                rows = result_cache.get(cache_key)
+                if rows is not None:
+                    entry = rows[0]
+        if entry is None:
+            if cache is None:
+                cache = load_junction_cache(gene_model_file)
+
+            entry = annotate_junctions(
+                ngsfilepath,
+                cache,
+                junction_dir=junction_dir,
+                disable_junction_files=disable_junction_files,
+                raw_junctions_dir=raw_junctions_dir,
+                compress_junction_files=compress_junction_files,
+                **params,
+            )
+            if result_cache:
+                result_cache.put(cache_key, [entry])
 
         if not writer:
-            fieldnames = [
-                "File",
-                "TotalJunctions",
-                "TotalSpliceEvents",
-                "KnownJunctions",
-                "PartialNovelJunctions",
-                "CompleteNovelJunctions",
-                "KnownSplicedReads",
-                "PartialNovelSplicedReads",
-                "CompleteNovelSplicedReads",
-            ]
-
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter="\t")
+            writer = csv.DictWriter(outfile, fieldnames=SUMMARY_FIELDS, delimiter="\t")
             writer.writeheader()
         writer.writerow(entry)
         outfile.flush()
@@ -0,0 +1,56 @@
+import logging
+
+from ..partials import group_partials, read_partials
+
+logger = logging.getLogger("merge")
+
+
+def main(
+    partial_files,
+    outfile,
+    gene_model_file=None,
+    junction_dir="./",
+    disable_junction_files=False,
+    cache=None,
+    compress_junction_files=False,
+):
+    try:
+        subcommand, grouped_partials = group_partials(read_partials(partial_files))
+    except ValueError as err:
+        logger.error(err)
+        raise SystemExit(1)
+    logger.info(
+        f"Merging {len(partial_files)} partial files for {len(grouped_partials)} "
+        + f"{subcommand} result(s)."
+    )
+
+    if subcommand == "readlen":
+        from . import readlen
+
+        readlen.merge_partials(outfile, grouped_partials)
+    elif subcommand == "encoding":
+        from . import encoding
+
+        encoding.merge_partials(outfile, grouped_partials)
+    elif subcommand == "endedness":
+        from . import endedness
+
+        endedness.merge_partials(outfile, grouped_partials)
+    elif subcommand == "junction-annotation":
+        from . import junction_annotation
+
+        if not gene_model_file and cache is None:
+            logger.error("Merging junction-annotation partials needs a gene model.")
+            raise SystemExit(1)
+        junction_annotation.merge_partials(
+            outfile,
+            grouped_partials,
+            gene_model_file,
+            junction_dir,
+            disable_junction_files,
+            cache=cache,
+            compress_junction_files=compress_junction_files,
+        )
+    else:
+        logger.error(f"Partials from `{subcommand}` can't be merged.")
+        raise SystemExit(1)
@@ -1,22 +1,225 @@
 import csv
 import itertools
 import logging
+from array import array
 from collections import defaultdict
 
-from ..utils import NGSFile
+from ..partials import make_partial, write_partials
+from ..utils import ConvergenceMonitor, NGSFile, NGSFileType
 
 logger = logging.getLogger("readlen")
 
 
+INITIAL_MAX_READLEN = 1024
+
+
+def count_read_lengths(histogram):
+    return {length: n for length, n in enumerate(histogram) if n}
+
+
+def resolve_readlen(read_lengths, total_reads_sampled, majority_vote_cutoff):
+    putative_max_readlen = max(read_lengths)
+
+    # note that simply picking the read length with the highest amount of evidence
+    # doesn't make sense things like adapter trimming might shorten the read length,
+    # but the read length should never grow past the maximum value.
+
+    # if not, cannot determine, return -1
+    pct = round(read_lengths[putative_max_readlen] / total_reads_sampled * 100, 2)
+    majority_readlen = putative_max_readlen if pct > majority_vote_cutoff else -1
+    return putative_max_readlen, pct, majority_readlen
+
+
+def readlen_result(
+    ngsfilepath, read_lengths, total_reads_sampled, majority_vote_cutoff
+):
+    read_length_keys_sorted = sorted(
+        [int(k) for k in read_lengths.keys()], reverse=True
+    )
+    _, pct, majority_readlen = resolve_readlen(
+        read_lengths, total_reads_sampled, majority_vote_cutoff
+    )
+    logger.info(f"Max read length percentage: {pct}")
+
+    return {
+        "File": ngsfilepath,
+        "Evidence": ";".join(
+            [f"{k}={read_lengths[k]}" for k in read_length_keys_sorted]
+        ),
+        "MajorityPctDetected": str(pct) + "%",
+        "ConsensusReadLength": majority_readlen,
+    }
+
+
+def determine_readlen(
+    ngsfilepath,
+    n_reads,
+    majority_vote_cutoff,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    convergence_tolerance=5.0,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+    regions=None,
+):
+    try:
+        ngsfile = NGSFile(
+            ngsfilepath,
+            subsample_fraction=subsample_fraction,
+            subsample_seed=subsample_seed,
+            prefetch=prefetch,
+            tee=tee,
+            regions=regions,
+        )
+    except FileNotFoundError:
+        result = {
+            "File": ngsfilepath,
+            "Evidence": "Error opening file.",
+            "MajorityPctDetected": "N/A",
+            "ConsensusReadLength": "N/A",
+        }
+        if early_stop:
+            result["ReadsConsumed"] = "N/A"
+
+        return [result]
+
+    monitor = None
+    if early_stop:
+        monitor = ConvergenceMonitor(convergence_interval, convergence_checks)
+
+    # accumulate read lengths into a histogram indexed by length
+    histogram = array("Q", bytes(8 * INITIAL_MAX_READLEN))
+    total_reads_sampled = 0
+    for length in itertools.islice(ngsfile.read_lengths(), n_reads):
+        total_reads_sampled += 1
+        if length >= len(histogram):
+            histogram.extend(array("Q", bytes(8 * (length + 1 - len(histogram)))))
+        histogram[length] += 1
+
+        if monitor and monitor.due(total_reads_sampled):
+            _, pct, majority_readlen = resolve_readlen(
+                count_read_lengths(histogram),
+                total_reads_sampled,
+                majority_vote_cutoff,
+            )
+            settled = abs(pct - majority_vote_cutoff) > convergence_tolerance
+            if monitor.update(majority_readlen, settled):
+                logger.info(f"Read length converged after {total_reads_sampled} reads.")
+                break
+
+    result = readlen_result(
+        ngsfilepath,
+        count_read_lengths(histogram),
+        total_reads_sampled,
+        majority_vote_cutoff,
+    )
+    if early_stop:
+        result["ReadsConsumed"] = total_reads_sampled
+
+    return [result]
+
+
+def partial_readlen(
+    ngsfilepath,
+    regions,
+    params,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+):
+    ngsfile = NGSFile(
+        ngsfilepath,
+        subsample_fraction=subsample_fraction,
+        subsample_seed=subsample_seed,
+        prefetch=prefetch,
+        regions=regions,
+    )
+    if ngsfile.filetype not in (NGSFileType.BAM, NGSFileType.SAM):
+        # FASTQ has no contigs to split on, so it can't be sharded into partials
+        raise RuntimeError(f"Invalid file: {ngsfilepath}. Partials need SAM/BAM input.")
+    read_lengths = defaultdict(int)
+    for length in ngsfile.read_lengths():
+        read_lengths[length] += 1
+
+    state = {
+        "read_lengths": read_lengths,
+        "total_reads_sampled": sum(read_lengths.values()),
+    }
+    return make_partial("readlen", ngsfilepath, params, regions, ngsfile.handle, state)
+
+
+def merge_partials(outfile, grouped_partials):
+    writer = csv.DictWriter(
+        outfile,
+        fieldnames=["File", "Evidence", "MajorityPctDetected", "ConsensusReadLength"],
+        delimiter="\t",
+    )
+    writer.writeheader()
+    for ngsfilepath, params, _contigs, states in grouped_partials:
+        read_lengths = defaultdict(int)
+        for state in states:
+            for length, n in state["read_lengths"].items():
+                read_lengths[int(length)] += n
+        total_reads_sampled = sum(state["total_reads_sampled"] for state in states)
+
+        writer.writerow(
+            readlen_result(
+                ngsfilepath,
+                dict(read_lengths),
+                total_reads_sampled,
+                params["majority_vote_cutoff"],
+            )
+        )
+        outfile.flush()
+
+
 def main(
     ngsfiles,
     outfile,
     n_reads,
     majority_vote_cutoff,
+    early_stop=False,
+    convergence_interval=10000,
+    convergence_checks=3,
+    convergence_tolerance=5.0,
+    subsample_fraction=None,
+    subsample_seed=0,
+    prefetch=0,
+    tee=None,
+    result_cache=None,
+    regions=None,
+    partial_out=None,
 ):
+    if partial_out:
+        write_partials(
+            partial_out,
+            [
+                partial_readlen(
+                    ngsfilepath,
+                    regions,
+                    {
+                        "majority_vote_cutoff": majority_vote_cutoff,
+                        "subsample_fraction": subsample_fraction,
+                        "subsample_seed": subsample_seed,
+                    },
+                    subsample_fraction=subsample_fraction,
+                    subsample_seed=subsample_seed,
+                    prefetch=prefetch,
+                )
+                for ngsfilepath in ngsfiles
+            ],
+        )
+        return
+
+    fieldnames = ["File", "Evidence", "MajorityPctDetected", "ConsensusReadLength"]
+    if early_stop:
+        fieldnames.append("ReadsConsumed")
     writer = csv.DictWriter(
         outfile,
-        fieldnames=["File", "Evidence", "MajorityPctDetected", "ConsensusReadLength"],
+        fieldnames=fieldnames,
         delimiter="\t",
     )
     writer.writeheader()
@@ -25,50 +228,30 @@ def main(
     if n_reads < 1:
         n_reads = None
 
+    params = {
+        "n_reads": n_reads,
+        "majority_vote_cutoff": majority_vote_cutoff,
+        "early_stop": early_stop,
+        "convergence_interval": convergence_interval,
+        "convergence_checks": convergence_checks,
+        "convergence_tolerance": convergence_tolerance,
+        "subsample_fraction": subsample_fraction,
+        "subsample_seed": subsample_seed,
+        "prefetch": prefetch,
+        "tee": tee,
+        "regions": regions,
+    }
     for ngsfilepath in ngsfiles:
-        read_lengths = defaultdict(int)
-        try:
-            ngsfile = NGSFile(ngsfilepath)
-        except FileNotFoundError:
-            result = {
-                "File": ngsfilepath,
-                "Evidence": "Error opening file.",
-                "MajorityPctDetected": "N/A",
-                "ConsensusReadLength": "N/A",
-            }
-
-            writer.writerow(result)
-            outfile.flush()
-            continue
-
-        # accumulate read lengths
-        total_reads_sampled = 0
-        for read in itertools.islice(ngsfile, n_reads):
-            total_reads_sampled += 1
-            read_lengths[len(read["query"])] += 1
-
-        read_length_keys_sorted = sorted(
-            [int(k) for k in read_lengths.keys()], reverse=True
-        )
-        putative_max_readlen = read_length_keys_sorted[0]
-
-        # note that simply picking the read length with the highest amount of evidence
-        # doesn't make sense things like adapter trimming might shorten the read length,
-        # but the read length should never grow past the maximum value.
-
-        # if not, cannot determine, return -1
-        pct = round(read_lengths[putative_max_readlen] / total_reads_sampled * 100, 2)
-        logger.info(f"Max read length percentage: {pct}")
-        majority_readlen = putative_max_readlen if pct > majority_vote_cutoff else -1
-
-        result = {
-            "File": ngsfilepath,
-            "Evidence": ";".join(
-                [f"{k}={read_lengths[k]}" for k in read_length_keys_sorted]
-            ),
-            "MajorityPctDetected": str(pct) + "%",
-            "ConsensusReadLength": majority_readlen,
-        }
+        cache_key = None
+        rows = None
+        if result_cache:
+            cache_key = result_cache.key(ngsfilepath, "readlen", params)
+            rows = result_cache.get(cache_key)
+        if rows is None:
+            rows = determine_readlen(ngsfilepath, **params)
+            if result_cache:
+                result_cache.put(cache_key, rows)
 
-        writer.writerow(result)
+        for row in rows:
+            writer.writerow(row)
         outfile.flush()
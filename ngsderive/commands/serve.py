@@ -0,0 +1,131 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+logger = logging.getLogger("serve")
+
+
+def send_message(wfile, message):
+    wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def receive_message(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def forward(socket_path, argv, outfile):
+    """Run a job on the server listening at `socket_path` and write its output."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError as err:
+            logger.error(
+                f"Could not connect to ngsderive server at {socket_path}: {err}"
+            )
+            raise SystemExit(1)
+        with client.makefile("rb") as rfile, client.makefile("wb") as wfile:
+            send_message(wfile, {"argv": argv, "cwd": os.getcwd()})
+            response = receive_message(rfile)
+
+    if response is None:
+        logger.error("ngsderive server closed the connection without a response.")
+        raise SystemExit(1)
+    if response["status"] != "ok":
+        logger.error(response["message"])
+        raise SystemExit(1)
+    outfile.write(response["output"])
+    outfile.flush()
+
+
+class ErrorCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def run_captured(run_job, argv, cwd):
+    """Run a job in `cwd`, turning its output or failure into a response."""
+    stderr = io.StringIO()
+    errors = ErrorCollector()
+    logging.getLogger().addHandler(errors)
+    previous_cwd = os.getcwd()
+    try:
+        # jobs run one at a time, so relative paths can be resolved
+        # against the submitter's working directory
+        os.chdir(cwd)
+        with contextlib.redirect_stderr(stderr):
+            output = run_job(argv)
+        return {"status": "ok", "output": output}
+    except SystemExit as err:
+        message = (
+            "\n".join(errors.messages)
+            or stderr.getvalue().strip()
+            or f"Job exited with status {err.code}."
+        )
+        return {"status": "error", "message": message}
+    except Exception as err:  # pylint: disable=broad-except
+        logger.exception("Job failed.")
+        return {"status": "error", "message": f"{type(err).__name__}: {err}"}
+    finally:
+        logging.getLogger().removeHandler(errors)
+        os.chdir(previous_cwd)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = receive_message(self.rfile)
+        except ValueError:
+            send_message(self.wfile, {"status": "error", "message": "Malformed job."})
+            return
+        if request is None:
+            return
+
+        logger.info(f"Running job: {' '.join(request['argv'])}")
+        response = run_captured(self.server.run_job, request["argv"], request["cwd"])
+        send_message(self.wfile, response)
+
+
+class JobServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path, run_job):
+        self.run_job = run_job
+        super().__init__(socket_path, JobHandler)
+
+
+def main(socket_path, run_job):
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except OSError:
+                os.unlink(socket_path)  # stale socket from a previous server
+            else:
+                logger.error(
+                    f"An ngsderive server is already listening on {socket_path}."
+                )
+                raise SystemExit(1)
+
+    # Jobs are handled serially. The loaded gene models hold open tabix
+    # handles that are not safe to share between threads.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with JobServer(socket_path, run_job) as server:
+        logger.info(f"Listening on {socket_path}.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
@@ -3,6 +3,8 @@ import logging
 import sys
 from collections import defaultdict
 
+from ..cache import file_identity
+from ..gene_index import GeneModelIndex, is_gene_model_index
 from ..utils import GFF, NGSFile, NGSFileType, get_reads_rg, validate_read_group_info
 
 logger = logging.getLogger("strandedness")
@@ -24,6 +26,8 @@ def get_filtered_reads_from_region(samfile, gene, min_quality, apply_filters=Tru
 def disqualify_gene(gene, gff, samfile):
     if gene["seqname"] not in samfile.references:
         return True
+    if "antisense_overlap" in gene:  # precomputed by `index-gene-model`
+        return gene["antisense_overlap"]
 
     # if there are overlapping features on the positive and negative strand
     # ignore this gene.
@@ -94,7 +98,7 @@ def determine_strandedness(
         if split_by_rg:
             result["ReadGroup"] = "N/A"
 
-        return [result]
+        return ([result], checked_genes, overall_evidence)
 
     if ngsfile.filetype != NGSFileType.BAM:
         raise RuntimeError(
@@ -278,6 +282,67 @@ def determine_strandedness(
     )
 
 
+def load_gene_model(gene_model_file, only_protein_coding_genes):
+    if is_gene_model_index(gene_model_file):
+        logger.info("Reading gene model index...")
+        genes = GeneModelIndex(gene_model_file).genes(only_protein_coding_genes)
+        logger.info(f"  - {len(genes)} genes loaded.")
+        return genes
+
+    logger.info("Reading gene model...")
+    gff = GFF(
+        gene_model_file,
+        feature_type="gene",
+        store_results=True,
+        need_tabix=True,
+        only_protein_coding_genes=only_protein_coding_genes,
+    )
+    logger.info(f"  - {len(gff.entries)} features processed.")
+    return gff
+
+
+def strandedness_with_retries(
+    ngsfilepath,
+    gff,
+    n_genes,
+    min_mapq,
+    minimum_reads_per_gene,
+    split_by_rg,
+    max_tries,
+    max_iterations_per_try,
+):
+    tries_for_file = 0
+    checked_genes = set()
+    overall_evidence = defaultdict(lambda: defaultdict(int))
+
+    while True:
+        tries_for_file += 1
+        logger.info(f"Processing {ngsfilepath}, try #{tries_for_file}...")
+
+        entries, checked_genes, overall_evidence = determine_strandedness(
+            ngsfilepath,
+            gff,
+            n_genes=n_genes,
+            min_mapq=min_mapq,
+            minimum_reads_per_gene=minimum_reads_per_gene,
+            split_by_rg=split_by_rg,
+            max_iterations_per_try=max_iterations_per_try,
+            checked_genes=checked_genes,
+            overall_evidence=overall_evidence,
+        )
+
+        entries_contains_inconclusive = False
+        for entry in entries:
+            if entry["Predicted"] == "Inconclusive":
+                entries_contains_inconclusive = True
+                break
+
+        if entries_contains_inconclusive and tries_for_file < max_tries:
+            continue
+
+        return entries
+
+
 def main(
     ngsfiles,
     gene_model_file,
@@ -289,6 +354,8 @@ def main(
     split_by_rg,
     max_tries,
     max_iterations_per_try,
+    result_cache=None,
+    gff=None,
 ):
     logger.info("Arguments:")
     logger.info(f"  - Gene model file: {gene_model_file}")
@@ -304,59 +371,48 @@ def main(
         )
         sys.exit(1)
 
-    logger.info("Reading gene model...")
-    gff = GFF(
-        gene_model_file,
-        feature_type="gene",
-        store_results=True,
-        need_tabix=True,
-        only_protein_coding_genes=only_protein_coding_genes,
-    )
-
-    logger.info(f"  - {len(gff.entries)} features processed.")
-
     fieldnames = ["TotalReads", "ForwardPct", "ReversePct", "Predicted"]
     if split_by_rg:
         fieldnames = ["ReadGroup"] + fieldnames
     fieldnames = ["File"] + fieldnames
 
+    params = {
+        "n_genes": n_genes,
+        "min_mapq": min_mapq,
+        "minimum_reads_per_gene": minimum_reads_per_gene,
+        "split_by_rg": split_by_rg,
+        "max_tries": max_tries,
+        "max_iterations_per_try": max_iterations_per_try,
+    }
+    cache_params = None
+    if result_cache:
+        cache_params = {
+            **params,
+            "only_protein_coding_genes": only_protein_coding_genes,
+            "gene_model": file_identity(gene_model_file, result_cache.content_hash),
+        }
+
+    # unless preloaded, the gene model is only read once a file actually
+    # needs to be sampled
     writer = None
 
     for ngsfilepath in ngsfiles:
-        tries_for_file = 0
-        checked_genes = set()
-        overall_evidence = defaultdict(lambda: defaultdict(int))
-
-        while True:
-            tries_for_file += 1
-            logger.info(f"Processing {ngsfilepath}, try #{tries_for_file}...")
-
-            entries, checked_genes, overall_evidence = determine_strandedness(
-                ngsfilepath,
-                gff,
-                n_genes=n_genes,
-                min_mapq=min_mapq,
-                minimum_reads_per_gene=minimum_reads_per_gene,
-                split_by_rg=split_by_rg,
-                max_iterations_per_try=max_iterations_per_try,
-                checked_genes=checked_genes,
-                overall_evidence=overall_evidence,
-            )
-
-            entries_contains_inconclusive = False
-            for entry in entries:
-                if entry["Predicted"] == "Inconclusive":
-                    entries_contains_inconclusive = True
-                    break
-
-            if entries_contains_inconclusive and tries_for_file < max_tries:
-                continue
-
-            if not writer:
-                writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter="\t")
-                writer.writeheader()
-            for entry in entries:
-                writer.writerow(entry)
-                outfile.flush()
-
-            break
+        cache_key = None
+        entries = None
+        if result_cache:
+            cache_key = result_cache.key(ngsfilepath, "strandedness", cache_params)
+            entries = result_cache.get(cache_key)
+        if entries is None:
+            if gff is None:
+                gff = load_gene_model(gene_model_file, only_protein_coding_genes)
+
+            entries = strandedness_with_retries(ngsfilepath, gff, **params)
+            if result_cache:
+                result_cache.put(cache_key, entries)
+
+        if not writer:
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter="\t")
+            writer.writeheader()
+        for entry in entries:
+            writer.writerow(entry)
+            outfile.flush()
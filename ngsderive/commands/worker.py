@@ -0,0 +1,228 @@
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from .serve import run_captured
+
+logger = logging.getLogger("worker")
+
+QUEUE_DIRS = ("pending", "claimed", "results", "failed")
+CLAIM_SEPARATOR = "@"
+UNQUEUEABLE_SUBCOMMANDS = ("serve", "worker")
+
+_task_counter = itertools.count()
+
+
+def write_atomically(path, contents):
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".tmp.{name}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(contents)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def init_queue(queue_dir):
+    for name in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, name), exist_ok=True)
+
+
+def enqueue(queue_dir, argv, cwd=None):
+    """Add a task to the queue, returning its name.
+
+    Names sort in submission order, so tasks are claimed first in, first out.
+    """
+    init_queue(queue_dir)
+    name = (
+        f"{time.time_ns():020d}-{socket.gethostname()}-{os.getpid()}"
+        + f"-{next(_task_counter)}.json"
+    )
+    task = {"argv": argv, "cwd": os.path.abspath(cwd or os.getcwd())}
+    write_atomically(os.path.join(queue_dir, "pending", name), json.dumps(task))
+    return name
+
+
+def task_stem(name):
+    return name[: -len(".json")] if name.endswith(".json") else name
+
+
+class TaskQueue:
+    """Tasks shared between workers through a directory.
+
+    A task is a JSON file holding the `argv` of an ngsderive command and
+    the `cwd` to run it in. Workers claim a task by renaming it from
+    `pending/` into `claimed/` under a name that includes the worker's id.
+    Renames within a file system are atomic, including on NFS, so each
+    claim succeeds for exactly one worker. While it runs the task, the
+    worker keeps touching its claim; claims that have not been touched for
+    `stale_timeout` seconds are renamed back into `pending/`.
+    """
+
+    def __init__(self, queue_dir, worker_id, stale_timeout):
+        self.queue_dir = queue_dir
+        self.worker_id = worker_id
+        self.stale_timeout = stale_timeout
+        init_queue(queue_dir)
+
+    def _path(self, subdir, name):
+        return os.path.join(self.queue_dir, subdir, name)
+
+    def _list(self, subdir):
+        return sorted(
+            name
+            for name in os.listdir(os.path.join(self.queue_dir, subdir))
+            if not name.startswith(".")
+        )
+
+    def claim(self):
+        """Claim the oldest pending task. Returns its name and claim path."""
+        for name in self._list("pending"):
+            claim_path = self._path(
+                "claimed", f"{name}{CLAIM_SEPARATOR}{self.worker_id}"
+            )
+            pending_path = self._path("pending", name)
+            try:
+                # renaming keeps the mtime, so a task that waited longer than
+                # `stale_timeout` would look stale as soon as it is claimed
+                os.utime(pending_path)
+                os.rename(pending_path, claim_path)
+                os.utime(claim_path)
+            except FileNotFoundError:
+                continue  # claimed (or reclaimed) by another worker first
+            return name, claim_path
+        return None
+
+    def release(self, name, claim_path):
+        """Hand an unfinished task back to the queue."""
+        try:
+            os.rename(claim_path, self._path("pending", name))
+        except FileNotFoundError:
+            pass
+
+    def reclaim_stale(self):
+        now = time.time()
+        for claim in self._list("claimed"):
+            name, _, owner = claim.rpartition(CLAIM_SEPARATOR)
+            claim_path = self._path("claimed", claim)
+            try:
+                idle = now - os.stat(claim_path).st_mtime
+                if idle < self.stale_timeout:
+                    continue
+                os.rename(claim_path, self._path("pending", name))
+            except FileNotFoundError:
+                continue  # finished or reclaimed by another worker
+            logger.warning(
+                f"Returned {name} to the queue: {owner} has not reported "
+                + f"progress for {idle:.0f}s."
+            )
+
+    def is_idle(self):
+        return not self._list("pending") and not self._list("claimed")
+
+    def finish(self, name, claim_path, response):
+        stem = task_stem(name)
+        if response["status"] == "ok":
+            write_atomically(self._path("results", f"{stem}.tsv"), response["output"])
+        else:
+            write_atomically(
+                self._path("failed", f"{stem}.json"),
+                json.dumps({"task": name, "message": response["message"]}),
+            )
+        try:
+            os.unlink(claim_path)
+        except FileNotFoundError:
+            pass
+
+
+class Heartbeat:
+    """Touches a claim every `interval` seconds on a background thread."""
+
+    def __init__(self, claim_path, interval):
+        self.claim_path = claim_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._beat, daemon=True)
+        self.thread.start()
+
+    def _beat(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                os.utime(self.claim_path)
+            except FileNotFoundError:
+                logger.warning(
+                    f"Lost the claim on {os.path.basename(self.claim_path)}. "
+                    + "It will still be finished, but another worker may run it too."
+                )
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_task(name, claim_path, run_job, heartbeat_interval):
+    try:
+        with open(claim_path, "r", encoding="utf-8") as handle:
+            task = json.load(handle)
+        argv = task["argv"]
+        cwd = task.get("cwd", os.getcwd())
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        return {"status": "error", "message": f"Malformed task: {err}"}
+    if not argv or argv[0] in UNQUEUEABLE_SUBCOMMANDS:
+        return {"status": "error", "message": f"Can't queue `{' '.join(argv)}`."}
+
+    logger.info(f"Running {name}: {' '.join(argv)}")
+    heartbeat = Heartbeat(claim_path, heartbeat_interval)
+    try:
+        return run_captured(run_job, argv, cwd)
+    finally:
+        heartbeat.stop()
+
+
+def main(
+    queue_dir,
+    run_job,
+    poll_interval=5.0,
+    heartbeat_interval=30.0,
+    stale_timeout=600.0,
+    exit_when_idle=False,
+):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    queue = TaskQueue(queue_dir, worker_id, stale_timeout)
+    logger.info(f"Worker {worker_id} watching {queue_dir}.")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    n_tasks = 0
+    claimed = None
+    try:
+        while True:
+            queue.reclaim_stale()
+            claimed = queue.claim()
+            if claimed is None:
+                if exit_when_idle and queue.is_idle():
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            response = run_task(*claimed, run_job, heartbeat_interval)
+            if response["status"] != "ok":
+                logger.error(f"{claimed[0]} failed: {response['message']}")
+            queue.finish(*claimed, response)
+            claimed = None
+            n_tasks += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if claimed:
+            queue.release(*claimed)  # so another worker can pick it up now
+        logger.info(f"Worker {worker_id} finished {n_tasks} task(s).")
@@ -0,0 +1,262 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+
+from .cache import file_identity, ngsderive_version
+from .utils import GFF, GeneTable, StringTable
+
+logger = logging.getLogger("gene_index")
+
+INDEX_MAGIC = b"NGSDGMI\x00"
+INDEX_VERSION = 2
+INDEX_EXTENSION = ".ngsderive.idx"
+HEADER = struct.Struct("<8sII")  # magic, version, metadata length
+ALIGNMENT = 8
+
+
+def is_gene_model_index(path):
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    except OSError:
+        return False
+
+
+def has_feature_on_strand(starts, max_ends, gene):
+    """Whether any feature starts by the gene's end and ends after its start.
+
+    `starts` are sorted, and `max_ends[i]` is the furthest end of any of
+    the first `i + 1` features. This matches which features a tabix query
+    for the gene returns.
+    """
+    i = bisect_right(starts, gene["end"])
+    return i > 0 and max_ends[i - 1] > gene["start"]
+
+
+def antisense_overlaps(genes, features):
+    """Flags genes overlapped by non-gene features on both strands."""
+    sweeps = {}
+    for key, intervals in features.items():
+        intervals.sort()
+        starts = array("Q", (start for start, _ in intervals))
+        max_ends = array("Q")
+        furthest = 0
+        for _, end in intervals:
+            furthest = max(furthest, end)
+            max_ends.append(furthest)
+        sweeps[key] = (starts, max_ends)
+
+    flags = bytearray()
+    empty = (array("Q"), array("Q"))
+    for gene in genes:
+        flags.append(
+            all(
+                has_feature_on_strand(
+                    *sweeps.get((gene["seqname"], strand), empty), gene
+                )
+                for strand in "+-"
+            )
+        )
+    return flags
+
+
+def gene_sections(prefix, genes):
+    return {
+        f"{prefix}.seqnames": genes.seqnames,
+        f"{prefix}.features": genes.features,
+        f"{prefix}.starts": genes.starts,
+        f"{prefix}.ends": genes.ends,
+        f"{prefix}.strands": array("B", genes.strands),
+        f"{prefix}.biotypes": genes.biotypes,
+        f"{prefix}.antisense_overlaps": array("B", genes.antisense_overlaps),
+        f"{prefix}.gene_ids.blob": array("B", genes.gene_ids.blob),
+        f"{prefix}.gene_ids.offsets": genes.gene_ids.offsets,
+    }
+
+
+def build_index(gene_model_file, index_file):
+    """Parse a gene model once into a memory-mappable index."""
+    genes = GeneTable()
+    features = defaultdict(list)
+    exon_starts = defaultdict(set)
+    exon_ends = defaultdict(set)
+    for entry in GFF(gene_model_file):
+        if entry["feature"] == "gene":
+            genes.append(entry)
+            continue
+        if entry["strand"] in ("+", "-"):
+            features[(entry["seqname"], entry["strand"])].append(
+                (entry["start"], entry["end"])
+            )
+        if entry["feature"] == "exon":
+            # stored as they are compared with pysam: 0-based, end exclusive
+            exon_starts[entry["seqname"]].add(entry["start"] - 1)
+            exon_ends[entry["seqname"]].add(entry["end"])
+
+    genes.antisense_overlaps = antisense_overlaps(genes, features)
+    sections = gene_sections("genes", genes)
+    if genes.biotype_key:
+        # the default for `strandedness`; stored as its own table so loading
+        # it needs no copying
+        sections.update(
+            gene_sections(
+                "protein_coding_genes",
+                genes.filter_biotypes(lambda biotype: "protein" in biotype),
+            )
+        )
+    for contig in exon_starts:
+        sections[f"exon_starts.{contig}"] = array("Q", sorted(exon_starts[contig]))
+        sections[f"exon_ends.{contig}"] = array("Q", sorted(exon_ends[contig]))
+
+    offset = 0
+    layout = {}
+    for name, column in sections.items():
+        layout[name] = [offset, column.typecode, column.itemsize, len(column)]
+        offset += -(-len(column) * column.itemsize // ALIGNMENT) * ALIGNMENT
+    metadata = {
+        "ngsderive": ngsderive_version(),
+        "source": file_identity(gene_model_file),
+        "byteorder": sys.byteorder,
+        "names": genes.names,
+        "biotype_key": genes.biotype_key,
+        "exon_contigs": sorted(exon_starts),
+        "sections": layout,
+        "data_size": offset,
+    }
+    encoded = json.dumps(metadata).encode("utf-8")
+    data_start = HEADER.size + len(encoded)
+    padding = -data_start % ALIGNMENT
+
+    directory = os.path.dirname(os.path.abspath(index_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp.", suffix=".idx")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(encoded)))
+            handle.write(encoded + b"\x00" * padding)
+            for column in sections.values():
+                data = column.tobytes()
+                handle.write(data + b"\x00" * (-len(data) % ALIGNMENT))
+        # mkstemp creates files only the owner can read, but indexes are
+        # meant to be shared
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        # readers only ever see a missing or a complete index
+        os.replace(tmp_path, index_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(genes), len(exon_starts)
+
+
+class IndexedJunctionCache:
+    """Exon boundaries from an index, in place of a `JunctionCache`."""
+
+    def __init__(self, exon_starts, exon_ends):
+        self.exon_starts = exon_starts
+        self.exon_ends = exon_ends
+
+    def contig(self, contig):
+        if contig not in self.exon_starts:
+            return None
+        return self.exon_starts[contig], self.exon_ends[contig]
+
+
+class GeneModelIndex:
+    """A gene model index written by `ngsderive index-gene-model`.
+
+    The file is memory-mapped read-only and columns are used in place, so
+    loading takes about as long as reading the metadata, and every process
+    using the same index on a host shares one copy in the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic, version, metadata_size = HEADER.unpack_from(self._mmap)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not an ngsderive gene model index.")
+        if version != INDEX_VERSION:
+            raise ValueError(
+                f"{path} is version {version} of the gene model index format, but "
+                + f"only version {INDEX_VERSION} is supported. Rebuild it with "
+                + "`ngsderive index-gene-model`."
+            )
+        self.metadata = json.loads(
+            self._mmap[HEADER.size : HEADER.size + metadata_size]
+        )
+        data_start = HEADER.size + metadata_size
+        self._data_start = data_start + -data_start % ALIGNMENT
+        if len(self._mmap) != self._data_start + self.metadata["data_size"]:
+            raise ValueError(f"{path} is truncated or corrupt.")
+        if self.metadata["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built on a machine of different byte order.")
+
+        source = self.metadata["source"]
+        try:
+            if file_identity(source["path"]) != source:
+                logger.warning(
+                    f"{source['path']} changed since {path} was built from it. "
+                    + "Consider rebuilding the index."
+                )
+        except OSError:
+            pass
+
+    def _section(self, name):
+        offset, typecode, itemsize, length = self.metadata["sections"][name]
+        if array(typecode).itemsize != itemsize:
+            raise ValueError(f"{self.path} was built on an incompatible platform.")
+        start = self._data_start + offset
+        return self._view[start : start + length * itemsize].cast(typecode)
+
+    def genes(self, only_protein_coding_genes=False):
+        prefix = "genes"
+        if only_protein_coding_genes:
+            if not self.metadata["biotype_key"]:
+                logger.warning(
+                    "Could not isolate protein coding genes. Using all genes."
+                )
+            else:
+                prefix = "protein_coding_genes"
+
+        table = GeneTable()
+        table.names = self.metadata["names"]
+        table._name_ids = {name: i for i, name in enumerate(table.names)}
+        table.biotype_key = self.metadata["biotype_key"]
+        table.seqnames = self._section(f"{prefix}.seqnames")
+        table.features = self._section(f"{prefix}.features")
+        table.starts = self._section(f"{prefix}.starts")
+        table.ends = self._section(f"{prefix}.ends")
+        table.strands = self._section(f"{prefix}.strands")
+        table.biotypes = self._section(f"{prefix}.biotypes")
+        table.antisense_overlaps = self._section(f"{prefix}.antisense_overlaps")
+        table.gene_ids = StringTable()
+        table.gene_ids.blob = self._section(f"{prefix}.gene_ids.blob")
+        table.gene_ids.offsets = self._section(f"{prefix}.gene_ids.offsets")
+        return table
+
+    def junction_cache(self):
+        import numpy as np
+
+        exon_starts = {}
+        exon_ends = {}
+        for contig in self.metadata["exon_contigs"]:
+            # positions are far below 2**63, so the stored unsigned integers
+            # can be viewed in place as the signed ones annotation uses
+            exon_starts[contig] = np.frombuffer(
+                self._section(f"exon_starts.{contig}"), dtype=np.int64
+            )
+            exon_ends[contig] = np.frombuffer(
+                self._section(f"exon_ends.{contig}"), dtype=np.int64
+            )
+        return IndexedJunctionCache(exon_starts, exon_ends)
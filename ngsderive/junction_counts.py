@@ -0,0 +1,101 @@
+import json
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+
+from .cache import ngsderive_version
+
+RAW_JUNCTIONS_MAGIC = b"NGSDRJC\x00"
+RAW_JUNCTIONS_VERSION = 1
+RAW_JUNCTIONS_EXTENSION = ".rawjunctions"
+HEADER = struct.Struct("<8sII")  # magic, version, metadata length
+
+
+def is_raw_junction_file(path):
+    try:
+        with open(path, "rb") as handle:
+            return handle.read(len(RAW_JUNCTIONS_MAGIC)) == RAW_JUNCTIONS_MAGIC
+    except OSError:
+        return False
+
+
+def write_raw_junctions(path, ngsfilepath, min_mapq, contig_junctions):
+    """Save unfiltered, unannotated junction counts from `find_contig_junctions`.
+
+    Each contig's junctions are stored sorted by start and end as three
+    little-endian integer columns (starts, ends, read counts), and the
+    columns for all contigs are compressed together.
+    """
+    contigs = []
+    payload = bytearray()
+    for contig, found_introns in contig_junctions:
+        junctions = sorted(found_introns.items())
+        columns = (
+            array("Q", (start for (start, _), _ in junctions)),
+            array("Q", (end for (_, end), _ in junctions)),
+            array("Q", (num_reads for _, num_reads in junctions)),
+        )
+        for column in columns:
+            if sys.byteorder != "little":
+                column.byteswap()
+            payload += column.tobytes()
+        contigs.append([contig, len(junctions)])
+
+    metadata = json.dumps(
+        {
+            "ngsderive": ngsderive_version(),
+            "file": ngsfilepath,
+            "min_mapq": min_mapq,
+            "contigs": contigs,
+        }
+    ).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp.")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(
+                HEADER.pack(RAW_JUNCTIONS_MAGIC, RAW_JUNCTIONS_VERSION, len(metadata))
+            )
+            handle.write(metadata)
+            handle.write(zlib.compress(bytes(payload)))
+        umask = os.umask(0)  # mkstemp files are private; use the usual mode
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_raw_junctions(path):
+    """Returns the metadata and `(contig, {(start, end): read count})` pairs."""
+    with open(path, "rb") as handle:
+        magic, version, metadata_size = HEADER.unpack(handle.read(HEADER.size))
+        if magic != RAW_JUNCTIONS_MAGIC:
+            raise ValueError(f"{path} is not an ngsderive raw junction file.")
+        if version != RAW_JUNCTIONS_VERSION:
+            raise ValueError(
+                f"{path} is version {version} of the raw junction format, but "
+                + f"only version {RAW_JUNCTIONS_VERSION} is supported."
+            )
+        metadata = json.loads(handle.read(metadata_size))
+        payload = zlib.decompress(handle.read())
+
+    contig_junctions = []
+    offset = 0
+    for contig, n_junctions in metadata["contigs"]:
+        columns = []
+        for _ in range(3):
+            column = array("Q")
+            column.frombytes(payload[offset : offset + n_junctions * column.itemsize])
+            if sys.byteorder != "little":
+                column.byteswap()
+            offset += n_junctions * column.itemsize
+            columns.append(column)
+        starts, ends, counts = columns
+        contig_junctions.append((contig, dict(zip(zip(starts, ends), counts))))
+    return metadata, contig_junctions
@@ -0,0 +1,94 @@
+import os
+
+MATRIX_FILE = "matrix.mtx"
+JUNCTIONS_FILE = "junctions.tsv"
+SAMPLES_FILE = "samples.tsv"
+
+
+class JunctionCollector:
+    """Keeps the annotated junctions `annotate_junction_counts` reports."""
+
+    def __init__(self):
+        self.junctions = []
+
+    def write(self, contig, starts, ends, counts, annotations):
+        if len(starts):
+            self.junctions.append((contig, starts, ends, counts, annotations))
+
+
+class JunctionMatrix:
+    """A junction x sample matrix of read counts, written as samples finish.
+
+    `matrix_dir` gets a Matrix Market coordinate file (`matrix.mtx`) with
+    one row per junction and one column per sample, `junctions.tsv` naming
+    the junction in each row, and `samples.tsv` naming the file in each
+    column. Rows are numbered in the order junctions are first seen.
+
+    Counts go straight to disk. Only the row number of each distinct
+    junction is kept in memory, so memory grows with the number of
+    distinct junctions in the cohort rather than with the number of samples.
+    """
+
+    def __init__(self, matrix_dir):
+        self.matrix_dir = matrix_dir
+        os.makedirs(matrix_dir, exist_ok=True)
+        self.rows = {}
+        self.n_rows = 0
+        self.n_columns = 0
+        self.n_entries = 0
+        self.junctions_file = open(
+            os.path.join(matrix_dir, JUNCTIONS_FILE), "w", encoding="utf-8"
+        )
+        self.junctions_file.write("Row\tContig\tIntronStart\tIntronEnd\tAnnotation\n")
+        self.samples_file = open(
+            os.path.join(matrix_dir, SAMPLES_FILE), "w", encoding="utf-8"
+        )
+        self.samples_file.write("Column\tFile\n")
+        self.entries_path = os.path.join(matrix_dir, f".{MATRIX_FILE}.entries")
+        self.entries_file = open(self.entries_path, "w", encoding="utf-8")
+
+    def add_sample(self, ngsfilepath, junctions):
+        """Add a column from the junctions a `JunctionCollector` kept."""
+        self.n_columns += 1
+        column = self.n_columns
+        self.samples_file.write(f"{column}\t{ngsfilepath}\n")
+
+        new_junctions = []
+        entries = []
+        for contig, starts, ends, counts, annotations in junctions:
+            contig_rows = self.rows.setdefault(contig, {})
+            for start, end, num_reads, annotation in zip(
+                starts.tolist(), ends.tolist(), counts.tolist(), annotations.tolist()
+            ):
+                row = contig_rows.get((start, end))
+                if row is None:
+                    self.n_rows += 1
+                    row = contig_rows[(start, end)] = self.n_rows
+                    new_junctions.append(
+                        f"{row}\t{contig}\t{start}\t{end}\t{annotation}\n"
+                    )
+                entries.append(f"{row} {column} {num_reads}\n")
+        self.junctions_file.write("".join(new_junctions))
+        self.entries_file.write("".join(entries))
+        self.n_entries += len(entries)
+
+    def close(self):
+        """Write `matrix.mtx`, whose header needs the final dimensions."""
+        self.junctions_file.close()
+        self.samples_file.close()
+        self.entries_file.close()
+        matrix_path = os.path.join(self.matrix_dir, MATRIX_FILE)
+        tmp_path = os.path.join(self.matrix_dir, f".{MATRIX_FILE}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as matrix:
+                matrix.write("%%MatrixMarket matrix coordinate integer general\n")
+                matrix.write("% rows: junctions.tsv, columns: samples.tsv\n")
+                matrix.write(f"{self.n_rows} {self.n_columns} {self.n_entries}\n")
+                with open(self.entries_path, "r", encoding="utf-8") as entries:
+                    for block in iter(lambda: entries.read(1 << 20), ""):
+                        matrix.write(block)
+            os.replace(tmp_path, matrix_path)
+        finally:
+            for path in (tmp_path, self.entries_path):
+                if os.path.exists(path):
+                    os.unlink(path)
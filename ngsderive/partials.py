@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import re
+import tempfile
+from collections import defaultdict
+
+from .cache import NON_RESULT_PARAMS, ngsderive_version
+
+logger = logging.getLogger("partials")
+
+PARTIAL_FORMAT = "ngsderive-partial"
+PARTIAL_VERSION = 1
+UNMAPPED_REGION = "*"
+REGION_REGEX = re.compile(r"^(.+):([\d,]+)-([\d,]+)$")
+
+
+class Region:
+    """A contig, or a 0-based, end exclusive span of one.
+
+    A read belongs to the region its alignment starts in, so reads
+    spanning a boundary between two regions are counted exactly once.
+    The special region `*` holds unplaced, unmapped reads.
+    """
+
+    def __init__(self, contig, start=None, end=None):
+        self.contig = contig
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def parse(cls, region):
+        """Parse `contig`, `*`, or samtools-style `contig:start-end` (1-based)."""
+        match = REGION_REGEX.match(region)
+        if match:
+            start = int(match.group(2).replace(",", ""))
+            end = int(match.group(3).replace(",", ""))
+            if start < 1 or end < start:
+                raise ValueError(f"Invalid region: {region}")
+            return cls(match.group(1), start - 1, end)
+        return cls(region)
+
+    def __str__(self):
+        if self.start is None:
+            return self.contig
+        return f"{self.contig}:{self.start + 1}-{self.end}"
+
+    def span(self, contig_length):
+        if self.start is None:
+            return 0, contig_length
+        return self.start, min(self.end, contig_length)
+
+    def fetch(self, samfile):
+        if self.contig == UNMAPPED_REGION:
+            yield from samfile.fetch(UNMAPPED_REGION)
+            return
+        if self.start is None:
+            yield from samfile.fetch(self.contig)
+            return
+        for read in samfile.fetch(self.contig, self.start, self.end):
+            if self.start <= read.reference_start < self.end:
+                yield read
+
+
+def read_regions(value):
+    """Regions from a comma-separated list, or a file of regions or BED lines."""
+    if not os.path.isfile(value):
+        return [Region.parse(region) for region in value.split(",") if region]
+
+    regions = []
+    with open(value, "r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split("\t")
+            if len(fields) >= 3:  # BED is already 0-based, end exclusive
+                regions.append(Region(fields[0], int(fields[1]), int(fields[2])))
+            else:
+                regions.append(Region.parse(fields[0]))
+    return regions
+
+
+def check_coverage(ngsfilepath, regions, contig_lengths):
+    """Error on overlapping regions; warn if any part of the file is not covered."""
+    spans = defaultdict(list)
+    for region in regions:
+        if region.contig == UNMAPPED_REGION:
+            spans[UNMAPPED_REGION].append((0, 1))
+        elif region.contig not in contig_lengths:
+            raise ValueError(f"{ngsfilepath} has no contig named {region.contig}.")
+        else:
+            spans[region.contig].append(region.span(contig_lengths[region.contig]))
+
+    uncovered = []
+    for contig, length in list(contig_lengths.items()) + [(UNMAPPED_REGION, 1)]:
+        covered_to = 0
+        for start, end in sorted(spans[contig]):
+            if start < covered_to:
+                raise ValueError(f"Regions for {ngsfilepath} overlap on {contig}.")
+            if start > covered_to:
+                uncovered.append(contig)
+            covered_to = max(covered_to, end)
+        if covered_to < length:
+            uncovered.append(contig)
+    if uncovered:
+        logger.warning(
+            f"Partials for {ngsfilepath} do not cover all of "
+            + ", ".join(sorted(set(uncovered)))
+            + ". Results only reflect the regions that were processed."
+        )
+
+
+def contig_lengths(samfile):
+    return dict(zip(samfile.references, samfile.lengths))
+
+
+def write_partials(path, partials):
+    """Atomically write partial states for one or more files to `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp.", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "format": PARTIAL_FORMAT,
+                    "version": PARTIAL_VERSION,
+                    "ngsderive": ngsderive_version(),
+                    "partials": partials,
+                },
+                handle,
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_partials(paths):
+    partials = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as handle:
+            contents = json.load(handle)
+        if contents.get("format") != PARTIAL_FORMAT:
+            raise ValueError(f"{path} is not an ngsderive partial result.")
+        if contents["version"] != PARTIAL_VERSION:
+            raise ValueError(
+                f"{path} is version {contents['version']} of the partial format, "
+                + f"but only version {PARTIAL_VERSION} is supported."
+            )
+        partials.extend(contents["partials"])
+    return partials
+
+
+def make_partial(subcommand, ngsfilepath, params, regions, samfile, state):
+    if regions is None:  # the whole file
+        regions = [Region(contig) for contig in samfile.references]
+        regions.append(Region(UNMAPPED_REGION))
+    return {
+        "subcommand": subcommand,
+        "file": ngsfilepath,
+        "params": {k: v for k, v in params.items() if k not in NON_RESULT_PARAMS},
+        "regions": [str(region) for region in regions],
+        "contig_lengths": contig_lengths(samfile),
+        "state": state,
+    }
+
+
+def group_partials(partials):
+    """Group partials by file, checking they can be combined.
+
+    Returns the subcommand and a list of `(ngsfilepath, params, contigs,
+    states)` in the order files were first seen, where `contigs` are the
+    file's contigs in header order and `states` are in file order.
+    """
+    subcommands = {partial["subcommand"] for partial in partials}
+    if len(subcommands) != 1:
+        raise ValueError(
+            "Partials from different subcommands can't be merged: "
+            + ", ".join(sorted(subcommands))
+        )
+
+    by_file = {}
+    for partial in partials:
+        ngsfilepath = partial["file"]
+        if ngsfilepath not in by_file:
+            by_file[ngsfilepath] = (partial["params"], partial["contig_lengths"], [])
+        params, lengths, _ = by_file[ngsfilepath]
+        if partial["params"] != params:
+            raise ValueError(f"Partials for {ngsfilepath} used different options.")
+        if partial["contig_lengths"] != lengths:
+            raise ValueError(f"Partials for {ngsfilepath} have different headers.")
+        by_file[ngsfilepath][2].append(partial)
+
+    grouped = []
+    for ngsfilepath, (params, lengths, file_partials) in by_file.items():
+        # combine in file order, as a single pass over a sorted file would
+        contig_order = {contig: i for i, contig in enumerate(lengths)}
+        contig_order[UNMAPPED_REGION] = len(contig_order)
+
+        def first_region(partial):
+            return min(
+                (contig_order.get(region.contig, len(contig_order)), region.start or 0)
+                for region in map(Region.parse, partial["regions"])
+            )
+
+        file_partials.sort(key=first_region)
+        regions = [
+            Region.parse(region)
+            for partial in file_partials
+            for region in partial["regions"]
+        ]
+        check_coverage(ngsfilepath, regions, lengths)
+        grouped.append(
+            (
+                ngsfilepath,
+                params,
+                list(lengths),
+                [partial["state"] for partial in file_partials],
+            )
+        )
+    return subcommands.pop(), grouped
@@ -1,20 +1,36 @@
 import enum
 import gzip
+import io
+import itertools
 import logging
 import os
+import queue
 import random
 import re
 import subprocess
+import sys
+import threading
+import zlib
+from array import array
 from collections import defaultdict
 from operator import itemgetter
 
-import gtfparse
-import pysam
-import tabix
-from sortedcontainers import SortedList
+# Third-party modules are imported where they are used, so that subcommands
+# only pay for the imports they need.
 
 logger = logging.getLogger("utils")
 
+STDIN_FILENAMES = ("-", "/dev/stdin")
+FASTQ_EXTENSIONS = ("fastq", "fq", "fastq.gz", "fq.gz")
+SNIFF_BYTES = 65536
+RELAY_CHUNK_SIZE = 65536
+SAM_HEADER_REGEX = re.compile(rb"^@[A-Z][A-Z]\t")
+# `key "value"` in GTF, `key=value` in GFF3
+GENE_NAME_ATTRIBUTE_REGEX = re.compile(r'(?:^|;)\s*gene_name(?:\s+"|=)([^";]*)')
+BIOTYPE_ATTRIBUTE_REGEX = re.compile(  # Gencode, ENSEMBL
+    r'(?:^|;)\s*gene_(?:type|biotype)(?:\s+"|=)([^";]*)'
+)
+
 
 class NGSFileType(enum.Enum):
     FASTQ = 1
@@ -22,15 +38,286 @@ class NGSFileType(enum.Enum):
     BAM = 3
 
 
+def template_hash(query_name, seed=0):
+    """Deterministic 32-bit hash of the template a read belongs to.
+
+    Anything after the first whitespace and a trailing `/1` or `/2` are
+    ignored, so both mates of a pair (even across R1/R2 FASTQs) hash the same.
+    """
+    if isinstance(query_name, str):
+        query_name = query_name.encode("utf-8")
+    name = query_name.split(None, 1)[0] if query_name else query_name
+    if name.endswith((b"/1", b"/2")):
+        name = name[:-2]
+    h = zlib.crc32(name, seed)
+    # murmur3 finalizer, to spread CRC32's linear structure over all bits
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
+
+
+def read_fastq_records(handle):
+    while True:
+        query_name = handle.readline().strip()
+        if not query_name or query_name == "":
+            return
+
+        query = handle.readline()
+        _plusline = handle.readline()
+        quality_string = handle.readline()
+        yield query_name, query, quality_string
+
+
+class Prefetcher:
+    """Pulls records from `records` on a background thread.
+
+    Records are handed over in chunks of `chunk_size` through a queue
+    holding at most `depth` chunks, so reading and decompressing the next
+    chunk overlaps with processing the current one while memory stays
+    bounded. `records` must not hold a reference to the owner of the
+    prefetcher, or `close()` will never be reached on garbage collection.
+    """
+
+    _DONE = object()
+
+    def __init__(self, records, depth, chunk_size=1024):
+        self._queue = queue.Queue(maxsize=depth)
+        self._closed = threading.Event()
+        self._chunk = iter(())
+        self._thread = threading.Thread(
+            target=self._produce, args=(records, chunk_size), daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, records, chunk_size):
+        try:
+            chunk = []
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    if not self._put(chunk):
+                        return
+                    chunk = []
+            if chunk and not self._put(chunk):
+                return
+        except Exception as err:  # re-raised on the consuming thread
+            self._put(err)
+            return
+        self._put(self._DONE)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            try:
+                return next(self._chunk)
+            except StopIteration:
+                pass
+            item = self._queue.get()
+            if item is self._DONE:
+                self._chunk = iter(())
+                self._queue.put(item)  # keep raising StopIteration
+                raise StopIteration()
+            if isinstance(item, Exception):
+                raise item
+            self._chunk = iter(item)
+
+    def close(self):
+        self._closed.set()
+
+
+def sniff_ngs_filetype(head):
+    """Guess the type of a stream from its first bytes.
+
+    Returns `(filetype, gzipped)`, with `filetype` None if unrecognized.
+    BAM is BGZF-compressed, so gzipped data is inflated far enough to
+    tell BAM from gzipped FASTQ.
+    """
+    gzipped = head[:2] == b"\x1f\x8b"
+    if gzipped:
+        try:
+            head = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(head)
+        except zlib.error:
+            return None, True
+        if head[:4] == b"BAM\x01":
+            return NGSFileType.BAM, True
+
+    if SAM_HEADER_REGEX.match(head):
+        return NGSFileType.SAM, gzipped
+    first_line = head.split(b"\n", 1)[0]
+    if first_line.count(b"\t") >= 10:  # headerless SAM
+        return NGSFileType.SAM, gzipped
+    if head[:1] == b"@":
+        return NGSFileType.FASTQ, gzipped
+    return None, gzipped
+
+
+class Tee:
+    """Destination for streams passed through unchanged by `StreamRelay`."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self._relays = []
+
+    def attach(self, thread):
+        self._relays.append(thread)
+
+    def write(self, chunk):
+        self.handle.write(chunk)
+        self.handle.flush()
+
+    def close(self):
+        # each relay finishes passing its stream through once its reader is done
+        for thread in self._relays:
+            thread.join()
+        if self.handle is not sys.stdout.buffer:
+            self.handle.close()
+
+
+class StreamRelay:
+    """Copies a stream into a pipe on a background thread.
+
+    The first bytes of the stream are read up front and kept in `head`
+    so the stream can be inspected before anything consumes it; `reader`
+    is the read end of the pipe, which replays the stream from the start.
+    Readers that need a real file descriptor (e.g. htslib) can use it.
+
+    If a `Tee` is given, every chunk is also written to it, and the whole
+    stream is passed through even if the reader stops early. Writes block,
+    so a slow consumer on either side slows the relay down rather than
+    buffering, and at most one chunk is held at a time.
+    """
+
+    def __init__(self, stream, tee=None):
+        chunks = []
+        head_size = 0
+        while head_size < SNIFF_BYTES:
+            chunk = stream.read1(SNIFF_BYTES - head_size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            head_size += len(chunk)
+        self.head = b"".join(chunks)
+        self.tee = tee
+
+        read_fd, write_fd = os.pipe()
+        self.reader = os.fdopen(read_fd, "rb")
+        self._thread = threading.Thread(
+            target=self._relay, args=(stream, write_fd), daemon=True
+        )
+        self._thread.start()
+        if tee is not None:
+            tee.attach(self._thread)
+
+    def _write_tee(self, chunk):
+        try:
+            self.tee.write(chunk)
+        except BrokenPipeError:
+            logger.error("Pass-through output was closed before the input ended.")
+            self.tee = None
+
+    def _relay(self, stream, write_fd):
+        pipe = os.fdopen(write_fd, "wb")
+        chunk = self.head
+        try:
+            while chunk:
+                if self.tee is not None:
+                    self._write_tee(chunk)
+                if pipe is not None:
+                    try:
+                        pipe.write(chunk)
+                        pipe.flush()
+                    except BrokenPipeError:
+                        # the reader stopped early, e.g. after `-n` reads
+                        self._close_pipe(pipe)
+                        pipe = None
+                if pipe is None and self.tee is None:
+                    return
+                chunk = stream.read1(RELAY_CHUNK_SIZE)
+        finally:
+            if pipe is not None:
+                self._close_pipe(pipe)
+
+    @staticmethod
+    def _close_pipe(pipe):
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+    def close(self):
+        # htslib reads from its own duplicate of the descriptor, so this
+        # only ends the relay once every reader is done with the pipe
+        self.reader.close()
+
+
 class NGSFile:
-    def __init__(self, filename, store_qualities=False):
+    def __init__(
+        self,
+        filename,
+        store_qualities=False,
+        subsample_fraction=None,
+        subsample_seed=0,
+        prefetch=0,
+        tee=None,
+        regions=None,
+    ):
         self.filename = filename
         self.store_qualities = store_qualities
+        self.subsample_seed = subsample_seed
+        self.subsample_threshold = None
+        if subsample_fraction is not None and subsample_fraction < 1.0:
+            self.subsample_threshold = int(subsample_fraction * (1 << 32))
         self.basename = os.path.basename(self.filename)
+        self.read_num = 0
+
+        self._relay = None
+        if self.filename in STDIN_FILENAMES:
+            self._open_stream(sys.stdin.buffer, tee)
+        elif tee is not None:
+            self._open_stream(open(self.filename, "rb"), tee)
+        else:
+            self._open_path()
+
+        if regions is not None:
+            if self.filetype != NGSFileType.BAM or self._relay is not None:
+                raise RuntimeError(
+                    f"Invalid file: {self.filename}. Regions can only be read from indexed BAM files!"
+                )
+            self._records = itertools.chain.from_iterable(
+                region.fetch(self.handle) for region in regions
+            )
+        elif self.filetype == NGSFileType.FASTQ:
+            self._records = read_fastq_records(self.handle)
+        else:
+            self._records = iter(self.handle)
+        self._prefetcher = None
+        if prefetch > 0:
+            self._prefetcher = Prefetcher(self._records, prefetch)
+            self._records = self._prefetcher
+
+        logger.debug(f"Opened NGS file '{self.filename}' as {self.filetype}")
+        logger.debug(f"Gzipped: {self.gzipped}")
+        logger.debug(f"Readmode: {self.readmode}")
+        logger.debug(f"Prefetch depth: {prefetch}")
+
+    def _open_path(self):
         self.ext = ".".join(self.basename.split(".")[1:])
         self.readmode = "r"
         self.gzipped = False
-        self.read_num = 0
 
         if (
             self.ext.endswith(".gz")
@@ -40,46 +327,89 @@ class NGSFile:
             self.readmode = "rb"
             self.gzipped = True
 
-        if (
-            self.ext.endswith("fastq")
-            or self.ext.endswith("fq")
-            or self.ext.endswith("fastq.gz")
-            or self.ext.endswith("fq.gz")
-        ):
+        if self.ext.endswith(FASTQ_EXTENSIONS):
             self.filetype = NGSFileType.FASTQ
             if self.gzipped:
                 self.handle = gzip.open(self.filename, mode=self.readmode)
             else:
                 self.handle = open(self.filename, mode=self.readmode, encoding="utf-8")
         elif self.ext.endswith("sam"):
+            import pysam
+
             self.filetype = NGSFileType.SAM
             self.handle = pysam.AlignmentFile(self.filename, self.readmode)
         elif self.ext.endswith("bam"):
+            import pysam
+
             self.filetype = NGSFileType.BAM
             self.handle = pysam.AlignmentFile(self.filename, self.readmode)
         else:
             raise RuntimeError(f"Could not determine NGS file type: {self.filename}")
 
-        logger.debug(f"Opened NGS file '{self.filename}' as {self.filetype}")
-        logger.debug(f"Gzipped: {self.gzipped}")
-        logger.debug(f"Readmode: {self.readmode}")
+    def _open_stream(self, stream, tee=None):
+        self._relay = StreamRelay(stream, tee)
+        self.filetype, self.gzipped = sniff_ngs_filetype(self._relay.head)
+        if self.filetype is None:
+            raise RuntimeError(f"Could not determine NGS file type: {self.filename}")
+        self.ext = None
+        self.readmode = "rb" if self.gzipped else "r"
+
+        if self.filetype == NGSFileType.FASTQ:
+            if self.gzipped:
+                self.handle = gzip.open(self._relay.reader, mode=self.readmode)
+            else:
+                self.handle = io.TextIOWrapper(self._relay.reader, encoding="utf-8")
+        else:
+            import pysam
+
+            self.handle = pysam.AlignmentFile(self._relay.reader, self.readmode)
+
+    def __del__(self):
+        if getattr(self, "_prefetcher", None) is not None:
+            self._prefetcher.close()
+        # at shutdown, a prefetch thread may be frozen holding the reader's lock
+        if getattr(self, "_relay", None) is not None and not sys.is_finalizing():
+            self._relay.close()
 
     def __iter__(self):
         return self
 
+    def _keep(self, query_name):
+        if self.subsample_threshold is None:
+            return True
+        return template_hash(query_name, self.subsample_seed) < self.subsample_threshold
+
+    def _next_fastq_record(self):
+        while True:
+            query_name, query, quality_string = next(self._records)
+            if self._keep(query_name[1:]):
+                return query_name, query, quality_string
+
+    def _next_alignment(self):
+        while True:
+            read = next(self._records)
+            if self._keep(read.query_name):
+                return read
+
+    def alignments(self):
+        """Yield the raw `pysam.AlignedSegment` of each SAM/BAM record."""
+        while True:
+            try:
+                read = self._next_alignment()
+            except StopIteration:
+                return
+            self.read_num += 1
+            yield read
+
     def __next__(self):
         query_name = None
         query = None
         read_group = None
         quality = None
         if self.filetype == NGSFileType.FASTQ:
-            query_name = self.handle.readline().strip()
-            if not query_name or query_name == "":
-                raise StopIteration()
-
-            query = self.handle.readline().strip()
-            _plusline = self.handle.readline().strip()
-            quality_string = self.handle.readline().strip()
+            query_name, query, quality_string = self._next_fastq_record()
+            query = query.strip()
+            quality_string = quality_string.strip()
 
             if self.gzipped:
                 query_name = query_name.decode("utf-8")
@@ -98,7 +428,7 @@ class NGSFile:
                 query_name = query_name[1:]
 
         elif self.filetype == NGSFileType.SAM or self.filetype == NGSFileType.BAM:
-            read = next(self.handle)
+            read = self._next_alignment()
             query_name = read.query_name
             query = read.query_alignment_sequence
             read_group = read.get_tag("RG")
@@ -118,8 +448,29 @@ class NGSFile:
 
         return result
 
+    def read_lengths(self):
+        """Yield the length of each read without decoding its sequence.
+
+        For SAM/BAM this is the aligned length (soft clips excluded) taken
+        from the CIGAR, matching `len(query_alignment_sequence)`.
+        """
+        if self.filetype == NGSFileType.FASTQ:
+            terminators = b"\r\n" if self.gzipped else "\r\n"
+            while True:
+                try:
+                    _query_name, query, _quality_string = self._next_fastq_record()
+                except StopIteration:
+                    return
+                self.read_num += 1
+                yield len(query.rstrip(terminators))
+        else:
+            for read in self.alignments():
+                yield read.query_alignment_length
+
 
 def sort_gff(filename):
+    import tabix
+
     sorted_gff_name_tmp = filename
     ext = sorted_gff_name_tmp.split(".")[-1]
     gzipped = False
@@ -209,6 +560,124 @@ def sort_gff(filename):
     return compressed_gff_name
 
 
+class StringTable:
+    """Appends strings to one contiguous buffer, addressed by index."""
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, value):
+        self.blob += value.encode("utf-8")
+        self.offsets.append(len(self.blob))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i] : self.offsets[i + 1]], "utf-8")
+
+
+class GeneTable:
+    """Columnar store of the fields `strandedness` needs for each gene.
+
+    Contigs, feature types, and biotypes are interned. Coordinates live in
+    integer arrays, strands in a byte array, and gene IDs in a single
+    string buffer, so a gene model costs a few dozen bytes per gene rather
+    than a dict of attribute strings. Rows are only turned into dicts when
+    they are accessed. The columns are plain buffers, so after a fork
+    worker processes can share one table without copying it.
+    """
+
+    BIOTYPE_KEYS = ("gene_type", "gene_biotype")  # Gencode, ENSEMBL
+
+    def __init__(self):
+        self.names = []
+        self._name_ids = {}
+        self.seqnames = array("I")
+        self.features = array("I")
+        self.starts = array("Q")
+        self.ends = array("Q")
+        self.strands = bytearray()
+        self.gene_ids = StringTable()
+        self.biotypes = array("I")
+        self.biotype_key = None
+        # set for tables loaded from an `index-gene-model` index
+        self.antisense_overlaps = None
+
+    def _intern(self, name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def append(self, entry):
+        self.seqnames.append(self._intern(entry["seqname"]))
+        self.features.append(self._intern(entry["feature"]))
+        self.starts.append(entry["start"])
+        self.ends.append(entry["end"])
+        self.strands += entry["strand"].encode("ascii")[:1] or b"."
+        self.gene_ids.append(entry.get("gene_id", entry.get("ID", "")))
+        biotype = None
+        for key in self.BIOTYPE_KEYS:
+            if key in entry:
+                self.biotype_key = key
+                biotype = entry[key]
+                break
+        self.biotypes.append(self._intern(biotype or ""))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("gene table index out of range")
+        i %= len(self)
+        result = {
+            "seqname": self.names[self.seqnames[i]],
+            "feature": self.names[self.features[i]],
+            "start": self.starts[i],
+            "end": self.ends[i],
+            "strand": chr(self.strands[i]),
+            "gene_id": self.gene_ids[i],
+        }
+        if self.biotype_key:
+            result[self.biotype_key] = self.names[self.biotypes[i]]
+        if self.antisense_overlaps is not None:
+            result["antisense_overlap"] = bool(self.antisense_overlaps[i])
+        return result
+
+    def sample(self):
+        return random.choice(self)
+
+    def subset(self, indices):
+        table = GeneTable()
+        table.names = list(self.names)
+        table._name_ids = dict(self._name_ids)
+        table.biotype_key = self.biotype_key
+        if self.antisense_overlaps is not None:
+            table.antisense_overlaps = bytearray()
+        for i in indices:
+            table.seqnames.append(self.seqnames[i])
+            table.features.append(self.features[i])
+            table.starts.append(self.starts[i])
+            table.ends.append(self.ends[i])
+            table.strands.append(self.strands[i])
+            table.gene_ids.append(self.gene_ids[i])
+            table.biotypes.append(self.biotypes[i])
+            if table.antisense_overlaps is not None:
+                table.antisense_overlaps.append(self.antisense_overlaps[i])
+        return table
+
+    def filter_biotypes(self, predicate):
+        """Genes whose biotype passes `predicate`, which is called once per biotype."""
+        keep = {
+            name_id for name_id in set(self.biotypes) if predicate(self.names[name_id])
+        }
+        return self.subset(i for i, b in enumerate(self.biotypes) if b in keep)
+
+
 class GFF:
     def __init__(
         self,
@@ -224,6 +693,8 @@ class GFF:
             logger.error(f"Gene model {filename} does not exist!")
             raise SystemExit(1)
         if need_tabix:
+            import tabix
+
             try:
                 self.tabix = tabix.open(filename)
                 self.tabix.queryi(0, 100, 200)
@@ -237,17 +708,15 @@ class GFF:
         self.entries = None
         self.gene_exclude_list = None
         if gene_exclude_list:
-            self.gene_exclude_list = set(
-                [
-                    item.strip()
-                    for item in open(
-                        gene_exclude_list, "r", encoding="utf-8"
-                    ).readlines()
-                ]
-            )
+            with open(gene_exclude_list, "r", encoding="utf-8") as handle:
+                self.gene_exclude_list = {line.strip() for line in handle} - {""}
         self.feature_type = feature_type
+        self.only_protein_coding_genes = only_protein_coding_genes
+        self._saw_biotype = False
 
         if dataframe_mode:
+            import gtfparse
+
             if self.feature_type:
                 self.df = gtfparse.read_gtf(filename, features=[self.feature_type])
             else:
@@ -255,7 +724,7 @@ class GFF:
             if self.gene_exclude_list:
                 if "gene_name" in self.df.columns:
                     self.df = self.df[
-                        self.df["gene_name"] not in self.gene_exclude_list
+                        ~self.df["gene_name"].isin(self.gene_exclude_list)
                     ]
                 else:
                     logger.warning(
@@ -283,7 +752,10 @@ class GFF:
             self._attr_regexes = [r"(\S+)=(\S+)", r"(\S+) \"(\S+)\""]
 
             if store_results:
-                self.entries = [entry for entry in self]
+                self.entries = GeneTable()
+                for entry in self:
+                    self.entries.append(entry)
+                self._warn_if_no_biotypes()
 
     def __iter__(self):
         if self.df is not None:
@@ -321,14 +793,8 @@ class GFF:
             if self.feature_type and feature != self.feature_type:
                 continue
 
-            if self.gene_exclude_list:
-                selected_bad_gene = False
-                for bad_gene in self.gene_exclude_list:
-                    if bad_gene in attributes:
-                        selected_bad_gene = True
-                        break
-                if selected_bad_gene:
-                    continue
+            if self._is_filtered(attributes, check_biotype=True):
+                continue
 
             result = {
                 "seqname": seqname,
@@ -355,6 +821,27 @@ class GFF:
                         result[key.strip()] = value.strip()
             return result
 
+    def _is_filtered(self, attributes, check_biotype):
+        """Apply the dataframe mode filters to a line's raw attribute string.
+
+        Only the `gene_name` and biotype attributes are looked up, so lines
+        are filtered before their attributes are parsed into a dict.
+        """
+        if self.gene_exclude_list:
+            match = GENE_NAME_ATTRIBUTE_REGEX.search(attributes)
+            if match and match.group(1) in self.gene_exclude_list:
+                return True
+        if check_biotype and self.only_protein_coding_genes:
+            match = BIOTYPE_ATTRIBUTE_REGEX.search(attributes)
+            if match:
+                self._saw_biotype = True
+                return "protein" not in match.group(1)
+        return False
+
+    def _warn_if_no_biotypes(self):
+        if self.only_protein_coding_genes and not self._saw_biotype:
+            logger.warning("Could not isolate protein coding genes. Using all genes.")
+
     def sample(self):
         if self.df is None and not self.entries:
             raise NotImplementedError("sample() not implemented in iterator mode")
@@ -373,14 +860,10 @@ class GFF:
         raw_hits = self.tabix.query(contig, start, end)
         hits = []
         for hit in raw_hits:
-            if self.gene_exclude_list:
-                selected_bad_gene = False
-                for bad_gene in self.gene_exclude_list:
-                    if bad_gene in hit[8]:
-                        selected_bad_gene = True
-                        break
-                if selected_bad_gene:
-                    continue
+            # Features of any biotype can overlap (and disqualify) a gene,
+            # so only the exclusion list applies to queries.
+            if self._is_filtered(hit[8], check_biotype=False):
+                continue
 
             result = {
                 "seqname": hit[0],
@@ -410,11 +893,19 @@ class GFF:
         return hits
 
 
+def sorted_positions(positions):
+    """Sorted, unique positions as an integer array for vectorized lookups."""
+    import numpy as np
+
+    return np.unique(np.asarray(positions, dtype=np.int64))
+
+
 class JunctionCache:
     def __init__(self, gff):
         self.gff = gff
-        self.exon_starts = defaultdict(SortedList)
-        self.exon_ends = defaultdict(SortedList)
+        self.exon_starts = defaultdict(list)
+        self.exon_ends = defaultdict(list)
+        self._contigs = {}
         while True:
             try:
                 next(self)
@@ -434,8 +925,95 @@ class JunctionCache:
         # starts need to have 1 subtracted
         # ends are already equivelant
         start, end = exon["start"] - 1, exon["end"]
-        self.exon_starts[exon["seqname"]].add(start)
-        self.exon_ends[exon["seqname"]].add(end)
+        self.exon_starts[exon["seqname"]].append(start)
+        self.exon_ends[exon["seqname"]].append(end)
+
+    def contig(self, contig):
+        """Sorted exon starts and ends on `contig`, or None if it has no exons."""
+        if contig not in self.exon_starts:
+            return None
+        if contig not in self._contigs:
+            self._contigs[contig] = (
+                sorted_positions(self.exon_starts[contig]),
+                sorted_positions(self.exon_ends[contig]),
+            )
+        return self._contigs[contig]
+
+
+class TabixJunctionCache:
+    """A `JunctionCache` that reads a contig's exons only when first asked.
+
+    Needs a bgzipped, tabix-indexed gene model. Annotation then only pays
+    for the contigs that actually have junctions, rather than for the
+    whole gene model.
+    """
+
+    def __init__(self, filename):
+        import tabix
+
+        self.filename = filename
+        self.tabix = tabix.open(filename)
+        self.pid = os.getpid()
+        self.contigs = {}
+
+    def contig(self, contig):
+        if contig not in self.contigs:
+            self.contigs[contig] = self._load(contig)
+        return self.contigs[contig]
+
+    def _load(self, contig):
+        import tabix
+
+        if os.getpid() != self.pid:
+            # a forked child shares the parent's file offset, so concurrent
+            # queries from several processes would read each other's data
+            self.tabix = tabix.open(self.filename)
+            self.pid = os.getpid()
+        try:
+            records = self.tabix.querys(contig)
+        except tabix.TabixError:  # contig is not in the gene model
+            return None
+
+        starts = []
+        ends = []
+        for record in records:
+            if record[2] == "exon":
+                # 1-based, end inclusive to 0-based, end exclusive
+                starts.append(int(record[3]) - 1)
+                ends.append(int(record[4]))
+        if not starts:
+            return None
+        logger.debug(f"Cached {contig}")
+        return sorted_positions(starts), sorted_positions(ends)
+
+
+class ConvergenceMonitor:
+    """Decides when more reads can no longer change a subcommand's call.
+
+    Every `interval` reads, the caller reports its current call and whether
+    that call is settled (i.e. outside of the tolerance of flipping).
+    The run has converged once the same settled call has been reported at
+    `checks` consecutive checkpoints.
+    """
+
+    def __init__(self, interval, checks=3):
+        self.interval = interval
+        self.checks = checks
+        self.last_call = None
+        self.n_stable = 0
+
+    def due(self, n_reads):
+        return n_reads % self.interval == 0
+
+    def update(self, call, settled):
+        if settled and call == self.last_call:
+            self.n_stable += 1
+        elif settled:
+            self.n_stable = 1
+        else:
+            self.n_stable = 0
+        self.last_call = call
+        return self.n_stable >= self.checks
 
 
 MOCK_READ_GROUPS = {"overall", "unknown_read_group"}
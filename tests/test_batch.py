@@ -0,0 +1,33 @@
+import csv
+
+import pytest
+
+from ngsderive.commands import batch
+
+
+def test_batch_records_errors_per_row(tmp_path):
+    fastq = tmp_path / "sample.fastq"
+    fastq.write_text("@read1\nACGT\n+\nIIII\n@read2\nACG\n+\nIII\n")
+    manifest = tmp_path / "manifest.tsv"
+    manifest.write_text(
+        "File\tSubcommands\n"
+        + f"{fastq}\treadlen\n"
+        + f"{fastq}\tstrandedness\n"
+        + f"{tmp_path / 'missing.fastq'}\treadlen,bogus\n"
+    )
+    outdir = tmp_path / "out"
+
+    with pytest.raises(SystemExit):
+        batch.main(str(manifest), str(outdir), jobs=2)
+
+    with open(outdir / "readlen.tsv", encoding="utf-8") as handle:
+        rows = {row["File"]: row for row in csv.DictReader(handle, delimiter="\t")}
+    assert rows[str(fastq)]["Evidence"] == "4=1;3=1"
+    assert rows[str(tmp_path / "missing.fastq")]["ConsensusReadLength"] == "N/A"
+
+    with open(outdir / "errors.tsv", encoding="utf-8") as handle:
+        errors = list(csv.DictReader(handle, delimiter="\t"))
+    assert [(e["Row"], e["Subcommand"]) for e in errors] == [
+        ("2", "strandedness"),
+        ("3", "bogus"),
+    ]
@@ -0,0 +1,38 @@
+import os
+import time
+
+from ngsderive.cache import ResultCache
+
+
+def test_result_cache_round_trip(tmp_path):
+    ngsfile = tmp_path / "sample.fastq"
+    ngsfile.write_text("@read1\nACGT\n+\nIIII\n")
+    cache = ResultCache(tmp_path / "cache")
+
+    key = cache.key(str(ngsfile), "readlen", {"n_reads": 10})
+    assert cache.get(key) is None
+    cache.put(key, [{"File": str(ngsfile), "ConsensusReadLength": 4}])
+    assert cache.get(key) == [{"File": str(ngsfile), "ConsensusReadLength": 4}]
+
+    # different parameters and modified files do not share entries
+    assert cache.key(str(ngsfile), "readlen", {"n_reads": 20}) != key
+    assert cache.key(str(ngsfile), "readlen", {"n_reads": 10, "prefetch": 4}) == key
+    ngsfile.write_text("@read1\nACGTA\n+\nIIIII\n")
+    assert cache.key(str(ngsfile), "readlen", {"n_reads": 10}) != key
+
+    assert cache.key(str(tmp_path / "missing.fastq"), "readlen", {}) is None
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(tmp_path / "cache", max_size=1300)
+    rows = [{"Evidence": "x" * 400}]
+    for i in range(3):
+        cache.put(f"{i:064x}", rows)
+        path = cache._path(f"{i:064x}")
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    cache.get(f"{0:064x}")  # refreshes the oldest entry
+    cache.put(f"{3:064x}", rows)
+
+    assert cache.get(f"{0:064x}") == rows
+    assert cache.get(f"{1:064x}") is None
+    assert cache.get(f"{3:064x}") == rows
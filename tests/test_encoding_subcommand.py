@@ -0,0 +1,27 @@
+from ngsderive.commands import encoding
+
+
+def write_fastq(path, qualities, n_reads=1000):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n_reads):
+            f.write(f"@read{i}\n{'A' * len(qualities)}\n+\n{qualities}\n")
+
+
+def test_early_stop_once_the_encoding_is_pinned(tmp_path):
+    fastq = str(tmp_path / "sanger.fastq")
+    write_fastq(fastq, "!#5?II")
+    (result,) = encoding.determine_encoding(
+        fastq, None, early_stop=True, convergence_interval=20
+    )
+    assert result["ProbableEncoding"] == "Sanger/Illumina 1.8"
+    assert result["ReadsConsumed"] == 60
+
+
+def test_no_early_stop_while_a_lower_score_could_change_the_call(tmp_path):
+    fastq = str(tmp_path / "illumina13.fastq")
+    write_fastq(fastq, "@Jhh")
+    (result,) = encoding.determine_encoding(
+        fastq, None, early_stop=True, convergence_interval=20
+    )
+    assert result["ProbableEncoding"] == "Illumina 1.3"
+    assert result["ReadsConsumed"] == 1000
@@ -0,0 +1,156 @@
+import random
+
+import pytest
+
+from ngsderive.commands import endedness
+
+
+def simulated_reads(n_reads=20000, n_templates=8000, seed=1):
+    rng = random.Random(seed)
+    for _ in range(n_reads):
+        read_name = f"read{rng.randrange(n_templates)}"
+        if rng.random() < 0.01:
+            rg = rng.choice(["rg1", "rg2"])
+        else:
+            rg = ["rg1", "rg2", "rg3"][int(read_name[4:]) % 3]
+        yield read_name, rg
+
+
+def test_grouped_store_matches_trie():
+    trie = endedness.TrieTemplateStore()
+    grouped = endedness.GroupedTemplateStore()
+    for read_name, rg in sorted(simulated_reads()):
+        trie.add_read(read_name, rg)
+        grouped.add_read(read_name, rg)
+    assert grouped.reads_per_template() == trie.reads_per_template()
+
+
+def test_is_name_grouped():
+    import pysam
+
+    def header(hd):
+        return pysam.AlignmentHeader.from_dict({"HD": hd, "SQ": []})
+
+    assert endedness.is_name_grouped(header({"VN": "1.6", "SO": "queryname"}))
+    assert endedness.is_name_grouped(header({"VN": "1.6", "GO": "query"}))
+    assert not endedness.is_name_grouped(header({"VN": "1.6", "SO": "coordinate"}))
+    assert not endedness.is_name_grouped(header({"VN": "1.6", "GO": "reference"}))
+    assert not endedness.is_name_grouped(pysam.AlignmentHeader.from_dict({}))
+
+
+def test_rpt_only_streams_name_grouped_files(tmp_path, monkeypatch):
+    streamed = []
+
+    class RecordingGroupedStore(endedness.GroupedTemplateStore):
+        def __init__(self):
+            super().__init__()
+            streamed.append(self)
+
+    monkeypatch.setattr(endedness, "GroupedTemplateStore", RecordingGroupedStore)
+
+    def reads_per_template(hd):
+        bam = str(tmp_path / "rpt.bam")
+        write_bam(bam, [0x1 | 0x40, 0x1 | 0x80], n_templates=50, hd=hd)
+        (result,) = endedness.determine_endedness(
+            bam, None, 0.0, calc_rpt=True, round_rpt=False, split_by_rg=False
+        )
+        return result["ReadsPerTemplate"]
+
+    assert reads_per_template({"VN": "1.6", "SO": "queryname"}) == 2.0
+    assert len(streamed) == 1
+    # without SO:queryname or GO:query, templates may not be adjacent
+    assert reads_per_template({"VN": "1.6", "SO": "unsorted"}) == 2.0
+    assert len(streamed) == 1
+
+
+def test_hashed_store_matches_trie():
+    trie = endedness.TrieTemplateStore()
+    hashed = endedness.HashedTemplateStore()
+    verified = endedness.HashedTemplateStore(verify_collisions=True)
+    spilled = endedness.HashedTemplateStore(max_memory=50_000)
+    for read_name, rg in simulated_reads():
+        for store in (trie, hashed, verified, spilled):
+            store.add_read(read_name, rg)
+    assert spilled.partitions is not None
+
+    expected = trie.reads_per_template()
+    for store in (hashed, verified, spilled):
+        observed = store.reads_per_template()
+        assert observed.keys() == expected.keys()
+        for rg, rpt in expected.items():
+            assert abs(observed[rg] - rpt) < 1e-9
+
+
+def test_hash_collisions_are_counted_once():
+    table = endedness.QueryNameHashTable(["rg1"], verify_collisions=True)
+    for check in (1, 2, 2, 2):  # same hash, two different templates
+        table.add(5, check, 0)
+    assert table.n_collisions == 1
+    table.resize()
+    table.add(5, 2, 0)
+    assert table.n_collisions == 1
+    assert table.final_counter().tot_templates == 2
+
+
+def test_too_many_read_groups_for_hashed_store(monkeypatch):
+    monkeypatch.setattr(endedness, "MAX_READ_GROUPS", 2)
+    store = endedness.HashedTemplateStore()
+    store.add_read("read1", "rg1")
+    store.add_read("read2", "rg2")
+    with pytest.raises(RuntimeError, match="rpt-store trie"):
+        store.add_read("read3", "rg3")
+
+
+def write_bam(path, flags, n_templates=500, hd=None):
+    import pysam
+
+    header = {"HD": hd or {"VN": "1.6"}, "SQ": [{"SN": "chr1", "LN": 1000}]}
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for i in range(n_templates):
+            for flag in flags:
+                read = pysam.AlignedSegment(bam.header)
+                read.query_name = f"read{i}"
+                read.flag = flag | 0x4  # unmapped
+                read.query_sequence = "ACGT"
+                bam.write(read)
+
+
+def early_stop_endedness(path):
+    (result,) = endedness.determine_endedness(
+        path,
+        None,
+        paired_deviance=0.1,
+        calc_rpt=False,
+        round_rpt=False,
+        split_by_rg=False,
+        early_stop=True,
+        convergence_interval=20,
+    )
+    return result
+
+
+def test_endedness_early_stop_on_paired_reads(tmp_path):
+    bam = str(tmp_path / "paired.bam")
+    write_bam(bam, [0x1 | 0x40, 0x1 | 0x80])
+    result = early_stop_endedness(bam)
+    assert result["Endedness"] == "Paired-End"
+    assert result["ReadsConsumed"] == 60
+
+
+def test_endedness_no_early_stop_on_an_unknown_call(tmp_path):
+    bam = str(tmp_path / "read1s.bam")
+    write_bam(bam, [0x1 | 0x40])
+    result = early_stop_endedness(bam)
+    assert result["Endedness"] == "Unknown"
+    assert result["ReadsConsumed"] == 500
+
+
+def test_endedness_early_stop_needs_a_paired_deviance():
+    from ngsderive.__main__ import get_args
+
+    with pytest.raises(SystemExit):
+        get_args(["endedness", "sample.bam", "--early-stop"])
+    args = get_args(
+        ["endedness", "sample.bam", "--early-stop", "--paired-deviance", "0.1"]
+    )
+    assert args.early_stop
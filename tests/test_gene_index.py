@@ -0,0 +1,37 @@
+from ngsderive.gene_index import GeneModelIndex, build_index, is_gene_model_index
+
+GTF = """\
+#!genome-build test
+chr1\tt\tgene\t100\t200\t.\t+\t.\tgene_id "a"; gene_type "protein_coding";
+chr1\tt\ttranscript\t100\t200\t.\t+\t.\tgene_id "a"; transcript_id "a.1";
+chr1\tt\texon\t100\t120\t.\t+\t.\tgene_id "a"; transcript_id "a.1";
+chr1\tt\texon\t180\t200\t.\t+\t.\tgene_id "a"; transcript_id "a.1";
+chr1\tt\tgene\t150\t300\t.\t-\t.\tgene_id "b"; gene_type "lncRNA";
+chr1\tt\ttranscript\t150\t300\t.\t-\t.\tgene_id "b"; transcript_id "b.1";
+chr2\tt\tgene\t100\t200\t.\t+\t.\tgene_id "c"; gene_type "protein_coding";
+chr2\tt\ttranscript\t100\t200\t.\t+\t.\tgene_id "c"; transcript_id "c.1";
+"""
+
+
+def test_gene_model_index_round_trip(tmp_path):
+    gtf = tmp_path / "genes.gtf"
+    gtf.write_text(GTF)
+    index_file = str(tmp_path / "genes.gtf.ngsderive.idx")
+    build_index(str(gtf), index_file)
+    assert is_gene_model_index(index_file)
+    assert not is_gene_model_index(str(gtf))
+
+    index = GeneModelIndex(index_file)
+    genes = {gene["gene_id"]: gene for gene in index.genes()}
+    assert genes["a"]["start"] == 100 and genes["a"]["strand"] == "+"
+    assert genes["a"]["antisense_overlap"] and genes["b"]["antisense_overlap"]
+    assert not genes["c"]["antisense_overlap"]
+    coding = index.genes(only_protein_coding_genes=True)
+    assert [gene["gene_id"] for gene in coding] == ["a", "c"]
+    assert isinstance(coding.starts, memoryview)  # read in place, not copied
+    assert coding[1]["antisense_overlap"] is False
+
+    cache = index.junction_cache()
+    exon_starts, exon_ends = cache.contig("chr1")
+    assert list(exon_starts) == [99, 179] and list(exon_ends) == [120, 200]
+    assert cache.contig("chr2") is None
@@ -18,3 +18,84 @@ def test_fcid_regexes_match():
             possible = instrument.derive_instrument_from_fcid(row["Id"])
             expected = set(row["All Matching Flowcells"].split(","))
             assert possible == expected
+
+
+def test_derived_instruments_are_not_shared_between_calls():
+    possible = instrument.derive_instrument_from_iid("HWI-D00001")
+    possible &= {"HiSeq 2500"}
+    assert instrument.derive_instrument_from_iid("HWI-D00001") == {
+        "HiSeq 2000",
+        "HiSeq 2500",
+    }
+
+
+def write_bam(path, read_groups, n_reads=3):
+    import pysam
+
+    header = {
+        "HD": {"VN": "1.6"},
+        "SQ": [{"SN": "chr1", "LN": 1000}],
+        "RG": read_groups,
+    }
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for i in range(n_reads):
+            read = pysam.AlignedSegment(bam.header)
+            read.query_name = f"A00001:1:HABCDADXX:1:1101:1000:{i}"
+            read.reference_id = 0
+            read.reference_start = 10 * i
+            read.cigarstring = "10M"
+            read.query_sequence = "A" * 10
+            read.set_tag("RG", read_groups[0]["ID"])
+            bam.write(read)
+
+
+def test_index_read_groups():
+    import pysam
+
+    header = pysam.AlignmentHeader.from_dict(
+        {
+            "SQ": [{"SN": "chr1", "LN": 1000}],
+            "RG": [
+                {"ID": "rg1", "PU": "HABCDADXX.1.ACGT", "PM": "HiSeq 2500"},
+                {"ID": "rg2", "PU": "HABCDADXX"},
+                {"ID": "rg3", "SM": "sample"},
+            ],
+        }
+    )
+    assert instrument.index_read_groups(header) == {
+        "rg1": ("HABCDADXX", "HiSeq 2500"),
+        "rg2": ("HABCDADXX", None),
+        "rg3": (None, None),
+    }
+
+
+def test_platform_models_vote_for_instruments():
+    assert (
+        instrument.derive_instrument_from_platform_model("HiSeq 2500") == "HiSeq 2500"
+    )
+    assert instrument.derive_instrument_from_platform_model("HISEQ_X_TEN") == "HiSeq X"
+    assert instrument.derive_instrument_from_platform_model("Ion Torrent") is None
+
+    # conflicts with the flowcell, so the header is inconclusive
+    assert (
+        instrument.call_instrument_from_header({"rg1": ("HABCDADXX", "HiSeq 4000")})
+        is None
+    )
+    instruments, _, based_on = instrument.call_instrument_from_header(
+        {"rg1": (None, "NovaSeq 6000")}
+    )
+    assert instruments == {"NovaSeq"} and based_on == "platform model"
+
+
+def test_conclusive_header_skips_records(tmp_path, monkeypatch):
+    path = str(tmp_path / "sample.bam")
+    write_bam(path, [{"ID": "rg1", "PU": "HABCDADXX.1", "PM": "HiSeq 2500"}])
+
+    def no_reads(self):
+        raise AssertionError("a record was read")
+
+    monkeypatch.setattr(instrument.NGSFile, "__next__", no_reads)
+    (result,) = instrument.determine_instrument(path, n_reads=10, header_first=True)
+    assert result["Confidence"] == "high confidence"
+    assert "HiSeq 2500" in result["Instrument"]
+    assert result["Basis"] == "flowcell id and platform model (read group header)"
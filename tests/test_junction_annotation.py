@@ -0,0 +1,132 @@
+import os
+from collections import Counter
+
+import pytest
+
+from ngsderive.commands.junction_annotation import (
+    annotate_junction_counts,
+    find_contig_junctions,
+)
+from ngsderive.gene_index import IndexedJunctionCache
+from ngsderive.utils import sorted_positions
+
+
+def make_cache():
+    return IndexedJunctionCache(
+        {"chr1": sorted_positions([179, 99, 99])},
+        {"chr1": sorted_positions([120, 200])},
+    )
+
+
+def test_fuzzy_matching_collapses_onto_annotated_sites():
+    contig_junctions = [
+        ("chr1", Counter({(120, 179): 4, (122, 177): 2, (150, 170): 1, (120, 160): 3}))
+    ]
+    exact = annotate_junction_counts(
+        "sample.bam", contig_junctions, make_cache(), 10, 1, 0, False
+    )
+    assert exact["KnownJunctions"] == 1 and exact["CompleteNovelJunctions"] == 2
+    assert exact["PartialNovelJunctions"] == 1
+
+    fuzzy = annotate_junction_counts(
+        "sample.bam", contig_junctions, make_cache(), 10, 5, 3, False
+    )
+    # (122, 177) joins (120, 179); the others lack read support
+    assert fuzzy["KnownJunctions"] == 1 and fuzzy["KnownSplicedReads"] == 6
+    assert fuzzy["TotalJunctions"] == 1
+
+
+def test_compressed_junction_files_are_sorted_and_indexed(tmp_path):
+    import pysam
+
+    path = str(tmp_path / "sample.bam.junctions.tsv.gz")
+    contig_junctions = [
+        ("chr1", Counter({(150, 170): 2, (120, 179): 4})),
+        ("chr2", Counter({(1000, 2000): 3})),
+        ("chrE", Counter()),
+    ]
+    annotate_junction_counts(
+        "sample.bam", contig_junctions, make_cache(), 10, 1, 0, False, path
+    )
+
+    junctions = pysam.TabixFile(path)
+    assert sorted(junctions.contigs) == ["chr1", "chr2"]
+    assert list(junctions.fetch("chr1", 100, 130)) == ["chr1\t120\t179\t4\tAnnotated"]
+    assert [row.split("\t")[1] for row in junctions.fetch("chr1")] == ["120", "150"]
+    assert list(junctions.fetch("chr2")) == [
+        "chr2\t1000\t2000\t3\tUnannotatedReference"
+    ]
+
+
+def write_bam(path, reads):
+    import pysam
+
+    header = {
+        "HD": {"VN": "1.6"},
+        "SQ": [{"SN": "chr1", "LN": 5000}, {"SN": "chr2", "LN": 5000}],
+    }
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for i, (contig, start) in enumerate(reads):
+            read = pysam.AlignedSegment(bam.header)
+            read.query_name = f"read{i}"
+            read.reference_id = bam.get_tid(contig)
+            read.reference_start = start
+            read.mapping_quality = 60
+            read.cigarstring = "20M100N20M"
+            read.query_sequence = "A" * 40
+            bam.write(read)
+
+
+def test_unindexed_bams_are_read_in_one_pass(tmp_path):
+    import pysam
+
+    path = str(tmp_path / "sorted.bam")
+    write_bam(path, [("chr1", 100), ("chr1", 100), ("chr1", 300), ("chr2", 50)])
+    with pysam.AlignmentFile(path) as bam:
+        assert not bam.has_index()
+        found = [(c, dict(j)) for c, j in find_contig_junctions(bam, 30)]
+    assert found == [
+        ("chr1", {(120, 220): 2, (320, 420): 1}),
+        ("chr2", {(70, 170): 1}),
+    ]
+
+    pysam.index(path)
+    with pysam.AlignmentFile(path) as bam:
+        assert [(c, dict(j)) for c, j in find_contig_junctions(bam, 30)] == found
+
+    path = str(tmp_path / "unsorted.bam")
+    write_bam(path, [("chr1", 100), ("chr2", 50), ("chr1", 300)])
+    with pysam.AlignmentFile(path) as bam:
+        with pytest.raises(RuntimeError, match="sorted by coordinate"):
+            list(find_contig_junctions(bam, 30))
+
+
+def test_stdin_outputs_are_named_stdin(tmp_path, monkeypatch):
+    import io
+    import sys
+
+    from ngsderive.commands import junction_annotation
+
+    bam = str(tmp_path / "sample.bam")
+    write_bam(bam, [("chr1", 100), ("chr1", 100)])
+    with open(bam, "rb") as handle:
+        monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(handle))
+        outfile = io.StringIO()
+        junction_annotation.main(
+            ["-"],
+            None,
+            outfile,
+            min_intron=10,
+            min_mapq=30,
+            min_reads=1,
+            fuzzy_range=0,
+            consider_unannotated_references_novel=False,
+            junction_dir=str(tmp_path / "junctions"),
+            disable_junction_files=False,
+            cache=make_cache(),
+            raw_junctions_dir=str(tmp_path / "raw"),
+        )
+
+    assert outfile.getvalue().splitlines()[1].split("\t")[:2] == ["-", "1"]
+    assert os.listdir(tmp_path / "junctions") == ["stdin.junctions.tsv"]
+    assert os.listdir(tmp_path / "raw") == ["stdin.rawjunctions"]
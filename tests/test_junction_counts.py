@@ -0,0 +1,23 @@
+from collections import Counter
+
+from ngsderive.junction_counts import (
+    is_raw_junction_file,
+    read_raw_junctions,
+    write_raw_junctions,
+)
+
+
+def test_raw_junctions_round_trip(tmp_path):
+    path = str(tmp_path / "sample.bam.rawjunctions")
+    contig_junctions = [
+        ("chr1", Counter({(5000, 6000): 12, (120, 900): 3})),
+        ("chr2", Counter()),
+        ("chrM", Counter({(2**33, 2**33 + 50): 1})),
+    ]
+    write_raw_junctions(path, "sample.bam", 30, contig_junctions)
+
+    assert is_raw_junction_file(path)
+    metadata, read_back = read_raw_junctions(path)
+    assert metadata["file"] == "sample.bam"
+    assert metadata["min_mapq"] == 30
+    assert read_back == [(contig, dict(found)) for contig, found in contig_junctions]
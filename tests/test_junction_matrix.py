@@ -0,0 +1,68 @@
+import os
+from collections import Counter
+
+from ngsderive.commands.junction_annotation import annotate_junction_counts
+from ngsderive.gene_index import IndexedJunctionCache
+from ngsderive.junction_matrix import (
+    JUNCTIONS_FILE,
+    MATRIX_FILE,
+    SAMPLES_FILE,
+    JunctionCollector,
+    JunctionMatrix,
+)
+from ngsderive.utils import sorted_positions
+
+
+def read_matrix(matrix_dir):
+    """Returns `{(contig, start, end): {file: read count}}`."""
+    with open(os.path.join(matrix_dir, JUNCTIONS_FILE), "r", encoding="utf-8") as fh:
+        next(fh)
+        junctions = {}
+        for line in fh:
+            row, contig, start, end, _ = line.rstrip("\n").split("\t")
+            junctions[row] = (contig, int(start), int(end))
+    with open(os.path.join(matrix_dir, SAMPLES_FILE), "r", encoding="utf-8") as fh:
+        next(fh)
+        samples = dict(line.rstrip("\n").split("\t") for line in fh)
+
+    matrix = {junction: {} for junction in junctions.values()}
+    with open(os.path.join(matrix_dir, MATRIX_FILE), "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.startswith("%"):
+                break  # dimensions
+        for line in fh:
+            row, column, num_reads = line.split()
+            matrix[junctions[row]][samples[column]] = int(num_reads)
+    return matrix
+
+
+def test_junction_matrix(tmp_path):
+    cache = IndexedJunctionCache(
+        {"chr1": sorted_positions([99, 179])}, {"chr1": sorted_positions([120, 200])}
+    )
+    samples = {
+        "a.bam": [("chr1", Counter({(120, 179): 4, (150, 170): 2}))],
+        "b.bam": [("chr2", Counter({(10, 500): 3})), ("chr1", Counter())],
+        "c.bam": [("chr1", Counter({(120, 179): 7}))],
+    }
+    matrix = JunctionMatrix(str(tmp_path))
+    for ngsfilepath, contig_junctions in samples.items():
+        collector = JunctionCollector()
+        annotate_junction_counts(
+            ngsfilepath, contig_junctions, cache, 10, 1, 0, False, None, collector
+        )
+        matrix.add_sample(ngsfilepath, collector.junctions)
+    matrix.close()
+
+    assert read_matrix(str(tmp_path)) == {
+        ("chr1", 120, 179): {"a.bam": 4, "c.bam": 7},
+        ("chr1", 150, 170): {"a.bam": 2},
+        ("chr2", 10, 500): {"b.bam": 3},
+    }
+    with open(tmp_path / "matrix.mtx", encoding="utf-8") as handle:
+        assert handle.readlines()[2] == "3 3 4\n"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "junctions.tsv",
+        "matrix.mtx",
+        "samples.tsv",
+    ]
@@ -0,0 +1,64 @@
+import pytest
+
+from ngsderive.__main__ import get_args
+from ngsderive.commands.readlen import partial_readlen
+from ngsderive.partials import Region, check_coverage, group_partials
+
+
+def test_region_parse():
+    region = Region.parse("chr1:1,001-2000")
+    assert (region.contig, region.start, region.end) == ("chr1", 1000, 2000)
+    assert str(region) == "chr1:1001-2000"
+    assert Region.parse("chrUn_KI270302v1").start is None
+    with pytest.raises(ValueError):
+        Region.parse("chr1:2000-1000")
+
+
+def test_check_coverage_rejects_overlapping_regions():
+    lengths = {"chr1": 1000}
+    check_coverage(
+        "x.bam", map(Region.parse, ["chr1:1-500", "chr1:501-1000", "*"]), lengths
+    )
+    with pytest.raises(ValueError):
+        check_coverage("x.bam", map(Region.parse, ["chr1", "chr1:1-10"]), lengths)
+
+
+def test_group_partials_orders_states_by_region():
+    def partial(regions, state, params=None):
+        return {
+            "subcommand": "readlen",
+            "file": "x.bam",
+            "params": params or {"majority_vote_cutoff": 70},
+            "regions": regions,
+            "contig_lengths": {"chr1": 1000, "chr2": 1000},
+            "state": state,
+        }
+
+    subcommand, grouped = group_partials(
+        [
+            partial(["chr2", "*"], 3),
+            partial(["chr1:501-1000"], 2),
+            partial(["chr1:1-500"], 1),
+        ]
+    )
+    assert subcommand == "readlen"
+    assert grouped == [
+        ("x.bam", {"majority_vote_cutoff": 70}, ["chr1", "chr2"], [1, 2, 3])
+    ]
+
+    with pytest.raises(ValueError):
+        group_partials(
+            [partial(["chr1"], 1), partial(["chr2"], 2, {"majority_vote_cutoff": 50})]
+        )
+
+
+def test_partials_reject_fastq(tmp_path):
+    fastq = tmp_path / "reads.fastq"
+    fastq.write_text("@r1\nACGT\n+\nIIII\n")
+
+    for flags in (["--partial-out", str(tmp_path / "x.json")], ["--regions", "chr1"]):
+        with pytest.raises(SystemExit):
+            get_args(["readlen", str(fastq), "-n", "-1"] + flags)
+    # standard input can't be checked up front, so the command rejects it itself
+    with pytest.raises(RuntimeError):
+        partial_readlen(str(fastq), None, {})
@@ -0,0 +1,101 @@
+import gc
+import gzip
+import threading
+from collections import Counter
+
+import pysam
+
+from ngsderive.commands import readlen
+from ngsderive.utils import NGSFile
+
+
+def write_fastq(path, lengths):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, length in enumerate(lengths):
+            f.write(f"@read{i}\n{'A' * length}\n+\n{'I' * length}\n")
+
+
+def write_clipped_bam(path):
+    header = {"HD": {"VN": "1.6"}, "SQ": [{"SN": "chr1", "LN": 10000}]}
+    cigars = ["100M", "10S90M", "5S80M15S", "3H50M2I48M", "20M1000N80M", None]
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for i, cigar in enumerate(cigars * 10):
+            read = pysam.AlignedSegment(bam.header)
+            read.query_name = f"read{i}"
+            read.query_sequence = "A" * 100
+            read.query_qualities = pysam.qualitystring_to_array("I" * 100)
+            read.set_tag("RG", "rg1")
+            if cigar is None:
+                read.flag = 4
+            else:
+                read.reference_id = 0
+                read.reference_start = 10 * i
+                read.cigarstring = cigar
+            bam.write(read)
+
+
+def assert_matches_decoded_lengths(path):
+    # the lengths readlen counted before it stopped decoding sequences
+    lengths = Counter(len(read["query"]) for read in NGSFile(path))
+    assert Counter(NGSFile(path).read_lengths()) == lengths
+
+    (result,) = readlen.determine_readlen(path, None, 70.0)
+    expected = readlen.readlen_result(path, lengths, sum(lengths.values()), 70.0)
+    assert result == expected
+
+
+def test_read_lengths_exclude_soft_clips(tmp_path):
+    bam = str(tmp_path / "clipped.bam")
+    write_clipped_bam(bam)
+    assert set(NGSFile(bam).read_lengths()) == {100, 90, 80}
+    assert_matches_decoded_lengths(bam)
+
+
+def test_read_lengths_ignore_crlf_line_endings(tmp_path):
+    records = "".join(
+        f"@read{i}\r\n{'A' * length}\r\n+\r\n{'I' * length}\r\n"
+        for i, length in enumerate([100] * 8 + [75, 50])
+    )
+    fastq = tmp_path / "crlf.fastq"
+    fastq.write_bytes(records.encode())
+    with gzip.open(tmp_path / "crlf.fastq.gz", "wb") as f:
+        f.write(records.encode())
+
+    for path in (fastq, tmp_path / "crlf.fastq.gz"):
+        assert sorted(NGSFile(str(path)).read_lengths()) == [50, 75] + [100] * 8
+        assert_matches_decoded_lengths(str(path))
+
+
+def test_early_stop_on_a_clear_majority(tmp_path):
+    fastq = str(tmp_path / "clear.fastq")
+    write_fastq(fastq, [100] * 1000)
+    (result,) = readlen.determine_readlen(
+        fastq, None, 85.0, early_stop=True, convergence_interval=20
+    )
+    assert result["ConsensusReadLength"] == 100
+    assert result["ReadsConsumed"] == 60
+
+
+def test_no_early_stop_near_the_cutoff(tmp_path):
+    fastq = str(tmp_path / "ambiguous.fastq")
+    # exactly 85% of reads have the max length at every checkpoint
+    write_fastq(fastq, [90 if i % 20 < 3 else 100 for i in range(1000)])
+    (result,) = readlen.determine_readlen(
+        fastq, None, 85.0, early_stop=True, convergence_interval=20
+    )
+    assert result["ReadsConsumed"] == 1000
+
+
+def test_early_stop_with_prefetch_leaves_no_thread_running(tmp_path):
+    fastq = str(tmp_path / "clear.fastq")
+    write_fastq(fastq, [100] * 50000)
+    running = set(threading.enumerate())
+    (result,) = readlen.determine_readlen(
+        fastq, None, 85.0, early_stop=True, convergence_interval=20, prefetch=1
+    )
+    assert result["ReadsConsumed"] == 60
+
+    gc.collect()
+    for thread in set(threading.enumerate()) - running:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
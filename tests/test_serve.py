@@ -0,0 +1,31 @@
+import io
+import threading
+
+from ngsderive.commands import serve
+
+
+def test_forwarded_jobs_return_server_output(tmp_path):
+    socket_path = str(tmp_path / "ngsderive.sock")
+
+    def run_job(argv):
+        if argv[0] == "fail":
+            raise SystemExit(1)
+        return "File\tArgs\n" + "\t".join(argv) + "\n"
+
+    server = serve.JobServer(socket_path, run_job)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        outfile = io.StringIO()
+        serve.forward(socket_path, ["readlen", "sample.bam"], outfile)
+        assert outfile.getvalue() == "File\tArgs\nreadlen\tsample.bam\n"
+
+        try:
+            serve.forward(socket_path, ["fail"], io.StringIO())
+            assert False, "failed job should exit"
+        except SystemExit as err:
+            assert err.code == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
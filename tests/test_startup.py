@@ -0,0 +1,61 @@
+import json
+import subprocess
+import sys
+
+# checked instead of timing startup, which is flaky on busy machines
+HEAVY_MODULES = [
+    "gtfparse",
+    "numpy",
+    "pandas",
+    "polars",
+    "pysam",
+    "tabix",
+    "pygtrie",
+]
+
+PROBE = """
+import json, sys
+from ngsderive.__main__ import run
+sys.argv = ["ngsderive"] + sys.argv[1:]
+try:
+    run()
+except SystemExit:
+    pass
+print(json.dumps(sorted(m for m in {modules} if m in sys.modules)), file=sys.stderr)
+"""
+
+
+def probe(*argv, code=PROBE):
+    result = subprocess.run(
+        [sys.executable, "-c", code.format(modules=HEAVY_MODULES), *argv],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def test_help_does_not_import_heavy_modules():
+    for argv in (["--help"], ["readlen", "--help"], ["strandedness", "--help"]):
+        imported = probe(*argv)
+        assert imported == [], f"{' '.join(argv)} imported {imported}"
+
+
+def test_fastq_subcommands_do_not_import_heavy_modules(tmp_path):
+    fastq = tmp_path / "sample.fastq"
+    fastq.write_text("@A00000:1:HXXXXDSXX:1:1101:1000:1000 1:N:0:1\nACGT\n+\nIIII\n")
+    for subcommand in ("readlen", "encoding", "instrument"):
+        imported = probe(subcommand, str(fastq))
+        assert imported == [], f"{subcommand} imported {imported}"
+
+
+def test_parsing_arguments_does_not_import_heavy_modules():
+    code = """
+import json, sys
+from ngsderive.__main__ import get_args
+for argv in (["readlen", "x.bam"], ["junction-annotation", "x.bam", "-g", "x.gtf"]):
+    get_args(argv)
+print(json.dumps(sorted(m for m in {modules} if m in sys.modules)), file=sys.stderr)
+"""
+    imported = probe(code=code)
+    assert imported == [], f"parsing arguments imported {imported}"
@@ -0,0 +1,200 @@
+import gc
+import gzip
+import io
+import itertools
+
+import pytest
+
+from ngsderive.utils import (
+    ConvergenceMonitor,
+    GFF,
+    GeneTable,
+    NGSFile,
+    NGSFileType,
+    Prefetcher,
+    StreamRelay,
+    TabixJunctionCache,
+    Tee,
+    sniff_ngs_filetype,
+    template_hash,
+)
+
+
+def write_fastq(path, mate, n_reads=2000):
+    with open(path, "w") as f:
+        for i in range(n_reads):
+            f.write(f"@A00123:8:HABCDEFXX:1:1101:{i}:1000/{mate}\nACGT\n+\nIIII\n")
+
+
+def test_template_hash_ignores_mate_suffix_and_comment():
+    assert template_hash("read1/1") == template_hash("read1/2")
+    assert template_hash("read1 1:N:0:1") == template_hash(b"read1 2:N:0:1")
+    assert template_hash("read1", seed=1) != template_hash("read1", seed=2)
+
+
+def test_subsampling_selects_the_same_templates_in_both_mates(tmp_path):
+    write_fastq(tmp_path / "r1.fastq", 1)
+    write_fastq(tmp_path / "r2.fastq", 2)
+
+    r1 = [
+        r["query_name"][:-2]
+        for r in NGSFile(str(tmp_path / "r1.fastq"), subsample_fraction=0.2)
+    ]
+    r2 = [
+        r["query_name"][:-2]
+        for r in NGSFile(str(tmp_path / "r2.fastq"), subsample_fraction=0.2)
+    ]
+    assert r1 == r2
+    assert 300 < len(r1) < 500
+
+
+def test_sniff_ngs_filetype():
+    fastq = b"@read1\nACGT\n+\nIIII\n"
+    assert sniff_ngs_filetype(fastq) == (NGSFileType.FASTQ, False)
+    assert sniff_ngs_filetype(gzip.compress(fastq)) == (NGSFileType.FASTQ, True)
+    assert sniff_ngs_filetype(b"@HD\tVN:1.6\n") == (NGSFileType.SAM, False)
+    sam_record = b"\t".join([b"read1", b"4", b"*", b"0", b"0"] + [b"*"] * 6)
+    assert sniff_ngs_filetype(sam_record) == (NGSFileType.SAM, False)
+    assert sniff_ngs_filetype(gzip.compress(b"BAM\x01")) == (NGSFileType.BAM, True)
+    assert sniff_ngs_filetype(b"garbage") == (None, False)
+
+
+def test_stream_relay_replays_the_whole_stream():
+    data = bytes(range(256)) * 1000
+    relay = StreamRelay(io.BufferedReader(io.BytesIO(data)))
+    assert data.startswith(relay.head)
+    assert relay.reader.read() == data
+
+
+def test_tee_passes_the_whole_input_through(tmp_path):
+    write_fastq(tmp_path / "r1.fastq", 1, n_reads=50000)
+    tee = Tee(open(tmp_path / "passed.fastq", "wb"))
+
+    ngsfile = NGSFile(str(tmp_path / "r1.fastq"), tee=tee)
+    assert next(ngsfile)["query_name"].startswith("A00123")
+    del ngsfile  # stop reading early
+    tee.close()
+
+    assert (tmp_path / "passed.fastq").read_bytes() == (
+        tmp_path / "r1.fastq"
+    ).read_bytes()
+
+
+def test_gene_table_round_trips_genes():
+    table = GeneTable()
+    genes = [
+        {
+            "seqname": "chr1",
+            "feature": "gene",
+            "start": 11869,
+            "end": 14409,
+            "strand": "+",
+            "gene_id": "ENSG00000223972.5",
+            "gene_type": "transcribed_unprocessed_pseudogene",
+        },
+        {
+            "seqname": "chr2",
+            "feature": "gene",
+            "start": 38814,
+            "end": 46870,
+            "strand": "-",
+            "gene_id": "ENSG00000184731.6",
+            "gene_type": "protein_coding",
+        },
+    ]
+    for gene in genes:
+        table.append(gene)
+
+    assert len(table) == 2
+    assert [table[0], table[-1]] == genes
+    coding = table.filter_biotypes(lambda biotype: "protein" in biotype)
+    assert list(coding) == genes[1:]
+
+
+def test_gff_filters_genes_while_streaming(tmp_path):
+    gtf = tmp_path / "genes.gtf"
+    gtf.write_text(
+        'chr1\tt\tgene\t1\t10\t.\t+\t.\tgene_id "a"; gene_name "A"; gene_type "protein_coding";\n'
+        + 'chr1\tt\tgene\t1\t10\t.\t+\t.\tgene_id "b"; gene_name "AB"; gene_type "protein_coding";\n'
+        + 'chr1\tt\tgene\t1\t10\t.\t+\t.\tgene_id "c"; gene_name "C"; gene_type "lncRNA";\n'
+    )
+    exclude = tmp_path / "exclude.txt"
+    exclude.write_text("A\n")
+
+    gff = GFF(
+        str(gtf),
+        store_results=True,
+        gene_exclude_list=str(exclude),
+        only_protein_coding_genes=True,
+    )
+    # names are matched exactly, not as substrings of the attributes
+    assert [gene["gene_id"] for gene in gff.entries] == ["b"]
+
+
+def test_tabix_junction_cache_loads_contigs_on_demand(tmp_path):
+    pysam = pytest.importorskip("pysam")
+    gtf = tmp_path / "genes.gtf"
+    gtf.write_text(
+        'chr1\tt\tgene\t100\t200\t.\t+\t.\tgene_id "a";\n'
+        + 'chr1\tt\texon\t100\t120\t.\t+\t.\tgene_id "a";\n'
+        + 'chr1\tt\texon\t180\t200\t.\t+\t.\tgene_id "a";\n'
+        + 'chr2\tt\tgene\t100\t200\t.\t+\t.\tgene_id "b";\n'
+    )
+    gene_model = pysam.tabix_index(str(gtf), preset="gff")
+    cache = TabixJunctionCache(gene_model)
+
+    assert not cache.contigs
+    exon_starts, exon_ends = cache.contig("chr1")
+    assert list(exon_starts) == [99, 179] and list(exon_ends) == [120, 200]
+    assert cache.contig("chr2") is None  # no exons
+    assert cache.contig("chrUn") is None
+    assert list(cache.contigs) == ["chr1", "chr2", "chrUn"]
+
+
+def test_convergence_monitor():
+    monitor = ConvergenceMonitor(interval=10, checks=3)
+    assert monitor.due(20) and not monitor.due(25)
+    # unsettled calls and changed calls both restart the count
+    assert not monitor.update("a", True)
+    assert not monitor.update("a", False)
+    assert not monitor.update("a", True)
+    assert not monitor.update("b", True)
+    assert not monitor.update("b", True)
+    assert monitor.update("b", True)
+
+
+def test_prefetch_yields_the_same_records(tmp_path):
+    fastq = str(tmp_path / "r1.fastq")
+    write_fastq(fastq, 1, n_reads=5000)
+
+    assert list(NGSFile(fastq, prefetch=2)) == list(NGSFile(fastq))
+    assert list(NGSFile(fastq, prefetch=2).read_lengths()) == [4] * 5000
+
+
+def test_prefetcher_reraises_producer_errors():
+    def records():
+        yield from range(10)
+        raise ValueError("truncated file")
+
+    prefetcher = Prefetcher(records(), depth=1, chunk_size=4)
+    assert list(itertools.islice(prefetcher, 8)) == list(range(8))
+    with pytest.raises(ValueError, match="truncated file"):
+        list(prefetcher)
+
+
+def test_prefetch_thread_stops_when_reading_stops_early(tmp_path):
+    prefetcher = Prefetcher(itertools.count(), depth=1, chunk_size=4)
+    assert next(prefetcher) == 0
+    prefetcher.close()
+    prefetcher._thread.join(timeout=5)
+    assert not prefetcher._thread.is_alive()
+
+    fastq = str(tmp_path / "r1.fastq")
+    write_fastq(fastq, 1, n_reads=20000)
+    ngsfile = NGSFile(fastq, prefetch=1)
+    next(ngsfile)
+    thread = ngsfile._prefetcher._thread
+    del ngsfile
+    gc.collect()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
@@ -0,0 +1,79 @@
+import json
+import os
+
+from ngsderive.commands import worker
+
+
+def test_worker_runs_queued_tasks(tmp_path):
+    queue_dir = str(tmp_path / "queue")
+    ok = worker.enqueue(queue_dir, ["readlen", "sample.bam"], cwd=str(tmp_path))
+    failing = worker.enqueue(queue_dir, ["fail"], cwd=str(tmp_path))
+
+    def run_job(argv):
+        if argv[0] == "fail":
+            raise SystemExit(1)
+        assert os.getcwd() == str(tmp_path)
+        return "File\n" + argv[1] + "\n"
+
+    worker.main(queue_dir, run_job, poll_interval=0, exit_when_idle=True)
+
+    results = tmp_path / "queue" / "results"
+    assert (results / ok.replace(".json", ".tsv")).read_text() == "File\nsample.bam\n"
+    failure = json.loads(
+        (tmp_path / "queue" / "failed" / failing).read_text(encoding="utf-8")
+    )
+    assert failure["task"] == failing
+    assert not os.listdir(tmp_path / "queue" / "claimed")
+
+
+def test_tasks_are_claimed_once_and_stale_claims_returned(tmp_path):
+    queue_dir = str(tmp_path / "queue")
+    name = worker.enqueue(queue_dir, ["readlen", "sample.bam"])
+    first = worker.TaskQueue(queue_dir, "host-1", stale_timeout=60)
+    second = worker.TaskQueue(queue_dir, "host-2", stale_timeout=60)
+
+    claimed_name, claim_path = first.claim()
+    assert claimed_name == name
+    assert second.claim() is None
+
+    second.reclaim_stale()  # still fresh
+    assert second.claim() is None
+
+    os.utime(claim_path, (0, 0))
+    second.reclaim_stale()
+    assert second.claim()[0] == name
+
+
+def test_claiming_a_long_queued_task_does_not_race_reclaim(tmp_path, monkeypatch):
+    queue_dir = str(tmp_path / "queue")
+    name = worker.enqueue(queue_dir, ["readlen", "sample.bam"])
+    os.utime(os.path.join(queue_dir, "pending", name), (0, 0))
+    first = worker.TaskQueue(queue_dir, "host-1", stale_timeout=60)
+    second = worker.TaskQueue(queue_dir, "host-2", stale_timeout=60)
+
+    rename = os.rename
+
+    def rename_then_reclaim(src, dst):
+        rename(src, dst)
+        second.reclaim_stale()  # another worker looks in between
+
+    monkeypatch.setattr(worker.os, "rename", rename_then_reclaim)
+    claimed_name, claim_path = first.claim()
+    assert claimed_name == name and os.path.exists(claim_path)
+    monkeypatch.setattr(worker.os, "rename", rename)
+    assert second.claim() is None
+
+
+def test_lost_claims_are_skipped(tmp_path, monkeypatch):
+    queue_dir = str(tmp_path / "queue")
+    worker.enqueue(queue_dir, ["readlen", "sample.bam"])
+    queue = worker.TaskQueue(queue_dir, "host-1", stale_timeout=60)
+
+    rename = os.rename
+
+    def rename_then_lose(src, dst):
+        rename(src, dst)
+        os.unlink(dst)  # e.g. reclaimed by a worker with a skewed clock
+
+    monkeypatch.setattr(worker.os, "rename", rename_then_lose)
+    assert queue.claim() is None